@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Materialized aggregation cube over the further cleaned products
+
+The reports group the same 2M rows by main category, product tier, price
+range and BestSeller flag over and over. The cube aggregates them once per
+combination of
+
+    main_category, categoryName, price_range, product_tier, isBestSeller, stars
+
+holding, for each measure, the sum, sum of squares, min and max, plus the
+row count. Any grouping by a subset of those keys (optionally after
+filtering cube rows, e.g. main_category == 'Sports') rolls up from the
+cube's cells instead of the rows: counts, sums, means, standard deviations,
+minima and maxima are exact. Quantiles (medians, quartiles) are not additive
+and still need the rows.
+"""
+
+import pandas as pd
+import numpy as np
+import os
+from columnar_store import FURTHER_CLEANED_PATH, load_table, save_table, table_exists
+
+# Persisted cube (written by further_clean_data.py next to the table it summarizes)
+CUBE_PATH = 'output/aggregation_cube.parquet'
+
+# Cube dimensions
+CUBE_KEYS = ['main_category', 'categoryName', 'price_range', 'product_tier', 'isBestSeller', 'stars']
+
+# Aggregated columns
+CUBE_MEASURES = ['price', 'boughtInLastMonth', 'reviews']
+
+
+def build_cube(df, keys=CUBE_KEYS, measures=CUBE_MEASURES):
+    """
+    Aggregate a frame to one row per observed key combination
+
+    The keys are factorized once by a single groupby; each measure
+    contributes <measure>_sum, _sumsq, _min and _max columns.
+    """
+    frame = df[keys].copy()
+    aggregations = {'count': (measures[0], 'size')}
+    for measure in measures:
+        values = df[measure].astype('float64')
+        frame[measure] = values
+        frame[f'{measure}_sq'] = values * values
+        aggregations[f'{measure}_sum'] = (measure, 'sum')
+        aggregations[f'{measure}_sumsq'] = (f'{measure}_sq', 'sum')
+        aggregations[f'{measure}_min'] = (measure, 'min')
+        aggregations[f'{measure}_max'] = (measure, 'max')
+
+    cube = frame.groupby(keys, observed=True, dropna=False).agg(**aggregations).reset_index()
+    cube['count'] = cube['count'].astype('int64')
+    return cube
+
+
+def save_cube(cube, path=CUBE_PATH):
+    """
+    Persist the cube as a Parquet table
+    """
+    save_table(cube, path)
+
+
+def load_cube(path=CUBE_PATH, source_path=FURTHER_CLEANED_PATH):
+    """
+    Load the persisted cube, or None if it is missing or older than its source table
+    """
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(source_path) and os.path.getmtime(source_path) > os.path.getmtime(path):
+        return None
+    return load_table(path)
+
+
+def get_cube(df=None, path=CUBE_PATH, source_path=FURTHER_CLEANED_PATH):
+    """
+    The persisted cube, rebuilt from df (or the source table) when it is not current
+    """
+    cube = load_cube(path, source_path)
+    if cube is None:
+        if df is None:
+            if not table_exists(source_path):
+                raise FileNotFoundError(f'Neither {path} nor {source_path} exists')
+            df = load_table(source_path, columns=CUBE_KEYS + CUBE_MEASURES)
+        cube = build_cube(df)
+        save_cube(cube, path)
+    return cube
+
+
+def rollup(cube, by, measure):
+    """
+    count, sum, mean, std, min and max of a measure grouped by cube keys
+
+    by may be one key or a list of keys; the result is indexed by them
+    (std is the sample standard deviation, as in pandas). The measure may
+    also be a numeric key such as stars.
+    """
+    if f'{measure}_sum' not in cube.columns:
+        # A key used as a measure: each cell holds a single value
+        values = cube[measure].astype('float64')
+        cube = cube.assign(**{f'{measure}_sum': values * cube['count'],
+                              f'{measure}_sumsq': values * values * cube['count'],
+                              f'{measure}_min': values,
+                              f'{measure}_max': values})
+    rolled = cube.groupby(by, observed=True).agg(
+        count=('count', 'sum'),
+        sum=(f'{measure}_sum', 'sum'),
+        sumsq=(f'{measure}_sumsq', 'sum'),
+        min=(f'{measure}_min', 'min'),
+        max=(f'{measure}_max', 'max'),
+    )
+    count = rolled['count'].astype('float64')
+    rolled['mean'] = rolled['sum'] / count
+    # Clip tiny negative variances left by floating point cancellation
+    variance = ((rolled['sumsq'] - rolled['sum'] * rolled['mean']) / (count - 1)).clip(lower=0)
+    rolled['std'] = np.sqrt(variance.where(count > 1))
+    return rolled[['count', 'sum', 'mean', 'std', 'min', 'max']]
+
+
+def key_counts(cube, key):
+    """
+    Row count per value of one key (like value_counts(), sorted by key)
+    """
+    return cube.groupby(key, observed=False)['count'].sum()
+
+
+def cell_hashes(frame, keys=CUBE_KEYS):
+    """
+    Hash of each row's cube cell (the same for categorical and plain key columns)
+
+    The uint64 hashes are viewed as int64: pandas indexes built from uint64
+    values overflow in their range checks and warn.
+    """
+    return pd.util.hash_pandas_object(frame[keys], index=False).to_numpy().view('int64')
+
+
+def update_cube(cube, added, removed, df, keys=CUBE_KEYS, measures=CUBE_MEASURES):
+    """
+    The cube of df, from the cube of a previous version and the rows that changed
+
+    added are the rows of df that were not in the previous version, removed
+    the rows of the previous version that are not in df. Counts, sums and
+    sums of squares are updated by adding and subtracting the cubes of
+    those rows. Minima and maxima cannot be subtracted, so they are
+    recomputed from df for the cells that lost a row holding one. The
+    result matches build_cube(df) up to floating point rounding of the sums.
+    """
+    extremes = [f'{m}_{stat}' for m in measures for stat in ['min', 'max']]
+    # Plain key columns hash by dtype as well as value (categoricals by value only)
+    plain_keys = {key: df[key].dtype for key in keys if not isinstance(df[key].dtype, pd.CategoricalDtype)}
+    cube = cube.astype(plain_keys)
+    sub = build_cube(removed, keys, measures).astype(plain_keys)
+    sub_cells = cell_hashes(sub, keys)
+
+    # A cell's minimum or maximum can only change if a removed row held it
+    previous = cube.set_index(cell_hashes(cube, keys)).reindex(sub_cells)
+    at_extreme = previous['count'].isna().to_numpy().copy()
+    for measure in measures:
+        at_extreme |= sub[f'{measure}_min'].to_numpy() <= previous[f'{measure}_min'].to_numpy()
+        at_extreme |= sub[f'{measure}_max'].to_numpy() >= previous[f'{measure}_max'].to_numpy()
+
+    additive = ['count'] + [f'{m}_{stat}' for m in measures for stat in ['sum', 'sumsq']]
+    sub[additive] = -sub[additive]
+    sub[extremes] = np.nan
+
+    gained = build_cube(added, keys, measures).astype(plain_keys)
+    parts = [cube.assign(_cell=cell_hashes(cube, keys)), gained.assign(_cell=cell_hashes(gained, keys)),
+             sub.assign(_cell=sub_cells)]
+    # Key columns may have different categories in each part
+    combined = pd.concat([part.astype({key: 'object' for key in keys}) for part in parts], ignore_index=True)
+    aggregations = {key: 'first' for key in keys}
+    aggregations.update({col: 'sum' for col in additive})
+    for measure in measures:
+        aggregations[f'{measure}_min'] = 'min'
+        aggregations[f'{measure}_max'] = 'max'
+    updated = combined.groupby('_cell', sort=False).agg(aggregations)
+    updated = updated[updated['count'] > 0]
+
+    # Those cells get their minima and maxima from the rows they still have
+    touched = np.intersect1d(sub_cells[at_extreme], updated.index.to_numpy())
+    if len(touched):
+        rows = df[np.isin(cell_hashes(df, keys), touched)]
+        exact = build_cube(rows, keys, measures)
+        exact.index = cell_hashes(exact, keys)
+        updated.loc[exact.index, extremes] = exact[extremes].to_numpy()
+
+    # Same dtypes and cell order as build_cube(df)
+    updated = updated.astype({key: df[key].dtype for key in keys})
+    updated['count'] = updated['count'].astype('int64')
+    updated = updated.sort_values(keys, kind='stable', na_position='last').reset_index(drop=True)
+    return updated[cube.columns]
+
+
+def main():
+    """
+    Build the cube from the further cleaned data and show a few rollups
+    """
+    print('=' * 50)
+    print('Building aggregation cube')
+    print('=' * 50)
+
+    try:
+        df = load_table(FURTHER_CLEANED_PATH, columns=CUBE_KEYS + CUBE_MEASURES)
+    except Exception as e:
+        print(f'Error reading file: {e}')
+        exit(1)
+
+    cube = build_cube(df)
+    save_cube(cube)
+    print(f'{len(df)} rows aggregated into {len(cube)} cells, saved to {CUBE_PATH}')
+
+    print('\nMonthly sales by product tier:')
+    print(rollup(cube, 'product_tier', 'boughtInLastMonth'))
+    print('\nPrice by BestSeller flag:')
+    print(rollup(cube, 'isBestSeller', 'price'))
+
+
+if __name__ == '__main__':
+    main()
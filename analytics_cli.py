@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Single command line for the analysis scripts
+
+Each subcommand runs one script's run() function, reading its input from
+the files written by the stage before it, as the standalone script does:
+
+    python analytics_cli.py clean
+    python analytics_cli.py visualize --workers 4
+    python analytics_cli.py category-analysis Sports Kitchen
+    python analytics_cli.py search "yoga mat" --category Sports --max-price 30
+    python analytics_cli.py ingest --input archive/amz_uk_2023-11.csv --snapshot 2023-11
+
+`all` runs the whole pipeline in one process. The raw CSV is read once and
+each stage is handed the DataFrames produced by the one before it instead of
+reading them back; the intermediate tables are still written, so single
+stages can be re-run afterwards. Python, pandas, matplotlib and seaborn are
+also imported once rather than once per script.
+
+    python analytics_cli.py all
+    python analytics_cli.py all --overview     # also inspect and explore the raw data
+
+Every stage is recorded as a parent stage in the run report
+(output/run_reports/analytics_cli.json), with the script's own stages
+nested under it.
+"""
+
+import argparse
+import os
+from data_loader import RAW_DATA_PATH, load_product_data
+from instrumentation import stage, end_stage
+from correlation_engine import N_BOOTSTRAP
+from sport_analysis import SCATTER_MAX_POINTS
+from features import PRICE_MIN, PRICE_MAX
+import analyze_csv
+import clean_data
+import clean_and_save_data
+import further_clean_data
+import sport_analysis
+import sport_advanced_analysis
+import category_analysis
+import correlation_engine
+import visualization_analysis
+import check_categories
+import title_index
+import near_duplicates
+import outlier_detection
+import snapshot_ingest
+
+
+def run_step(name, func, *args, **kwargs):
+    """
+    Run one script's run() function as a stage of the run report
+    """
+    with stage(name):
+        result = func(*args, **kwargs)
+        # Close a stage the script began but did not end (early return)
+        end_stage()
+    return result
+
+
+# ==================== Subcommands ====================
+
+def command_inspect(args):
+    run_step('inspect', analyze_csv.run, file_path=args.input)
+
+
+def command_explore(args):
+    run_step('explore', clean_data.run, file_path=args.input)
+
+
+def command_clean(args):
+    run_step('clean', clean_and_save_data.run, file_path=args.input)
+
+
+def command_further_clean(args):
+    run_step('further_clean', further_clean_data.run, collapse_near_duplicates=args.collapse_near_duplicates,
+             workers=args.workers, price_filter=args.price_filter, outlier_method=args.outlier_method)
+
+
+def command_outliers(args):
+    run_step('outliers', outlier_detection.run, method=args.method, threshold=args.threshold, output=args.output)
+
+
+def command_sport(args):
+    run_step('sport_analysis', sport_analysis.run, workers=args.workers, use_cache=not args.no_cache,
+             sales_chart=args.sales_chart, log_density=args.log_density)
+
+
+def command_sport_advanced(args):
+    run_step('sport_advanced_analysis', sport_advanced_analysis.run)
+
+
+def command_category_analysis(args):
+    run_step('category_analysis', category_analysis.run, categories=args.categories,
+             min_products=args.min_products, workers=args.workers, use_cache=not args.no_cache,
+             sales_chart=args.sales_chart, log_density=args.log_density)
+
+
+def command_correlations(args):
+    run_step('correlations', correlation_engine.run, bootstrap=args.bootstrap, workers=args.workers,
+             seed=args.seed, output=args.output)
+
+
+def command_visualize(args):
+    run_step('visualization', visualization_analysis.run, workers=args.workers, use_cache=not args.no_cache)
+
+
+def command_check_categories(args):
+    run_step('check_categories', check_categories.run)
+
+
+def command_near_duplicates(args):
+    run_step('near_duplicates', near_duplicates.run, num_perm=args.num_perm, bands=args.bands,
+             shingle_size=args.shingle_size, threshold=args.threshold, workers=args.workers, output=args.output)
+
+
+def command_search(args):
+    run_step('title_search', title_index.run, args.query, source_path=args.source, rebuild=args.rebuild,
+             limit=args.limit, **title_index.filters_from_args(args))
+
+
+def command_ingest(args):
+    run_step('ingest', snapshot_ingest.run, args.input, snapshot=args.snapshot, full=args.full)
+
+
+def command_all(args):
+    """
+    Every stage in one process, passing the DataFrames from stage to stage
+    """
+    use_cache = not args.no_cache
+
+    with stage('load_raw') as load_stage:
+        try:
+            raw = load_product_data(args.input)
+            load_stage.rows = len(raw)
+            print(f'Loaded {args.input}: {raw.shape}')
+        except Exception as e:
+            print(f'Error reading file: {e}')
+            exit(1)
+
+    if args.overview:
+        run_step('inspect', analyze_csv.run, raw, file_path=args.input)
+        run_step('explore', clean_data.run, raw, file_path=args.input)
+
+    cleaned = run_step('clean', clean_and_save_data.run, raw, file_path=args.input)
+    # Only the cleaned frame is needed from here on
+    del raw
+    further, cube = run_step('further_clean', further_clean_data.run, cleaned,
+                             collapse_near_duplicates=args.collapse_near_duplicates, workers=args.workers,
+                             price_filter=args.price_filter, outlier_method=args.outlier_method)
+    del cleaned
+
+    sport_df = run_step('sport_analysis', sport_analysis.run, further, cube, workers=args.workers,
+                        use_cache=use_cache, sales_chart=args.sales_chart, log_density=args.log_density)
+    if sport_df is not None:
+        run_step('sport_advanced_analysis', sport_advanced_analysis.run, sport_df)
+        del sport_df
+
+    run_step('category_analysis', category_analysis.run, further, cube, workers=args.workers,
+             use_cache=use_cache, sales_chart=args.sales_chart, log_density=args.log_density)
+    run_step('correlations', correlation_engine.run, further, bootstrap=args.bootstrap, workers=args.workers)
+    run_step('visualization', visualization_analysis.run, further, cube, workers=args.workers,
+             use_cache=use_cache)
+    run_step('check_categories', check_categories.run, further)
+
+
+# ==================== Command line ====================
+
+def add_input_argument(parser):
+    parser.add_argument('--input', default=RAW_DATA_PATH, help='raw product CSV file')
+    return parser
+
+
+def build_parser():
+    """
+    Argument parser with one subcommand per script, plus `all`
+    """
+    parser = argparse.ArgumentParser(description='Amazon UK product analysis pipeline')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    def add_command(name, func, help_text):
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        subparser.set_defaults(func=func)
+        return subparser
+
+    add_input_argument(add_command('inspect', command_inspect, 'shape, columns and missing values of the raw CSV'))
+    add_input_argument(add_command('explore', command_explore, 'price, category and duplicate overview of the raw CSV'))
+    add_input_argument(add_command('clean', command_clean, 'de-duplicate and save the raw data'))
+    further_clean_data.add_arguments(add_command('further-clean', command_further_clean,
+                                                 'price filter and feature engineering'))
+    outlier_detection.add_arguments(add_command('outliers', command_outliers,
+                                                'per-category price, review and sales outliers'))
+    sport_analysis.add_arguments(add_command('sport', command_sport, 'Sports & Outdoors product analysis'))
+    add_command('sport-advanced', command_sport_advanced, 'price range and rating analysis of the Sports products')
+    category_analysis.add_arguments(add_command('category-analysis', command_category_analysis,
+                                                'the Sports analysis suite for each main category'))
+    correlation_engine.add_arguments(add_command('correlations', command_correlations,
+                                                 'segment correlations with bootstrap intervals'))
+    visualization_analysis.add_arguments(add_command('visualize', command_visualize, 'overview charts'))
+    add_command('check-categories', command_check_categories, 'review the main category taxonomy')
+    near_duplicates.add_arguments(add_command('near-duplicates', command_near_duplicates,
+                                              'cluster near-duplicate listings by title similarity'))
+    title_index.add_arguments(add_command('search', command_search, 'keyword search over product titles'))
+    snapshot_ingest.add_arguments(add_command('ingest', command_ingest,
+                                              'incremental update from a new monthly snapshot'))
+
+    all_parser = add_command('all', command_all, 'every stage in one process on one in-memory dataset')
+    add_input_argument(all_parser)
+    all_parser.add_argument('--overview', action='store_true', help='also run inspect and explore')
+    all_parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='chart rendering and title hashing processes')
+    all_parser.add_argument('--collapse-near-duplicates', action='store_true',
+                            help='keep one listing per cluster of near-duplicate titles')
+    all_parser.add_argument('--price-filter', choices=['window', 'robust'], default='window',
+                            help=f'fixed {PRICE_MIN}-{PRICE_MAX} GBP window or per-category price outliers')
+    all_parser.add_argument('--outlier-method', choices=outlier_detection.METHODS, default='mad',
+                            help='robust rule of the per-category filter')
+    all_parser.add_argument('--no-cache', action='store_true', help='re-render charts even if unchanged')
+    all_parser.add_argument('--sales-chart', choices=['auto', 'scatter', 'density'], default='auto',
+                            help=f'sales vs. rating chart type (auto: density above {SCATTER_MAX_POINTS} products)')
+    all_parser.add_argument('--log-density', action='store_true', help='log color scale for the density chart')
+    all_parser.add_argument('--bootstrap', type=int, default=N_BOOTSTRAP, help='bootstrap replicates (0 to skip)')
+    return parser
+
+
+def main():
+    """
+    Main function: run the selected subcommand
+    """
+    args = build_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
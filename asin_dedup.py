@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ASIN de-duplication with a configurable survivor policy
+
+The same ASIN can appear several times (listed in several categories, or
+in several of the merged source files). Duplicates inflate every sum over
+products, so one row per ASIN is kept:
+
+- each duplicated ASIN keeps the row ranked first by the survivor policy,
+  a list of rules applied in order as tie-breakers (highest reviews,
+  latest source_file, most boughtInLastMonth); remaining ties keep the
+  first row read
+- rows without an ASIN are never treated as duplicates
+
+Inputs that fit in memory are de-duplicated in one pass. Larger inputs are
+first hash-partitioned by ASIN into spill files on disk, so every copy of
+an ASIN lands in the same bucket; buckets are then de-duplicated one at a
+time and appended to the output. Peak memory is one bucket instead of the
+whole dataset. Duplicate statistics are collected while de-duplicating
+each bucket and merged at the end. A CSV read in chunks (streaming_clean.py)
+is handled the same way, spilling only the ASIN, the survivor policy
+columns and row numbers.
+"""
+
+import pandas as pd
+import numpy as np
+import pyarrow.dataset as ds
+import argparse
+import math
+import os
+import shutil
+import time
+from columnar_store import MERGED_DATASET_PATH, ChunkedTableWriter
+
+# De-duplicated merged data
+DEDUPED_DATASET_PATH = 'output/merged_deduplicated.parquet'
+
+# Temporary hash partitions of the input
+SPILL_DIR = 'output/.dedup_spill'
+
+# Survivor rules: the row with the highest value of the column survives
+SURVIVOR_POLICIES = {
+    'reviews': 'reviews',
+    'latest_source': 'source_file',
+    'sales': 'boughtInLastMonth',
+}
+DEFAULT_POLICY = ['reviews']
+
+# Memory budget per bucket, and in-memory size of a Parquet byte (rough)
+MEMORY_BUDGET_MB = 512
+PARQUET_EXPANSION = 4
+
+# Duplicated ASINs listed in the statistics
+TOP_DUPLICATES = 5
+
+
+def policy_columns(policy, columns):
+    """
+    Sort columns of a survivor policy, checking they exist
+    """
+    sort_columns = []
+    for rule in policy:
+        if rule not in SURVIVOR_POLICIES:
+            raise ValueError(f'Unknown survivor rule: {rule} (choose from {list(SURVIVOR_POLICIES)})')
+        column = SURVIVOR_POLICIES[rule]
+        if column not in columns:
+            raise ValueError(f'Survivor rule {rule} needs the {column} column')
+        sort_columns.append(column)
+    return sort_columns
+
+
+def duplicate_stats(df, top=TOP_DUPLICATES):
+    """
+    Duplicate statistics of a frame (or of one bucket of a larger input)
+    """
+    counts = df['asin'].value_counts()
+    # Most copies first, ties by ASIN so the listing does not depend on bucketing
+    duplicated = counts[counts > 1].sort_index().sort_values(ascending=False, kind='stable')
+    stats = {
+        'rows': len(df),
+        'unique_asins': len(counts),
+        'duplicated_asins': len(duplicated),
+        'duplicated_rows': int(duplicated.sum()),
+        'removed_rows': int((duplicated - 1).sum()),
+        'max_copies': int(duplicated.max()) if len(duplicated) else 1,
+        'top_duplicates': duplicated.head(top),
+    }
+    if 'source_file' in df.columns:
+        sources = df.loc[df['asin'].isin(duplicated.index)].groupby('asin')['source_file'].nunique()
+        stats['cross_source_asins'] = int((sources > 1).sum())
+    return stats
+
+
+def merge_duplicate_stats(parts, top=TOP_DUPLICATES):
+    """
+    Combine the statistics of disjoint buckets
+    """
+    merged = {}
+    for stats in parts:
+        for key, value in stats.items():
+            if key == 'top_duplicates':
+                merged[key] = pd.concat([merged[key], value]) if key in merged else value
+            elif key == 'max_copies':
+                merged[key] = max(merged.get(key, 1), value)
+            else:
+                merged[key] = merged.get(key, 0) + value
+    if 'top_duplicates' in merged:
+        top_duplicates = merged['top_duplicates'].sort_index()
+        merged['top_duplicates'] = top_duplicates.sort_values(ascending=False, kind='stable').head(top)
+    return merged
+
+
+def dedupe_frame(df, policy=DEFAULT_POLICY):
+    """
+    Keep one row per ASIN, chosen by the survivor policy
+
+    Returns the surviving rows (in their original order) and the duplicate
+    statistics of the input.
+    """
+    stats = duplicate_stats(df)
+    if stats['removed_rows'] == 0:
+        return df, stats
+    ordered = df.sort_values(policy_columns(policy, df.columns), ascending=False,
+                             kind='stable', na_position='last')
+    keep = ~ordered.duplicated('asin') | ordered['asin'].isna()
+    return ordered[keep].sort_index(), stats
+
+
+def asin_buckets(asins, buckets):
+    """
+    Bucket number of each ASIN (stable across runs and processes)
+    """
+    return (pd.util.hash_pandas_object(asins, index=False).to_numpy() % buckets).astype('int64')
+
+
+def auto_buckets(dataset, memory_mb=MEMORY_BUDGET_MB):
+    """
+    Number of buckets that keeps one bucket within the memory budget
+    """
+    size = sum(os.path.getsize(path) for path in dataset.files)
+    return max(1, math.ceil(size * PARQUET_EXPANSION / (memory_mb * 1024 ** 2)))
+
+
+def open_dataset(source):
+    """
+    A Parquet file or a hive-partitioned Parquet dataset directory
+    """
+    return ds.dataset(source, format='parquet', partitioning='hive' if os.path.isdir(source) else None)
+
+
+def dedupe_dataset(source=MERGED_DATASET_PATH, output_path=DEDUPED_DATASET_PATH, policy=DEFAULT_POLICY,
+                   buckets=None, spill_dir=SPILL_DIR, batch_rows=200000):
+    """
+    De-duplicate a Parquet dataset into one table, spilling to disk if needed
+
+    buckets=None picks the number of hash partitions from the input size;
+    with one bucket the input is de-duplicated in memory. Returns the
+    duplicate statistics and the number of buckets used.
+    """
+    dataset = open_dataset(source)
+    schema = dataset.schema
+    policy_columns(policy, schema.names)
+    if buckets is None:
+        buckets = auto_buckets(dataset)
+
+    if buckets <= 1:
+        survivors, stats = dedupe_frame(dataset.to_table().to_pandas(), policy)
+        with ChunkedTableWriter(output_path, schema=schema) as writer:
+            writer.write(survivors)
+        return stats, 1
+
+    # Partition pass: every copy of an ASIN goes to the same spill file
+    if os.path.exists(spill_dir):
+        shutil.rmtree(spill_dir)
+    spills = [ChunkedTableWriter(os.path.join(spill_dir, f'bucket-{i:04d}.parquet'), schema=schema)
+              for i in range(buckets)]
+    try:
+        for batch in dataset.to_batches(batch_size=batch_rows):
+            chunk = batch.to_pandas()
+            for bucket, part in chunk.groupby(asin_buckets(chunk['asin'], buckets), sort=False):
+                spills[bucket].write(part)
+    finally:
+        for spill in spills:
+            spill.close()
+
+    # De-duplication pass, one bucket in memory at a time
+    parts = []
+    with ChunkedTableWriter(output_path, schema=schema) as writer:
+        for spill in spills:
+            if spill.rows == 0:
+                continue
+            survivors, stats = dedupe_frame(pd.read_parquet(spill.path), policy)
+            writer.write(survivors)
+            parts.append(stats)
+    shutil.rmtree(spill_dir)
+    return merge_duplicate_stats(parts), buckets
+
+
+def dedupe_chunks(chunks, policy=DEFAULT_POLICY, buckets=1, spill_dir=SPILL_DIR):
+    """
+    Which rows of a stream of chunks survive de-duplication
+
+    The chunks need the asin column and the policy's columns; their rows are
+    numbered in reading order. Only those columns and the row numbers are
+    kept (in memory with one bucket, spilled to hash buckets otherwise), so
+    the input itself can be re-read afterwards, keeping the surviving rows
+    in their original order. The survivors are the rows dedupe_frame keeps
+    from the whole input. Returns a boolean array over all rows and the
+    duplicate statistics.
+    """
+    spills = []
+    frames = []
+    rows = 0
+    try:
+        for chunk in chunks:
+            keys = chunk[['asin'] + policy_columns(policy, chunk.columns)].copy()
+            keys['row'] = np.arange(rows, rows + len(keys))
+            rows += len(keys)
+            if buckets <= 1:
+                frames.append(keys)
+                continue
+            if not spills:
+                if os.path.exists(spill_dir):
+                    shutil.rmtree(spill_dir)
+                spills = [ChunkedTableWriter(os.path.join(spill_dir, f'bucket-{i:04d}.parquet'))
+                          for i in range(buckets)]
+            for bucket, part in keys.groupby(asin_buckets(keys['asin'], buckets), sort=False):
+                spills[bucket].write(part)
+    finally:
+        for spill in spills:
+            spill.close()
+
+    keep = np.zeros(rows, dtype=bool)
+    if buckets <= 1:
+        parts = [pd.concat(frames, ignore_index=True)] if frames else []
+    else:
+        parts = (pd.read_parquet(spill.path) for spill in spills if spill.rows > 0)
+    stats = []
+    for part in parts:
+        survivors, part_stats = dedupe_frame(part, policy)
+        keep[survivors['row'].to_numpy()] = True
+        stats.append(part_stats)
+    if spills:
+        shutil.rmtree(spill_dir)
+    return keep, merge_duplicate_stats(stats)
+
+
+def print_duplicate_stats(stats):
+    """
+    Print the duplicate statistics
+    """
+    print(f'Rows read: {stats["rows"]}')
+    print(f'Unique ASINs: {stats["unique_asins"]}')
+    print(f'Number of duplicated ASIN entries: {stats["duplicated_rows"]}')
+    print(f'Number of unique duplicated ASINs: {stats["duplicated_asins"]}')
+    if 'cross_source_asins' in stats:
+        print(f'Duplicated ASINs found in more than one source file: {stats["cross_source_asins"]}')
+    print(f'Rows removed: {stats["removed_rows"]} (at most {stats["max_copies"]} copies of one ASIN)')
+    if stats['duplicated_asins']:
+        print(f'\nTop {TOP_DUPLICATES} Most Frequently Duplicated ASINs:')
+        print(stats['top_duplicates'])
+
+
+def main():
+    """
+    Main function: de-duplicate the merged data by ASIN
+    """
+    parser = argparse.ArgumentParser(description='Remove duplicate ASINs from the merged product data')
+    parser.add_argument('--input', default=MERGED_DATASET_PATH, help='Parquet file or partitioned dataset')
+    parser.add_argument('--output', default=DEDUPED_DATASET_PATH, help='de-duplicated Parquet table')
+    parser.add_argument('--policy', nargs='+', choices=list(SURVIVOR_POLICIES), default=DEFAULT_POLICY,
+                        help='survivor rules, applied in order as tie-breakers')
+    parser.add_argument('--buckets', type=int, default=None,
+                        help='hash partitions spilled to disk (default: from input size, 1 = in memory)')
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_BUDGET_MB, help='memory budget per bucket')
+    args = parser.parse_args()
+
+    print('=' * 50)
+    print('Starting ASIN de-duplication')
+    print('=' * 50)
+
+    if not os.path.exists(args.input):
+        print(f'Error: {args.input} not found (run merge_excel_files.py first)')
+        exit(1)
+
+    buckets = args.buckets
+    if buckets is None:
+        buckets = auto_buckets(open_dataset(args.input), args.memory_mb)
+
+    print(f'\n1. De-duplicating {args.input}')
+    print('-' * 30)
+    print(f'Survivor policy: {" > ".join(args.policy)}')
+    start = time.perf_counter()
+    try:
+        stats, buckets = dedupe_dataset(args.input, args.output, args.policy, buckets)
+    except Exception as e:
+        print(f'Error de-duplicating data: {e}')
+        exit(1)
+    mode = 'in memory' if buckets == 1 else f'{buckets} hash buckets spilled to disk'
+    print(f'Done in {time.perf_counter() - start:.1f}s ({mode})')
+
+    print('\n2. Duplicate Statistics')
+    print('-' * 30)
+    print_duplicate_stats(stats)
+
+    print(f'\nSaved de-duplicated data to: {args.output}')
+    print('=' * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare two benchmark results stage by stage
+
+Usage:
+    python benchmarks/compare_results.py benchmarks/results/abc1234_100k.json benchmarks/results/def5678_100k.json
+"""
+
+import json
+import sys
+
+
+def load_result(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(base, new):
+    """
+    Rows of (stage, base seconds, new seconds, speedup, base MB, new MB)
+    """
+    base_stages = {stage['stage']: stage for stage in base['stages']}
+    rows = []
+    for stage in new['stages']:
+        old = base_stages.get(stage['stage'])
+        if old is None:
+            continue
+        speedup = old['seconds'] / stage['seconds'] if stage['seconds'] else float('nan')
+        rows.append((stage['stage'], old['seconds'], stage['seconds'], speedup,
+                     old['peak_rss_mb'], stage['peak_rss_mb']))
+    return rows
+
+
+def main():
+    """
+    Main function: print the stage comparison of two result files
+    """
+    if len(sys.argv) != 3:
+        print('Usage: compare_results.py BASE.json NEW.json')
+        sys.exit(1)
+
+    base, new = load_result(sys.argv[1]), load_result(sys.argv[2])
+    print(f'Base: {base["commit"]} ({base["rows"]} rows, {base["timestamp"]})')
+    print(f'New:  {new["commit"]} ({new["rows"]} rows, {new["timestamp"]})')
+    if base['rows'] != new['rows']:
+        print('Warning: the results are for different dataset sizes')
+
+    print(f'\n{"stage":<14}{"base (s)":>10}{"new (s)":>10}{"speedup":>9}{"base MB":>10}{"new MB":>10}')
+    for stage, old_s, new_s, speedup, old_mb, new_mb in compare(base, new):
+        print(f'{stage:<14}{old_s:>10.2f}{new_s:>10.2f}{speedup:>8.2f}x{old_mb:>10.1f}{new_mb:>10.1f}')
+    print(f'{"total":<14}{base["total_seconds"]:>10.2f}{new["total_seconds"]:>10.2f}'
+          f'{base["total_seconds"] / new["total_seconds"]:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic product data in the amz_uk_processed_data.csv schema
+
+Rows are generated and written in chunks, so any size fits in memory. The
+distributions follow the real dataset:
+- 300 category names (30 departments x 10 product groups) with Zipf-like
+  sizes; the first word of a name is its department
+- log-normal prices with a per-category level, about 1% listed at £0
+- about 30% unrated products (0 stars, 0 reviews); ratings of the rest
+  cluster around 4.3 stars
+- heavy-tailed (Pareto) review counts and monthly sales; most products
+  have no recorded sales and sales are rounded to Amazon's 50/100 steps
+- about 0.6% BestSellers, more likely among high sellers
+- about 3% of rows repeat the ASIN (and title) of an earlier product, as
+  products listed in several categories do
+
+The output depends only on the row count, chunk size and seed.
+
+Usage:
+    python benchmarks/generate_data.py 100k
+    python benchmarks/generate_data.py 2200000 --output data.csv
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import time
+
+# Named dataset sizes
+SIZES = {
+    '100k': 100000,
+    '2.2M': 2200000,
+    '20M': 20000000,
+}
+
+# Generated files (one per size)
+DATA_DIR = 'output/benchmarks'
+
+# Rows generated per chunk
+CHUNK_ROWS = 1000000
+
+# Share of rows repeating an earlier ASIN
+DUPLICATE_RATE = 0.03
+
+# Share of products without a rating
+UNRATED_RATE = 0.3
+
+# Category name parts: 30 departments x 10 groups = 300 categories
+DEPARTMENTS = ['Sports', 'Kitchen', 'Home', 'Garden', 'Baby', 'Toys', 'Car', 'Pet', 'Beauty', 'Health',
+               'Computer', 'Office', 'Camera', 'Music', 'Gaming', 'Hair', 'Fishing', 'Golf', 'Cycling',
+               'Camping', 'Fitness', "Women's", "Men's", "Girls'", "Boys'", 'Luggage', 'Lighting',
+               'Industrial', 'Arts', 'Mobile']
+GROUPS = ['Accessories', 'Equipment', 'Supplies', 'Clothing', 'Tools', 'Storage', 'Care', 'Electronics',
+          'Decor', 'Parts']
+
+# Words used to build product titles
+TITLE_WORDS = ['Premium', 'Portable', 'Adjustable', 'Waterproof', 'Wireless', 'Stainless', 'Compact',
+               'Heavy Duty', 'Lightweight', 'Rechargeable', 'Foldable', 'Ergonomic']
+TITLE_NOUNS = ['Set', 'Bag', 'Holder', 'Kit', 'Mat', 'Stand', 'Case', 'Bottle', 'Organiser', 'Lamp',
+               'Cover', 'Brush']
+
+
+def parse_size(size):
+    """
+    Row count of a named size ('100k', '2.2M', '20M') or a plain number
+    """
+    return SIZES[size] if size in SIZES else int(float(size))
+
+
+def category_names():
+    """
+    The 300 synthetic category names
+    """
+    return [f'{department} {group}' for department in DEPARTMENTS for group in GROUPS]
+
+
+def category_model(seed=0):
+    """
+    Category names, their row shares (Zipf-like) and price levels
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(category_names(), dtype=object)
+    weights = 1.0 / np.arange(1, len(names) + 1) ** 0.9
+    shares = rng.permutation(weights / weights.sum())
+    price_mu = rng.normal(3.0, 0.5, len(names))
+    return names, shares, price_mu
+
+
+def product_titles(ids):
+    """
+    Titles derived from product ids (a repeated ASIN repeats its title)
+    """
+    words = np.array(TITLE_WORDS, dtype=object)[ids * 7919 % len(TITLE_WORDS)]
+    nouns = np.array(TITLE_NOUNS, dtype=object)[ids * 104729 % len(TITLE_NOUNS)]
+    return words + ' ' + nouns + ' ' + pd.Series(ids).astype(str).to_numpy(dtype=object)
+
+
+def generate_chunk(start, rows, rng, model):
+    """
+    Rows start .. start + rows - 1 as a DataFrame in the raw CSV layout
+    """
+    names, shares, price_mu = model
+    ids = np.arange(start, start + rows)
+    # Some rows repeat a product generated earlier
+    repeat = (rng.random(rows) < DUPLICATE_RATE) & (ids > 0)
+    ids[repeat] = rng.integers(0, ids[repeat])
+    asin = pd.Series(ids).map('B0{:08X}'.format).to_numpy(dtype=object)
+
+    category = rng.choice(len(names), size=rows, p=shares)
+    price = np.round(np.exp(rng.normal(price_mu[category], 1.0)), 2)
+    price[rng.random(rows) < 0.01] = 0.0
+
+    rated = rng.random(rows) >= UNRATED_RATE
+    stars = np.where(rated, np.clip(np.round(rng.normal(4.3, 0.45, rows), 1), 1.0, 5.0), 0.0)
+    reviews = np.where(rated, np.minimum(np.floor((rng.pareto(1.1, rows) + 1) * 5), 1500000), 0).astype('int64')
+
+    selling = rng.random(rows) < 0.15
+    sales = np.minimum((rng.pareto(1.3, rows) + 1) * 50, 100000)
+    sales = np.where(sales < 1000, np.floor(sales / 50) * 50, np.floor(sales / 100) * 100)
+    bought = np.where(selling, sales, 0).astype('int64')
+    bestseller = rng.random(rows) < np.where(bought >= 1000, 0.05, 0.005)
+
+    return pd.DataFrame({
+        'asin': asin,
+        'title': product_titles(ids),
+        'imgUrl': 'https://m.media-amazon.com/images/I/' + asin + '.jpg',
+        'productURL': 'https://www.amazon.co.uk/dp/' + asin,
+        'stars': stars,
+        'reviews': reviews,
+        'price': price,
+        'isBestSeller': bestseller,
+        'boughtInLastMonth': bought,
+        'categoryName': names[category],
+    })
+
+
+def generate_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """
+    Write rows synthetic products to a CSV file, chunk by chunk
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    model = category_model(seed)
+    starts = range(0, rows, chunk_rows)
+    streams = np.random.SeedSequence(seed).spawn(len(starts))
+    temp_path = f'{path}.tmp'
+    for i, (start, stream) in enumerate(zip(starts, streams)):
+        chunk = generate_chunk(start, min(chunk_rows, rows - start), np.random.default_rng(stream), model)
+        chunk.to_csv(temp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+def dataset_path(size, data_dir=DATA_DIR):
+    """
+    CSV file of the generated dataset of a size
+    """
+    return os.path.join(data_dir, f'amz_uk_synthetic_{size}.csv')
+
+
+def ensure_dataset(size, data_dir=DATA_DIR, seed=0):
+    """
+    Path of the generated dataset of a size, generating it if missing
+    """
+    path = dataset_path(size, data_dir)
+    if not os.path.exists(path):
+        generate_csv(path, parse_size(size), seed=seed)
+    return path
+
+
+def main():
+    """
+    Main function: generate a synthetic dataset
+    """
+    parser = argparse.ArgumentParser(description='Generate synthetic Amazon UK product data')
+    parser.add_argument('size', help=f'row count or one of {list(SIZES)}')
+    parser.add_argument('--output', default=None, help='CSV file (default: output/benchmarks/)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    path = args.output or dataset_path(args.size)
+    rows = parse_size(args.size)
+    print(f'Generating {rows} rows into {path}...')
+    start = time.perf_counter()
+    generate_csv(path, rows, seed=args.seed)
+    print(f'Done in {time.perf_counter() - start:.1f}s ({os.path.getsize(path) / 1024 ** 2:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Import times of the analysis modules and of the libraries they use
+
+Each module is imported in a fresh interpreter (best of several runs), so
+the time includes everything the import pulls in. The slow-to-import
+libraries it loads are listed; the analysis scripts should only load
+pandas and pyarrow at import time, with matplotlib, seaborn and scipy
+imported where a chart is drawn or a test computed.
+
+Usage:
+    python benchmarks/import_times.py
+    python benchmarks/import_times.py check_categories analytics_cli --repeat 10
+    python benchmarks/import_times.py --detail analytics_cli    # python -X importtime, slowest modules
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from instrumentation import HEAVY_MODULES
+
+# Libraries measured on their own, for reference
+LIBRARIES = ['pandas', 'pyarrow.parquet', 'matplotlib.pyplot', 'seaborn', 'scipy.stats']
+
+# Analysis modules measured by default
+MODULES = ['analyze_csv', 'check_categories', 'clean_data', 'clean_and_save_data', 'further_clean_data',
+           'sport_analysis', 'sport_advanced_analysis', 'visualization_analysis', 'category_analysis',
+           'correlation_engine', 'title_index', 'near_duplicates', 'outlier_detection',
+           'snapshot_ingest', 'analytics_cli']
+
+# Program run in a fresh interpreter for each measurement
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+'''
+
+
+def environment():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, env.get('PYTHONPATH')]))
+    env.setdefault('MPLBACKEND', 'Agg')
+    return env
+
+
+def measure(module, repeat=5):
+    """
+    Best import time of a module in a fresh interpreter and the heavy libraries it loads
+    """
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True, env=environment()).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+
+def slowest_imports(module, top=15):
+    """
+    (cumulative seconds, module) of the slowest top-level imports, from python -X importtime
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True, env=environment()).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Only modules imported directly by the measured module (one level of nesting)
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    """
+    Main function: print the import times of the selected modules
+    """
+    parser = argparse.ArgumentParser(description='Measure module import times in fresh interpreters')
+    parser.add_argument('modules', nargs='*', help=f'modules to measure (default: libraries and {MODULES})')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per module (the best is reported)')
+    parser.add_argument('--detail', action='store_true', help='list the slowest imports of each module')
+    args = parser.parse_args()
+
+    print('=' * 50)
+    print('Module import times')
+    print('=' * 50)
+
+    modules = args.modules or LIBRARIES + MODULES
+    print(f'\n{"module":<26}{"import (s)":>11}  heavy libraries loaded')
+    print('-' * 30)
+    for module in modules:
+        try:
+            result = measure(module, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f'{module:<26}{"error":>11}  {e.stderr.strip().splitlines()[-1]}')
+            continue
+        print(f'{module:<26}{result["seconds"]:>11.3f}  {", ".join(result["heavy"]) or "-"}')
+
+        if args.detail:
+            for seconds, name in slowest_imports(module):
+                print(f'    {name:<30}{seconds:>8.3f}s')
+
+
+if __name__ == '__main__':
+    main()
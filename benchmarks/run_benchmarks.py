@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stage benchmarks of the analysis pipeline on synthetic data
+
+For each dataset size the pipeline stages run in order, in one process, on
+the generated CSV (see generate_data.py):
+
+    load          typed CSV load (data_loader)
+    clean         ASIN de-duplication and saving the cleaned table
+    features      price window filter, price_range / main_category / product_tier
+    aggregate     aggregation cube, rollups and segment correlations
+    chart_data    chart statistics of visualization_analysis.py and sport_analysis.py
+    summaries     both text summary reports
+    save_further  writing the further cleaned table
+    query_pandas  the analysis aggregations of query_backend.py on pandas
+    query_duckdb  the same queries on duckdb, directly over the files
+                  (skipped when duckdb is not installed)
+
+Wall time and peak resident memory are recorded per stage. On Linux the
+peak is reset before each stage (/proc/self/clear_refs), so it is the peak
+of that stage alone; elsewhere it is the peak of the process so far.
+
+Results are written as JSON to benchmarks/results/<commit>_<size>.json
+together with the commit, library versions and machine, so runs on
+different commits can be compared with compare_results.py. When both query
+backends ran, the result also records whether their results matched.
+
+Usage:
+    python benchmarks/run_benchmarks.py                  # 100k rows
+    python benchmarks/run_benchmarks.py --size 100k 2.2M
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import pandas as pd
+import numpy as np
+from generate_data import SIZES, DATA_DIR, ensure_dataset, parse_size
+from data_loader import load_product_data
+from columnar_store import save_table
+from asin_dedup import dedupe_frame
+from features import PRICE_MIN, PRICE_MAX, PRICE_LABELS, TIER_ORDER, filter_price_window, add_features
+from aggregation_cube import build_cube, rollup, key_counts
+from correlation_engine import add_sales_band, rated_products, correlate
+from summaries import write_data_analysis_summary, write_further_analysis_summary
+from instrumentation import current_rss_mb, reset_peak_rss, peak_rss_mb
+from query_backend import analysis_queries, run_queries, results_match, duckdb_available
+import visualization_analysis
+import sport_analysis
+
+# Benchmark results (one JSON file per commit and size)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+def run_stage(name, func, state):
+    """
+    Run one stage, returning its timing and memory record
+    """
+    per_stage = reset_peak_rss()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    # Stage functions reuse the scripts' helpers, which print progress
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(state)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    return {
+        'stage': name,
+        'seconds': round(seconds, 4),
+        'peak_rss_mb': round(peak, 1),
+        'peak_rss_scope': 'stage' if per_stage else 'process',
+        'rss_growth_mb': round(peak - rss_before, 1) if rss_before is not None else None,
+    }
+
+
+# ==================== Stages ====================
+
+def stage_load(state):
+    state['raw'] = load_product_data(state['csv_path'])
+
+
+def stage_clean(state):
+    state['cleaned'], state['duplicate_stats'] = dedupe_frame(state.pop('raw'))
+    save_table(state['cleaned'], os.path.join(state['work_dir'], 'cleaned.parquet'))
+
+
+def stage_features(state):
+    state['further'] = add_features(filter_price_window(state['cleaned'], PRICE_MIN, PRICE_MAX))
+
+
+def stage_aggregate(state):
+    df = state['further']
+    cube = build_cube(df)
+    state['cube'] = cube
+    state['rollups'] = {
+        'category_sales': rollup(cube, 'main_category', 'boughtInLastMonth'),
+        'tier_price': rollup(cube, 'product_tier', 'price'),
+        'bestseller_price': rollup(cube, 'isBestSeller', 'price'),
+        'tier_counts': key_counts(cube, 'product_tier'),
+        'price_range_counts': key_counts(cube, 'price_range'),
+    }
+    state['category_counts'] = state['cleaned']['categoryName'].value_counts()
+    rated = add_sales_band(rated_products(df[['main_category', 'product_tier', 'stars', 'reviews', 'price',
+                                              'boughtInLastMonth']]).copy())
+    state['correlations'] = correlate(rated)
+
+
+def stage_chart_data(state):
+    df = state['further']
+    cube = state['cube']
+    tasks = visualization_analysis.prepare_charts(df[visualization_analysis.COLUMNS], cube)
+    sport_df = df[df['main_category'] == 'Sports']
+    tasks += sport_analysis.prepare_charts(sport_df, cube[cube['main_category'] == 'Sports'])
+    state['chart_tasks'] = len(tasks)
+
+
+def stage_summaries(state):
+    cleaned = state['cleaned']
+    further = state['further']
+    rollups = state['rollups']
+    tier_price = rollups['tier_price'].copy()
+    tier_price['median'] = further.groupby('product_tier', observed=True)['price'].median()
+    write_data_analysis_summary(os.path.join(state['work_dir'], 'data_analysis_summary.txt'),
+                                total_products=len(cleaned),
+                                category_counts=state['category_counts'],
+                                price_stats=cleaned['price'].describe(),
+                                low_price_count=int((cleaned['price'] < PRICE_MIN).sum()),
+                                high_price_count=int((cleaned['price'] > PRICE_MAX).sum()))
+    write_further_analysis_summary(os.path.join(state['work_dir'], 'further_analysis_summary.txt'),
+                                   original_shape=cleaned.shape,
+                                   filtered_shape=further.shape,
+                                   price_range_dist=rollups['price_range_counts'].reindex(PRICE_LABELS),
+                                   tier_dist=rollups['tier_counts'].reindex(TIER_ORDER, fill_value=0),
+                                   tier_price=tier_price)
+
+
+def stage_save_further(state):
+    save_table(state['further'], os.path.join(state['work_dir'], 'further.parquet'))
+
+
+def benchmark_queries(state):
+    return analysis_queries(cleaned_path=os.path.join(state['work_dir'], 'cleaned.parquet'),
+                            further_path=os.path.join(state['work_dir'], 'further.parquet'))
+
+
+def stage_query_pandas(state):
+    state['query_results'] = {'pandas': run_queries(benchmark_queries(state), 'pandas')}
+
+
+def stage_query_duckdb(state):
+    state['query_results']['duckdb'] = run_queries(benchmark_queries(state), 'duckdb')
+
+
+STAGES = [
+    ('load', stage_load),
+    ('clean', stage_clean),
+    ('features', stage_features),
+    ('aggregate', stage_aggregate),
+    ('chart_data', stage_chart_data),
+    ('summaries', stage_summaries),
+    ('save_further', stage_save_further),
+    ('query_pandas', stage_query_pandas),
+    ('query_duckdb', stage_query_duckdb),
+]
+
+# Stages needing an optional package, with the check that it is installed
+OPTIONAL_STAGES = {
+    'query_duckdb': duckdb_available,
+}
+
+
+# ==================== Runner ====================
+
+def git_commit():
+    """
+    Short hash of the checked-out commit ('+dirty' if there are local changes)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCH_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f'{commit}+dirty' if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmark(size, data_dir=DATA_DIR):
+    """
+    Benchmark every stage on the dataset of one size
+    """
+    csv_path = ensure_dataset(size, data_dir)
+    work_dir = os.path.join(data_dir, f'work_{size}')
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+
+    state = {'csv_path': csv_path, 'work_dir': work_dir}
+    stages = []
+    for name, func in STAGES:
+        if name in OPTIONAL_STAGES and not OPTIONAL_STAGES[name]():
+            print(f'{name:<14}skipped (not installed)')
+            continue
+        record = run_stage(name, func, state)
+        stages.append(record)
+        growth = f'{record["rss_growth_mb"]:>+12.1f} MB' if record['rss_growth_mb'] is not None else ''
+        print(f'{name:<14}{record["seconds"]:>10.2f}s{record["peak_rss_mb"]:>12.1f} MB{growth}')
+
+    query_results = state.get('query_results', {})
+    if len(query_results) == 2:
+        queries_match = all(results_match(query_results['pandas'][name], query_results['duckdb'][name])
+                            for name in query_results['pandas'])
+    else:
+        queries_match = None
+
+    return {
+        'size': size,
+        'rows': parse_size(size),
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'duplicate_rows_removed': state['duplicate_stats']['removed_rows'],
+        'query_backends_match': queries_match,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages), 4),
+        'stages': stages,
+    }
+
+
+def save_result(result, results_dir=RESULTS_DIR):
+    """
+    Write a benchmark result as JSON and return its path
+    """
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    commit = result['commit'].replace('+', '-')
+    path = os.path.join(results_dir, f'{commit}_{result["size"]}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def main():
+    """
+    Main function: benchmark the pipeline stages at the selected sizes
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic data')
+    parser.add_argument('--size', nargs='+', default=['100k'],
+                        help=f'dataset sizes: row counts or {list(SIZES)}')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='directory of the generated datasets')
+    parser.add_argument('--results-dir', default=RESULTS_DIR, help='directory of the JSON results')
+    args = parser.parse_args()
+
+    print('=' * 50)
+    print('Pipeline stage benchmarks')
+    print('=' * 50)
+
+    for size in args.size:
+        print(f'\n{size} rows ({parse_size(size)})')
+        print('-' * 30)
+        print(f'{"stage":<14}{"time":>11}{"peak RSS":>15}{"growth":>15}')
+        result = run_benchmark(size, args.data_dir)
+        path = save_result(result, args.results_dir)
+        if result['query_backends_match'] is not None:
+            print(f'Query backends agree: {result["query_backends_match"]}')
+        print(f'Total: {result["total_seconds"]:.2f}s, results saved to {path}')
+
+
+if __name__ == '__main__':
+    main()
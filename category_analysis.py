@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-category analysis: the sport_analysis.py suite for every main category
+
+The further cleaned table and the aggregation cube are loaded once and
+partitioned by main_category with a single groupby. For each selected
+category the products table, a text summary and the chart suite of
+sport_analysis.py (charts a-g) are written to
+output/category_analysis/<category>/. Categories are analyzed in parallel,
+one worker task per category partition, and the charts of all categories
+are then rendered together in one pool of worker processes.
+
+Usage:
+    python category_analysis.py                       # every main category
+    python category_analysis.py Sports Kitchen        # a subset
+    python category_analysis.py --min-products 500    # skip small categories
+"""
+
+import pandas as pd
+import argparse
+import io
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from columnar_store import FURTHER_CLEANED_PATH, load_table, save_table, table_exists
+from aggregation_cube import get_cube, rollup, key_counts
+from chart_rendering import CHART_CACHE_PATH, render_charts, print_timing_report
+from features import TIER_ORDER
+from summaries import write_category_summary
+from sport_analysis import SCATTER_MAX_POINTS, prepare_charts, price_band_sales
+
+# Root of the per-category output directories
+OUTPUT_ROOT = 'output/category_analysis'
+
+# Measures summarized for each category
+SUMMARY_MEASURES = ['price', 'boughtInLastMonth', 'stars', 'reviews']
+
+
+def category_slug(category):
+    """
+    Directory name for a main category
+    """
+    return re.sub(r'[^\w-]+', '_', str(category)).strip('_') or 'Unknown'
+
+
+def partition_by_category(df, categories=None):
+    """
+    (category, products) pairs from one groupby over main_category
+    """
+    if categories:
+        df = df[df['main_category'].isin(categories)]
+    for category, category_df in df.groupby('main_category', observed=True, sort=True):
+        yield str(category), category_df
+
+
+def analyze_category(category, category_df, category_cube, sales_chart='auto', log_density=False):
+    """
+    Write the products table and summary of one category and return its chart tasks
+    """
+    output_dir = f'{OUTPUT_ROOT}/{category_slug(category)}'
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    save_table(category_df, f'{output_dir}/products.parquet')
+
+    measure_stats = pd.DataFrame({measure: rollup(category_cube, 'main_category', measure).iloc[0]
+                                  for measure in SUMMARY_MEASURES}).T
+    write_category_summary(f'{output_dir}/summary.txt', category,
+                           product_count=len(category_df),
+                           bestseller_ratio=category_df['isBestSeller'].mean(),
+                           measure_stats=measure_stats,
+                           tier_dist=key_counts(category_cube, 'product_tier').reindex(TIER_ORDER, fill_value=0),
+                           price_band_sales=price_band_sales(category_df))
+
+    tasks = prepare_charts(category_df, category_cube, sales_chart=sales_chart, log_density=log_density,
+                           category=category, output_dir=output_dir)
+    for task in tasks:
+        task['name'] = f'{category}: {task["name"]}'
+    return tasks
+
+
+def analyze_category_task(task):
+    """
+    Worker: analyze one category partition
+
+    Returns the category, what the analysis printed (shown by the parent in
+    category order), its chart tasks and the error message, if any.
+    """
+    category, category_df, category_cube, options = task
+    printed = io.StringIO()
+    try:
+        with redirect_stdout(printed):
+            chart_tasks = analyze_category(category, category_df, category_cube, **options)
+        error = None
+    except Exception as e:
+        chart_tasks, error = [], str(e)
+    return category, printed.getvalue(), chart_tasks, error
+
+
+def add_arguments(parser):
+    """
+    Options of the category analysis (shared with analytics_cli.py)
+    """
+    parser.add_argument('categories', nargs='*', help='main categories to analyze (default: all)')
+    parser.add_argument('--min-products', type=int, default=1, help='skip categories with fewer products')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='category analysis and chart rendering processes')
+    parser.add_argument('--no-cache', action='store_true', help='re-render charts even if unchanged')
+    parser.add_argument('--sales-chart', choices=['auto', 'scatter', 'density'], default='auto',
+                        help=f'sales vs. rating chart type (auto: density above {SCATTER_MAX_POINTS} products)')
+    parser.add_argument('--log-density', action='store_true', help='log color scale for the density chart')
+    return parser
+
+
+def run(df=None, cube=None, categories=(), min_products=1, workers=None, use_cache=True, sales_chart='auto',
+        log_density=False):
+    """
+    Run the category analysis suite for the selected categories (default: all)
+
+    df and cube are the further cleaned data and its aggregation cube if
+    already in memory; otherwise they are read from disk.
+    """
+    print('=' * 50)
+    print('Starting Per-Category Product Analysis')
+    print('=' * 50)
+
+    # ==================== 1. Load data ====================
+    print('\n1. Loading further cleaned data')
+    print('-' * 30)
+
+    try:
+        if df is None:
+            if not table_exists(FURTHER_CLEANED_PATH):
+                print('Error: data file not found')
+                exit(1)
+            df = load_table(FURTHER_CLEANED_PATH)
+        if cube is None:
+            cube = get_cube(df)
+        print(f'Data loaded successfully, shape: {df.shape}')
+    except Exception as e:
+        print(f'Error reading file: {str(e)}')
+        exit(1)
+
+    available = set(df['main_category'].astype(str).unique())
+    unknown = [category for category in categories if category not in available]
+    if unknown:
+        print(f'Warning: unknown main categories ignored: {unknown}')
+
+    # ==================== 2. Per-category statistics ====================
+    print('\n2. Computing per-category statistics')
+    print('-' * 30)
+
+    start = time.perf_counter()
+    cube_parts = {str(category): part for category, part in cube.groupby('main_category', observed=True)}
+    options = {'sales_chart': sales_chart, 'log_density': log_density}
+    jobs = []
+    for category, category_df in partition_by_category(df, categories):
+        if len(category_df) < min_products:
+            print(f'\nSkipping {category}: {len(category_df)} products')
+            continue
+        jobs.append((category, category_df, cube_parts[category], options))
+
+    pool_workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if pool_workers > 1:
+        with ProcessPoolExecutor(max_workers=pool_workers) as executor:
+            outcomes = list(executor.map(analyze_category_task, jobs))
+    else:
+        outcomes = [analyze_category_task(job) for job in jobs]
+
+    tasks = []
+    analyzed = []
+    for (category, printed, chart_tasks, error), job in zip(outcomes, jobs):
+        print(f'\n--- {category} ({len(job[1])} products) ---')
+        print(printed, end='')
+        if error is None:
+            tasks.extend(chart_tasks)
+            analyzed.append(category)
+        else:
+            print(f'Error analyzing {category}: {error}')
+
+    if not analyzed:
+        print('Warning: no categories analyzed')
+        return
+    print(f'\nStatistics for {len(analyzed)} categories computed in {time.perf_counter() - start:.1f}s')
+
+    # ==================== 3. Render charts ====================
+    print('\n3. Rendering charts')
+    print('-' * 30)
+
+    cache_path = CHART_CACHE_PATH if use_cache else None
+    results, wall_seconds = render_charts(tasks, workers=workers, cache_path=cache_path)
+    print_timing_report(results, wall_seconds)
+
+    failed = [result['name'] for result in results if result['error']]
+    print(f'\nOutput written to {OUTPUT_ROOT}/<category>/ for: {", ".join(analyzed)}')
+    if failed:
+        print(f'Charts with errors: {failed}')
+
+
+def main():
+    """
+    Main function: run the category analysis suite for the selected categories
+    """
+    parser = argparse.ArgumentParser(description='Run the product analysis suite for each main category')
+    args = add_arguments(parser).parse_args()
+    run(categories=args.categories, min_products=args.min_products, workers=args.workers,
+        use_cache=not args.no_cache, sales_chart=args.sales_chart, log_density=args.log_density)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Category taxonomy resolver: categoryName -> main_category
+
+Resolution order for a category name:
+1. exact manual override ("overrides" in config/category_taxonomy.json)
+2. longest matching word prefix ("prefix_rules", e.g. "Sports Supplements")
+3. first word of the name (the original heuristic)
+
+Each distinct categoryName is resolved once and the result is broadcast to
+the rows through the categorical codes, so the cost depends on the number of
+categories, not the number of rows.
+"""
+
+import pandas as pd
+import numpy as np
+import json
+import os
+
+# Taxonomy configuration (shipped with the code, not with the data)
+TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'category_taxonomy.json')
+
+# Trie node key marking the end of a prefix rule
+_END = None
+
+# Resolvers already built, keyed by configuration path
+_resolvers = {}
+
+
+def build_prefix_trie(prefix_rules):
+    """
+    Word-level trie of prefix rules (case-insensitive)
+    """
+    trie = {}
+    for prefix, main_category in prefix_rules.items():
+        node = trie
+        for word in prefix.lower().split():
+            node = node.setdefault(word, {})
+        node[_END] = main_category
+    return trie
+
+
+def match_prefix(trie, words):
+    """
+    Main category of the longest prefix rule matching the words, or None
+    """
+    node = trie
+    match = None
+    for word in words:
+        node = node.get(word.lower())
+        if node is None:
+            break
+        if _END in node:
+            match = node[_END]
+    return match
+
+
+class CategoryResolver:
+    """
+    Resolves category names to main categories with a per-name cache
+    """
+
+    def __init__(self, overrides=None, prefix_rules=None, unknown_category='Unknown'):
+        self.overrides = overrides or {}
+        self.trie = build_prefix_trie(prefix_rules or {})
+        self.unknown_category = unknown_category
+        self.cache = {}
+
+    def resolve(self, name):
+        if name in self.cache:
+            return self.cache[name]
+
+        if not isinstance(name, str) or not name.split():
+            main_category = self.unknown_category
+        elif name in self.overrides:
+            main_category = self.overrides[name]
+        else:
+            words = name.split()
+            main_category = match_prefix(self.trie, words) or words[0]
+
+        self.cache[name] = main_category
+        return main_category
+
+    def mapping_table(self, names):
+        """
+        DataFrame of categoryName -> main_category for the given names
+        """
+        names = list(names)
+        return pd.DataFrame({'categoryName': names,
+                             'main_category': [self.resolve(name) for name in names]})
+
+
+def get_resolver(path=TAXONOMY_PATH):
+    """
+    Resolver for a taxonomy configuration (built once per path)
+    """
+    if path not in _resolvers:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        _resolvers[path] = CategoryResolver(overrides=config.get('overrides'),
+                                            prefix_rules=config.get('prefix_rules'),
+                                            unknown_category=config.get('unknown_category', 'Unknown'))
+    return _resolvers[path]
+
+
+def resolve_main_categories(category_names, resolver=None):
+    """
+    main_category for a Series of category names, as a categorical
+
+    Only the distinct names are resolved; rows are mapped through the codes.
+    """
+    if resolver is None:
+        resolver = get_resolver()
+
+    names = category_names
+    if not isinstance(names.dtype, pd.CategoricalDtype):
+        names = names.astype('category')
+
+    mains = [resolver.resolve(name) for name in names.cat.categories]
+    main_index = pd.Index(sorted(set(mains) | {resolver.unknown_category}))
+    lookup = main_index.get_indexer(mains)
+
+    codes = names.cat.codes.to_numpy()
+    unknown_code = main_index.get_loc(resolver.unknown_category)
+    if len(lookup) > 0:
+        main_codes = np.where(codes >= 0, lookup[np.maximum(codes, 0)], unknown_code)
+    else:
+        main_codes = np.full(len(codes), unknown_code)
+
+    result = pd.Categorical.from_codes(main_codes, categories=main_index)
+    return pd.Series(result, index=category_names.index).cat.remove_unused_categories()
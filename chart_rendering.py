@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Parallel chart rendering
+
+Scripts first compute the (small) data each chart needs, then hand a list of
+chart tasks to render_charts(), which draws them concurrently in worker
+processes on the non-interactive Agg backend. A task is a dict:
+
+    {'name': ..., 'render': module-level function(data, output_path),
+     'data': ..., 'output': 'output/.../chart.png'}
+
+An optional 'options' dict is passed to the render function as keyword
+arguments (e.g. the category named in a chart's title).
+
+Each chart's wall time, CPU time and peak memory are returned and added to
+the run report (instrumentation.py).
+
+Charts whose render function source, drawing helpers (CHART_HELPER_FILES),
+data and output path are unchanged since the last run (and whose PNG still
+exists) are skipped. Scripts running at the same time share the cache file:
+each run merges its own entries into the file's current contents and
+replaces it atomically.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from instrumentation import reset_peak_rss, peak_rss_mb, note_peak_rss, record_charts
+
+# Fingerprints of the charts rendered by previous runs
+CHART_CACHE_PATH = 'output/.chart_cache.json'
+
+# Modules next to this one whose drawing code every chart may use
+CHART_HELPER_FILES = ['chart_stats.py', 'chart_rendering.py']
+
+# Whether pyplot() has configured matplotlib in this process
+_pyplot_configured = False
+
+# Hash of CHART_HELPER_FILES, computed on first use
+_helper_digest = None
+
+
+def configure_matplotlib():
+    """
+    Select the Agg backend and the fonts used by all charts
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    # Set font to display Chinese labels if needed
+    plt.rcParams['font.sans-serif'] = ['SimHei']
+    plt.rcParams['axes.unicode_minus'] = False
+
+
+def pyplot():
+    """
+    matplotlib.pyplot for charts drawn in this process, configured on first use
+
+    matplotlib is slow to import, so scripts call this where they start
+    drawing rather than importing it at module load.
+    """
+    global _pyplot_configured
+    if not _pyplot_configured:
+        configure_matplotlib()
+        _pyplot_configured = True
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def helper_digest():
+    """
+    Hash of the drawing helper modules' source files
+    """
+    global _helper_digest
+    if _helper_digest is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in CHART_HELPER_FILES:
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(f.read())
+        _helper_digest = digest.hexdigest()
+    return _helper_digest
+
+
+def chart_fingerprint(task):
+    """
+    Hash of a chart's render code, drawing helpers, data, options and output path
+    """
+    digest = hashlib.sha256()
+    digest.update(task['name'].encode('utf-8'))
+    digest.update(task['output'].encode('utf-8'))
+    digest.update(inspect.getsource(task['render']).encode('utf-8'))
+    digest.update(helper_digest().encode('utf-8'))
+    digest.update(pickle.dumps(task['data'], protocol=4))
+    digest.update(json.dumps(task.get('options', {}), sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_chart(task):
+    """
+    Worker: render one chart, timing it and measuring its peak memory
+    """
+    note_peak_rss(peak_rss_mb())
+    reset_peak_rss()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        directory = os.path.dirname(task['output'])
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        task['render'](task['data'], task['output'], **task.get('options', {}))
+        error = None
+    except Exception as e:
+        error = str(e)
+    seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+    peak = peak_rss_mb()
+    note_peak_rss(peak)
+    return {
+        'name': task['name'],
+        'output': task['output'],
+        'seconds': seconds,
+        'cpu_seconds': cpu_seconds,
+        'peak_rss_mb': round(peak, 1),
+        'pid': os.getpid(),
+        'error': error,
+    }
+
+
+def _load_chart_cache(cache_path):
+    """
+    Read the chart fingerprint cache (empty if missing or unreadable)
+    """
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+    return {}
+
+
+def _save_chart_cache(updates, cache_path):
+    """
+    Merge this run's fingerprints into the cache file and replace it atomically
+
+    updates maps output paths to fingerprints, or to None for charts whose
+    entry must be dropped. The file is re-read just before writing, so the
+    entries other scripts saved since this run loaded it are kept.
+    """
+    directory = os.path.dirname(cache_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    cache = _load_chart_cache(cache_path)
+    for output, fingerprint in updates.items():
+        if fingerprint is None:
+            cache.pop(output, None)
+        else:
+            cache[output] = fingerprint
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(temp_path, cache_path)
+
+
+def render_charts(tasks, workers=None, cache_path=CHART_CACHE_PATH):
+    """
+    Render chart tasks in a process pool
+
+    Returns one result dict per chart (in task order) and the wall time.
+    Pass cache_path=None to always re-render.
+    """
+    start = time.perf_counter()
+    cache = _load_chart_cache(cache_path)
+
+    results = []
+    pending = []
+    fingerprints = {}
+    for task in tasks:
+        fingerprint = chart_fingerprint(task)
+        fingerprints[task['output']] = fingerprint
+        if cache.get(task['output']) == fingerprint and os.path.exists(task['output']):
+            results.append({'name': task['name'], 'output': task['output'], 'seconds': 0.0,
+                            'cpu_seconds': 0.0, 'peak_rss_mb': None, 'pid': None, 'error': None,
+                            'cached': True})
+        else:
+            pending.append(task)
+
+    if pending:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=configure_matplotlib) as executor:
+                rendered = list(executor.map(render_chart, pending))
+        else:
+            configure_matplotlib()
+            rendered = [render_chart(task) for task in pending]
+
+        updates = {}
+        for result in rendered:
+            result['cached'] = False
+            updates[result['output']] = fingerprints[result['output']] if result['error'] is None else None
+        results.extend(rendered)
+
+        if cache_path:
+            _save_chart_cache(updates, cache_path)
+
+    order = {task['output']: i for i, task in enumerate(tasks)}
+    results.sort(key=lambda result: order[result['output']])
+    record_charts(results)
+    return results, time.perf_counter() - start
+
+
+def print_timing_report(results, wall_seconds):
+    """
+    Print per-chart render times and the overall wall time
+    """
+    width = max([32] + [len(result['name']) + 2 for result in results])
+    print('\nChart rendering report:')
+    print(f'{"Chart":<{width}}{"Wall (s)":>10}{"CPU (s)":>10}{"Worker":>10}  Status')
+    for result in results:
+        if result['cached']:
+            status = 'cached'
+        elif result['error']:
+            status = f'error: {result["error"]}'
+        else:
+            status = 'rendered'
+        worker = result['pid'] if result['pid'] is not None else '-'
+        print(f'{result["name"]:<{width}}{result["seconds"]:>10.2f}{result["cpu_seconds"]:>10.2f}{worker:>10}  {status}')
+
+    total = sum(result['seconds'] for result in results)
+    print(f'Sum of chart times: {total:.2f}s, wall time: {wall_seconds:.2f}s')
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pre-aggregated statistics for histograms and boxplots
+
+sns.histplot and sns.boxplot bin and sort the full column every time a chart
+is drawn. The functions here reduce a column once to the small arrays those
+charts actually show - histogram bin counts, per-group boxplot summaries and
+2D density grids - and draw the charts from them with the same styling
+seaborn uses.
+"""
+
+import numpy as np
+import pandas as pd
+from colorsys import rgb_to_hls
+
+# Whisker reach in IQRs (seaborn / matplotlib default)
+WHIS = 1.5
+
+
+def histogram(values, bins=50):
+    """
+    Bin counts and edges of a column (NaN values are ignored)
+    """
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins)
+    return {'counts': counts, 'edges': edges}
+
+
+def box_stats(values, groups=None, whis=WHIS):
+    """
+    Boxplot summary of a column, per group
+
+    Returns a list of dicts in the format of matplotlib's boxplot_stats()
+    (q1, med, q3, whislo, whishi, fliers, ...), one per group in sorted group
+    order, each with the group value as 'label'. The values are sorted once
+    by (group, value); quartiles are then read off the sorted array at each
+    group's offsets, and whiskers found by binary search within the group.
+    """
+    values = np.asarray(values, dtype='float64')
+    if groups is None:
+        codes = np.zeros(len(values), dtype='int64')
+        labels = [None]
+    else:
+        codes, labels = pd.factorize(pd.Series(groups), sort=True)
+        labels = list(labels)
+
+    keep = ~np.isnan(values) & (codes >= 0)
+    values = values[keep]
+    codes = codes[keep]
+    order = np.lexsort((values, codes))
+    values = values[order]
+    codes = codes[order]
+
+    group_ids = np.arange(len(labels))
+    starts = np.searchsorted(codes, group_ids, side='left')
+    ends = np.searchsorted(codes, group_ids, side='right')
+    counts = ends - starts
+
+    def quantile(p):
+        # Linear interpolation between closest ranks, as np.percentile
+        position = (counts - 1) * p
+        lower = np.floor(position).astype('int64')
+        fraction = position - lower
+        lo = values[np.minimum(starts + lower, len(values) - 1)]
+        hi = values[np.minimum(starts + lower + 1, np.maximum(ends - 1, 0))]
+        return lo + (hi - lo) * fraction
+
+    if len(values):
+        q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+        sums = np.bincount(codes, weights=values, minlength=len(labels))
+    else:
+        q1 = med = q3 = sums = np.zeros(len(labels))
+
+    stats = []
+    for i, label in enumerate(labels):
+        group = values[starts[i]:ends[i]]
+        if len(group) == 0:
+            stats.append({'label': label, 'mean': np.nan, 'iqr': np.nan, 'cilo': np.nan, 'cihi': np.nan,
+                          'whishi': np.nan, 'whislo': np.nan, 'fliers': np.array([]),
+                          'q1': np.nan, 'med': np.nan, 'q3': np.nan})
+            continue
+
+        iqr = q3[i] - q1[i]
+        low_fence = q1[i] - whis * iqr
+        high_fence = q3[i] + whis * iqr
+
+        # Whiskers: most extreme values still inside the fences
+        lo_index = np.searchsorted(group, low_fence, side='left')
+        hi_index = np.searchsorted(group, high_fence, side='right') - 1
+        whislo = group[lo_index] if lo_index < len(group) and group[lo_index] <= q1[i] else q1[i]
+        whishi = group[hi_index] if hi_index >= 0 and group[hi_index] >= q3[i] else q3[i]
+
+        notch = 1.57 * iqr / np.sqrt(len(group))
+        stats.append({
+            'label': label,
+            'mean': sums[i] / len(group),
+            'iqr': iqr,
+            'cilo': med[i] - notch,
+            'cihi': med[i] + notch,
+            'whislo': whislo,
+            'whishi': whishi,
+            'fliers': np.concatenate([group[group < whislo], group[group > whishi]]),
+            'q1': q1[i],
+            'med': med[i],
+            'q3': q3[i],
+        })
+    return stats
+
+
+def density_grid(x, y, bins=50, range=None):
+    """
+    2D histogram of point counts (rows with a NaN coordinate are ignored)
+
+    Replaces a scatter plot of every row: the grid size, not the row count,
+    determines the cost of drawing it.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    keep = ~np.isnan(x) & ~np.isnan(y)
+    counts, x_edges, y_edges = np.histogram2d(x[keep], y[keep], bins=bins, range=range)
+    return {'counts': counts, 'x_edges': x_edges, 'y_edges': y_edges}
+
+
+def plot_histogram(hist, ax=None):
+    """
+    Draw a histogram from precomputed bin counts
+    """
+    import seaborn as sns
+    edges = hist['edges']
+    return sns.histplot(x=edges[:-1], weights=hist['counts'], bins=len(edges) - 1,
+                        binrange=(edges[0], edges[-1]), ax=ax)
+
+
+def plot_boxes(stats, ax=None, orient='x', color='C0', width=0.8, saturation=0.75):
+    """
+    Draw boxplots from precomputed summaries, styled like sns.boxplot
+
+    orient='x' draws vertical boxes along the x axis (one per group);
+    orient='y' draws horizontal boxes.
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcolors
+    import seaborn as sns
+
+    if ax is None:
+        ax = plt.gca()
+
+    # Desaturated box fill, lines a gray derived from its lightness
+    facecolor = sns.desaturate(color, saturation)
+    lum = rgb_to_hls(*mcolors.to_rgb(facecolor))[1] * 0.6
+    linecolor = (lum, lum, lum)
+
+    positions = np.arange(len(stats))
+    ax.bxp(stats, positions=positions, widths=width, capwidths=width / 2,
+           patch_artist=True, vert=(orient == 'x'), manage_ticks=False,
+           boxprops={'facecolor': facecolor, 'edgecolor': linecolor},
+           medianprops={'color': linecolor, 'solid_capstyle': 'butt'},
+           whiskerprops={'color': linecolor, 'solid_capstyle': 'butt'},
+           flierprops={'markeredgecolor': linecolor},
+           capprops={'color': linecolor})
+
+    labels = ['' if stat['label'] is None else str(stat['label']) for stat in stats]
+    axis = ax.xaxis if orient == 'x' else ax.yaxis
+    if orient == 'x':
+        ax.set_xticks(positions)
+        ax.set_xticklabels(labels)
+        ax.set_xlim(-0.5, len(stats) - 0.5)
+    else:
+        ax.set_yticks(positions)
+        ax.set_yticklabels(labels)
+        ax.set_ylim(len(stats) - 0.5, -0.5)
+    axis.grid(False)
+    return ax
+
+
+def plot_density(grid, ax=None, log=False, cmap='viridis', label='Number of Products'):
+    """
+    Draw a density grid as a rasterized color mesh with a colorbar
+
+    Empty cells are left blank; log=True uses a logarithmic color scale so
+    sparse cells stay visible next to dense ones.
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcolors
+
+    if ax is None:
+        ax = plt.gca()
+
+    counts = np.ma.masked_equal(grid['counts'].T, 0)
+    norm = mcolors.LogNorm() if log and counts.count() else None
+    mesh = ax.pcolormesh(grid['x_edges'], grid['y_edges'], counts, cmap=cmap, norm=norm, rasterized=True)
+    ax.figure.colorbar(mesh, ax=ax, label=label)
+    return mesh
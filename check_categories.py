@@ -1,16 +1,45 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import pandas as pd
+from columnar_store import FURTHER_CLEANED_PATH, load_table
 
-# Read the data
-df = pd.read_csv('output/amz_uk_further_cleaned.csv')
 
-# Print main category statistics
-print('Main Category Statistics:')
-print(df['main_category'].value_counts())
+def run(df=None):
+    """
+    Print the main categories and the category names grouped under each
 
-# Print all unique main category names
-print('\nAll Unique Main Categories:')
-for category in sorted(df['main_category'].unique()):
-    print(f'- {category}')
+    df is the further cleaned data if already in memory; otherwise it is read from disk.
+    """
+    # Read the data (only the columns we need)
+    if df is None:
+        df = load_table(FURTHER_CLEANED_PATH, columns=['categoryName', 'main_category'])
+
+    # Print main category statistics
+    print('Main Category Statistics:')
+    print(df['main_category'].value_counts())
+
+    # Print all unique main category names
+    print('\nAll Unique Main Categories:')
+    for category in sorted(df['main_category'].unique()):
+        print(f'- {category}')
+
+    # Print the category names grouped under each main category, to review the
+    # taxonomy and add overrides/prefix rules in config/category_taxonomy.json
+    print('\nCategory Names per Main Category:')
+    members = df.groupby(['main_category', 'categoryName'], observed=True).size()
+    for category in sorted(members.index.get_level_values(0).unique()):
+        names = members.loc[category].sort_values(ascending=False)
+        print(f'{category} ({len(names)} categories):')
+        for name, count in names.items():
+            print(f'    {name}: {count}')
+
+
+def main():
+    """
+    Main function: review the main category taxonomy
+    """
+    run()
+
+
+if __name__ == '__main__':
+    main()
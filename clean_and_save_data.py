@@ -3,136 +3,162 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
-
-# Create output directory
-if not os.path.exists('output'):
-    os.makedirs('output')
-
-# Configure font to support Chinese labels if needed
-plt.rcParams['font.sans-serif'] = ['SimHei']  # For displaying Chinese characters correctly
-plt.rcParams['axes.unicode_minus'] = False    # For displaying negative signs correctly
-
-print('=' * 50)
-print('Starting data cleaning and saving')
-print('=' * 50)
-
-# ==================== 1. Read CSV File ====================
-print('\n1. Reading CSV File')
-print('-' * 30)
-file_path = 'archive/amz_uk_processed_data.csv'
-try:
-    df = pd.read_csv(file_path)
-    print(f'Successfully read file: {file_path}')
+from data_loader import RAW_DATA_PATH, URL_COLUMNS, load_product_data, read_header
+from columnar_store import CLEANED_DATA_PATH, save_table
+from summaries import write_data_analysis_summary
+from asin_dedup import DEFAULT_POLICY, dedupe_frame, print_duplicate_stats
+from instrumentation import begin_stage, end_stage, set_rows
+from chart_stats import histogram, box_stats, plot_histogram, plot_boxes
+from chart_rendering import pyplot
+
+
+def run(df=None, file_path=RAW_DATA_PATH):
+    """
+    De-duplicate and save the raw product data, and chart prices and categories
+
+    df is the raw data if already in memory; otherwise it is read from
+    file_path. Returns the cleaned DataFrame, so later stages can use it
+    without reading it back.
+    """
+    # Create output directory
+    if not os.path.exists('output'):
+        os.makedirs('output')
+
+    print('=' * 50)
+    print('Starting data cleaning and saving')
+    print('=' * 50)
+
+    # ==================== 1. Read CSV File ====================
+    print('\n1. Reading CSV File')
+    print('-' * 30)
+    begin_stage('read_csv')
+    if df is None:
+        try:
+            df = load_product_data(file_path)
+            print(f'Successfully read file: {file_path}')
+        except Exception as e:
+            print(f'Error reading file: {e}')
+            exit(1)
     print(f'Original data shape: {df.shape}')
-except Exception as e:
-    print(f'Error reading file: {e}')
-    exit(1)
-
-# ==================== 2. Drop Unnecessary Columns and Save ====================
-print('\n2. Dropping Unnecessary Columns')
-print('-' * 30)
-print(f'Columns before dropping: {df.columns.tolist()}')
-df_cleaned = df.drop(['imgUrl', 'productURL'], axis=1)
-print(f'Columns after dropping: {df_cleaned.columns.tolist()}')
-print(f'Data shape after cleaning: {df_cleaned.shape}')
-
-# Save cleaned data
-cleaned_file_path = 'output/amz_uk_cleaned_data.csv'
-df_cleaned.to_csv(cleaned_file_path, index=False)
-print(f'Saved cleaned data to: {cleaned_file_path}')
-
-# ==================== 3. Price Analysis and Visualization ====================
-print('\n3. Price Distribution Analysis')
-print('-' * 30)
-price_stats = df_cleaned['price'].describe()
-print(f'Price Statistics:\n{price_stats}')
-
-# Count extreme values
-low_price = df_cleaned[df_cleaned['price'] < 1]
-high_price = df_cleaned[df_cleaned['price'] > 1000]
-print(f'Number of products with price < 1: {len(low_price)}')
-print(f'Number of products with price > 1000: {len(high_price)}')
-
-# Plot histogram of prices (excluding outliers)
-plt.figure(figsize=(12, 6))
-sns.histplot(df_cleaned[(df_cleaned['price'] > 0) & (df_cleaned['price'] <= 1000)]['price'], bins=50)
-plt.title('Product Price Distribution Histogram (£0-1000)')
-plt.xlabel('Price (£)')
-plt.ylabel('Number of Products')
-plt.savefig('output/price_distribution.png')
-plt.close()
-
-# Plot boxplot of prices (excluding extreme values)
-plt.figure(figsize=(10, 6))
-sns.boxplot(x=df_cleaned[(df_cleaned['price'] > 0) & (df_cleaned['price'] <= 500)]['price'])
-plt.title('Product Price Boxplot (£0-500)')
-plt.xlabel('Price (£)')
-plt.savefig('output/price_boxplot.png')
-plt.close()
-
-# ==================== 4. Category Analysis and Visualization ====================
-print('\n4. Category Distribution Analysis')
-print('-' * 30)
-category_counts = df_cleaned['categoryName'].value_counts()
-print(f'Total number of categories: {len(category_counts)}')
-print('\nTop 20 categories and product counts:')
-print(category_counts.head(20))
-
-# Bar chart for top 20 categories
-plt.figure(figsize=(15, 10))
-category_counts.head(20).plot(kind='barh')
-plt.title('Top 20 Product Categories')
-plt.xlabel('Number of Products')
-plt.ylabel('Category Name')
-plt.tight_layout()
-plt.savefig('output/top20_categories.png')
-plt.close()
-
-# Pie chart for top 20 categories + others
-plt.figure(figsize=(12, 12))
-others = category_counts.iloc[20:].sum()
-pie_data = pd.concat([category_counts.head(20), pd.Series([others], index=['Other Categories'])])
-plt.pie(pie_data, labels=pie_data.index, autopct='%1.1f%%', startangle=90)
-plt.axis('equal')
-plt.title('Category Proportion (Top 20 + Others)')
-plt.tight_layout()
-plt.savefig('output/category_pie_chart.png')
-plt.close()
-
-# ==================== 5. ASIN Duplication Check ====================
-print('\n5. ASIN Duplication Check')
-print('-' * 30)
-duplicated_asin = df_cleaned[df_cleaned.duplicated('asin', keep=False)]
-print(f'Number of duplicated ASIN entries: {len(duplicated_asin)}')
-print(f'Number of unique duplicated ASINs: {duplicated_asin["asin"].nunique()}')
-
-# ==================== 6. Save Summary of Analysis ====================
-print('\n6. Saving Summary of Analysis')
-print('-' * 30)
-
-# Create summary file
-with open('output/data_analysis_summary.txt', 'w', encoding='utf-8') as f:
-    f.write('# Amazon UK Product Data Analysis Summary\n\n')
-    f.write(f'## 1. Data Overview\n')
-    f.write(f'- Total number of products: {df_cleaned.shape[0]}\n')
-    f.write(f'- Total number of categories: {len(category_counts)}\n\n')
-    
-    f.write(f'## 2. Price Analysis\n')
-    f.write(f'- Average price: £{price_stats["mean"]:.2f}\n')
-    f.write(f'- Median price: £{price_stats["50%"]:.2f}\n')
-    f.write(f'- Minimum price: £{price_stats["min"]:.2f}\n')
-    f.write(f'- Maximum price: £{price_stats["max"]:.2f}\n')
-    f.write(f'- Number of products with price < 1: {len(low_price)}\n')
-    f.write(f'- Number of products with price > 1000: {len(high_price)}\n\n')
-    
-    f.write(f'## 3. Top Categories\n')
-    for i, (cat, count) in enumerate(category_counts.head(10).items()):
-        f.write(f'{i+1}. {cat}: {count} items\n')
-
-print('Saved summary to output/data_analysis_summary.txt')
-
-print('\nData cleaning and analysis completed')
-print('=' * 50)
+    set_rows(len(df))
+
+    # ==================== 2. Drop Unnecessary Columns and Save ====================
+    print('\n2. Dropping Unnecessary Columns')
+    print('-' * 30)
+    print(f'Columns in file: {read_header(file_path)}')
+    print(f'Columns skipped at load time: {URL_COLUMNS}')
+    print(f'Columns after dropping: {df.columns.tolist()}')
+
+    # Keep one row per ASIN so duplicates do not inflate downstream sums
+    begin_stage('dedupe', rows=len(df))
+    df_cleaned, duplicate_stats = dedupe_frame(df, DEFAULT_POLICY)
+    print(f'Duplicate ASIN rows removed: {duplicate_stats["removed_rows"]} '
+          f'(survivor policy: {" > ".join(DEFAULT_POLICY)})')
+    print(f'Data shape after cleaning: {df_cleaned.shape}')
+
+    # Save cleaned data
+    begin_stage('save', rows=len(df_cleaned))
+    cleaned_file_path = CLEANED_DATA_PATH
+    save_table(df_cleaned, cleaned_file_path)
+    print(f'Saved cleaned data to: {cleaned_file_path}')
+
+    # ==================== 3. Price Analysis and Visualization ====================
+    print('\n3. Price Distribution Analysis')
+    print('-' * 30)
+    begin_stage('price_stats', rows=len(df_cleaned))
+    price_stats = df_cleaned['price'].describe()
+    print(f'Price Statistics:\n{price_stats}')
+
+    # Count extreme values
+    low_price = df_cleaned[df_cleaned['price'] < 1]
+    high_price = df_cleaned[df_cleaned['price'] > 1000]
+    print(f'Number of products with price < 1: {len(low_price)}')
+    print(f'Number of products with price > 1000: {len(high_price)}')
+
+    # Plot histogram of prices (excluding outliers)
+    begin_stage('price_charts', rows=len(df_cleaned))
+    plt = pyplot()
+    plt.figure(figsize=(12, 6))
+    plot_histogram(histogram(df_cleaned.loc[(df_cleaned['price'] > 0) & (df_cleaned['price'] <= 1000), 'price'], bins=50))
+    plt.title('Product Price Distribution Histogram (£0-1000)')
+    plt.xlabel('Price (£)')
+    plt.ylabel('Number of Products')
+    plt.savefig('output/price_distribution.png')
+    plt.close()
+
+    # Plot boxplot of prices (excluding extreme values)
+    plt.figure(figsize=(10, 6))
+    plot_boxes(box_stats(df_cleaned.loc[(df_cleaned['price'] > 0) & (df_cleaned['price'] <= 500), 'price']), orient='y')
+    plt.title('Product Price Boxplot (£0-500)')
+    plt.xlabel('Price (£)')
+    plt.savefig('output/price_boxplot.png')
+    plt.close()
+
+    # ==================== 4. Category Analysis and Visualization ====================
+    print('\n4. Category Distribution Analysis')
+    print('-' * 30)
+    begin_stage('category_counts', rows=len(df_cleaned))
+    category_counts = df_cleaned['categoryName'].value_counts()
+    print(f'Total number of categories: {len(category_counts)}')
+    print('\nTop 20 categories and product counts:')
+    print(category_counts.head(20))
+
+    # Bar chart for top 20 categories
+    begin_stage('category_charts')
+    plt.figure(figsize=(15, 10))
+    category_counts.head(20).plot(kind='barh')
+    plt.title('Top 20 Product Categories')
+    plt.xlabel('Number of Products')
+    plt.ylabel('Category Name')
+    plt.tight_layout()
+    plt.savefig('output/top20_categories.png')
+    plt.close()
+
+    # Pie chart for top 20 categories + others
+    plt.figure(figsize=(12, 12))
+    others = category_counts.iloc[20:].sum()
+    pie_data = pd.concat([category_counts.head(20), pd.Series([others], index=['Other Categories'])])
+    plt.pie(pie_data, labels=pie_data.index, autopct='%1.1f%%', startangle=90)
+    plt.axis('equal')
+    plt.title('Category Proportion (Top 20 + Others)')
+    plt.tight_layout()
+    plt.savefig('output/category_pie_chart.png')
+    plt.close()
+
+    # ==================== 5. ASIN Duplication Check ====================
+    print('\n5. ASIN Duplication Check')
+    print('-' * 30)
+    print_duplicate_stats(duplicate_stats)
+
+    # ==================== 6. Save Summary of Analysis ====================
+    print('\n6. Saving Summary of Analysis')
+    print('-' * 30)
+
+    # Create summary file
+    begin_stage('summary')
+    write_data_analysis_summary('output/data_analysis_summary.txt',
+                                total_products=df_cleaned.shape[0],
+                                category_counts=category_counts,
+                                price_stats=price_stats,
+                                low_price_count=len(low_price),
+                                high_price_count=len(high_price))
+
+    print('Saved summary to output/data_analysis_summary.txt')
+    end_stage()
+
+    print('\nData cleaning and analysis completed')
+    print('=' * 50)
+    # Match the table saved above (the survivors keep their original row labels)
+    return df_cleaned.reset_index(drop=True)
+
+
+def main():
+    """
+    Main function: clean the raw CSV file
+    """
+    run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Memory-mapped column cache for the analysis scripts
+
+The numeric columns of a table (price, stars, reviews, boughtInLastMonth,
+isBestSeller) are stored as one .npy file each, and the categorical columns
+(categoryName, main_category, product_tier, price_range) as their integer
+codes plus the category labels in manifest.json. The cache of a table lives
+next to it (output/amz_uk_further_cleaned.columns/ for
+output/amz_uk_further_cleaned.parquet).
+
+Opening the cache maps the files instead of parsing them. With pandas
+copy-on-write (the default from pandas 3.0) the returned DataFrame reads the
+arrays in place, so startup does not depend on the table size and several
+processes reading the same cache share the OS page cache instead of each
+holding a private copy; the arrays are read-only and pandas copies them on
+write. Older pandas consolidates numeric columns of the same dtype into one
+block when building the DataFrame, which copies those columns.
+
+The manifest records the size and modification time of the source table; a
+cache that no longer matches is rebuilt from the table on the next load.
+"""
+
+import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+import json
+import os
+import sys
+import time
+from columnar_store import FURTHER_CLEANED_PATH, load_table
+
+# Columns stored as plain arrays
+NUMERIC_COLUMNS = ['price', 'stars', 'reviews', 'boughtInLastMonth', 'isBestSeller']
+
+# Columns stored as categorical codes
+CATEGORICAL_COLUMNS = ['categoryName', 'main_category', 'product_tier', 'price_range']
+
+CACHED_COLUMNS = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS
+
+# Cache layout version (a manifest with another version is rebuilt)
+CACHE_VERSION = 1
+
+
+def cache_dir_for(path):
+    """
+    Cache directory of a table
+    """
+    return os.path.splitext(path)[0] + '.columns'
+
+
+def source_signature(path):
+    """
+    Size and modification time identifying the current contents of a table
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_array(directory, name, values):
+    # Write under a temporary name and rename, so processes that still map
+    # the previous file keep reading it intact
+    path = os.path.join(directory, name)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        np.save(f, values)
+    os.replace(temp_path, path)
+
+
+def build_column_cache(df, source_path, cache_dir=None):
+    """
+    Write the cacheable columns of df as the cache of source_path
+
+    Returns the manifest. Columns of df outside CACHED_COLUMNS are ignored.
+    """
+    cache_dir = cache_dir or cache_dir_for(source_path)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    columns = {}
+    for col in NUMERIC_COLUMNS:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            # Nullable integers/booleans become float64 with NaN for missing values
+            values = series.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            values = series.to_numpy()
+        save_array(cache_dir, f'{col}.npy', values)
+        columns[col] = {'kind': 'numeric', 'dtype': str(values.dtype)}
+
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns:
+            continue
+        series = df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype('category')
+        save_array(cache_dir, f'{col}.codes.npy', series.cat.codes.to_numpy())
+        columns[col] = {'kind': 'categorical',
+                        'categories': series.cat.categories.tolist(),
+                        'ordered': bool(series.cat.ordered)}
+
+    manifest = {'version': CACHE_VERSION, 'source': source_signature(source_path),
+                'rows': len(df), 'columns': columns}
+    save_manifest(cache_dir, manifest)
+    return manifest
+
+
+def save_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, 'manifest.json')
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def read_manifest(source_path, cache_dir=None):
+    """
+    Manifest of the cache of source_path, or None if it is missing or stale
+    """
+    path = os.path.join(cache_dir or cache_dir_for(source_path), 'manifest.json')
+    if not os.path.exists(path) or not os.path.exists(source_path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION or manifest.get('source') != source_signature(source_path):
+        return None
+    return manifest
+
+
+def open_column_cache(manifest, columns, cache_dir):
+    """
+    DataFrame over the memory-mapped arrays of the requested columns
+    """
+    data = {}
+    for col in columns:
+        spec = manifest['columns'][col]
+        if spec['kind'] == 'numeric':
+            data[col] = np.load(os.path.join(cache_dir, f'{col}.npy'), mmap_mode='r')
+        else:
+            codes = np.load(os.path.join(cache_dir, f'{col}.codes.npy'), mmap_mode='r')
+            dtype = pd.CategoricalDtype(spec['categories'], ordered=spec['ordered'])
+            data[col] = pd.Categorical.from_codes(codes, dtype=dtype, validate=False)
+    return pd.DataFrame(data, copy=False)
+
+
+def load_columns(path=FURTHER_CLEANED_PATH, columns=None, rebuild=True):
+    """
+    Read columns of a table through its column cache when possible
+
+    If every requested column is cacheable the table is served from the
+    memory-mapped cache, which is (re)built from the table first when it is
+    missing or stale. Other requests, and tables whose cache cannot be used,
+    fall back to load_table().
+    """
+    columns = list(columns) if columns is not None else None
+    if columns is None or not set(columns) <= set(CACHED_COLUMNS) or not os.path.exists(path):
+        return load_table(path, columns=columns)
+
+    cache_dir = cache_dir_for(path)
+    manifest = read_manifest(path, cache_dir)
+    if manifest is None or not set(columns) <= set(manifest['columns']):
+        if not rebuild:
+            return load_table(path, columns=columns)
+        source_columns = pq.read_schema(path).names
+        cached = [col for col in CACHED_COLUMNS if col in source_columns]
+        if not set(columns) <= set(cached):
+            return load_table(path, columns=columns)
+        manifest = build_column_cache(load_table(path, columns=cached), path, cache_dir)
+    return open_column_cache(manifest, columns, cache_dir)
+
+
+def main():
+    """
+    Build the column cache of a table and compare its load time with Parquet
+    """
+    path = sys.argv[1] if len(sys.argv) > 1 else FURTHER_CLEANED_PATH
+
+    print('=' * 50)
+    print('Building column cache')
+    print('=' * 50)
+
+    try:
+        df = load_table(path)
+    except Exception as e:
+        print(f'Error reading file: {e}')
+        return
+
+    cached = [col for col in CACHED_COLUMNS if col in df.columns]
+    start = time.perf_counter()
+    build_column_cache(df, path)
+    print(f'Cached {len(cached)} columns of {path} in {cache_dir_for(path)} '
+          f'({time.perf_counter() - start:.2f}s)')
+
+    start = time.perf_counter()
+    load_table(path, columns=cached)
+    parquet_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_columns(path, cached)
+    cache_seconds = time.perf_counter() - start
+
+    print(f'\n{"":<20}{"Load time (s)":>16}')
+    print(f'{"Parquet":<20}{parquet_seconds:>16.4f}')
+    print(f'{"Column cache":<20}{cache_seconds:>16.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Columnar (Parquet) storage for the intermediate data passed between stages
+
+Parquet keeps dtypes (including the ordered price_range and product_tier
+categoricals) and lets readers load only the columns they need.
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+from data_loader import load_product_data, read_header
+
+# Intermediate tables written by each stage
+CLEANED_DATA_PATH = 'output/amz_uk_cleaned_data.parquet'
+FURTHER_CLEANED_PATH = 'output/amz_uk_further_cleaned.parquet'
+SPORT_PRODUCTS_PATH = 'output/sport_analysis/sport_products.parquet'
+
+# Partitioned dataset written by merge_excel_files.py (one partition per source file)
+MERGED_DATASET_PATH = 'output/merged_data'
+
+
+def legacy_csv_path(path):
+    """
+    CSV file name that older runs of the pipeline wrote for a table
+    """
+    return os.path.splitext(path)[0] + '.csv'
+
+
+def table_exists(path):
+    """
+    Check whether a table is available as Parquet or as a legacy CSV
+    """
+    return os.path.exists(path) or os.path.exists(legacy_csv_path(path))
+
+
+def arrow_schema(df):
+    """
+    Arrow schema of a DataFrame with int32 dictionary indices for categoricals
+
+    Fixing the index width lets tables whose category sets differ share one
+    schema (appended chunks, partitions of one dataset).
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            field = pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type, field.type.ordered))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def save_table(df, path):
+    """
+    Write a DataFrame as a Parquet table, creating the directory if needed
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    df.to_parquet(path, index=False)
+
+
+def load_table(path, columns=None, filters=None):
+    """
+    Read a table, optionally projecting to a subset of columns
+
+    filters is a list of (column, '==' or 'in', value) conditions; Parquet
+    skips non-matching rows while reading. Falls back to the CSV written by
+    older runs when no Parquet file exists.
+    """
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    csv_path = legacy_csv_path(path)
+    if os.path.exists(csv_path):
+        print(f'Note: {path} not found, reading legacy CSV {csv_path}')
+        if columns is None:
+            columns = read_header(csv_path)
+        df = load_product_data(csv_path, columns=columns)
+        for col, op, value in filters or []:
+            mask = df[col].isin(value) if op == 'in' else df[col] == value
+            df = df[mask].reset_index(drop=True)
+        return df
+
+    raise FileNotFoundError(f'Table not found: {path}')
+
+
+class ChunkedTableWriter:
+    """
+    Append DataFrame chunks to a single Parquet table
+
+    The schema is taken from the first chunk unless one is given. Categorical
+    columns are stored with int32 dictionary indices, so chunks whose
+    category sets differ can still be appended to the same file.
+    """
+
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.schema = schema
+        self.writer = None
+        self.rows = 0
+
+    def write(self, df):
+        if self.writer is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            if self.schema is None:
+                self.schema = arrow_schema(df)
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Batched correlation engine: ratings, reviews and price vs. monthly sales
+
+Pearson and Spearman correlations are computed for every segment
+(main_category x product_tier x sales band by default) at once instead of
+calling scipy per group:
+- segments are factorized once; per-segment sums of centered products are
+  accumulated with np.bincount, which gives Pearson's r for all segments
+- Spearman's rho is Pearson's r of within-segment ranks (average ties, as
+  scipy); the ranks of the target column are computed once and shared by
+  every metric
+- p-values come from the t distribution with n - 2 degrees of freedom,
+  vectorized over segments (the test scipy uses)
+
+Bootstrap confidence intervals resample each segment in batches of
+replicates (ranking a whole batch in one call) and run segments in
+parallel worker processes. Only products with a rating (stars > 0) are
+used, as in sport_advanced_analysis.py.
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from columnar_store import FURTHER_CLEANED_PATH, load_table
+
+# Segment keys, correlated metrics and the target they are correlated with
+SEGMENT_KEYS = ['main_category', 'product_tier', 'sales_band']
+METRICS = ['stars', 'reviews', 'price']
+TARGET = 'boughtInLastMonth'
+
+# Monthly sales separating the 'normal' and 'high' sales bands
+HIGH_SALES_THRESHOLD = 1000
+
+# Segments smaller than this get no correlation (r is undefined below 3 points)
+MIN_SEGMENT_SIZE = 3
+
+# Bootstrap defaults; a batch of replicates holds at most this many resampled values
+N_BOOTSTRAP = 1000
+BOOTSTRAP_BATCH_VALUES = 2000000
+
+# Tidy results table
+CORRELATION_RESULTS_PATH = 'output/correlation_results.csv'
+
+
+def add_sales_band(df, threshold=HIGH_SALES_THRESHOLD):
+    """
+    Add the ordered sales_band column ('<1000' / '>=1000' by default)
+    """
+    labels = [f'<{threshold}', f'>={threshold}']
+    df['sales_band'] = pd.Categorical(np.where(df[TARGET] >= threshold, labels[1], labels[0]),
+                                      categories=labels, ordered=True)
+    return df
+
+
+def rated_products(df):
+    """
+    Products with a star rating
+    """
+    return df[df['stars'] > 0]
+
+
+def grouped_pearson(codes, n_groups, x, y):
+    """
+    Pearson's r of x and y within each group, and the group sizes
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.bincount(codes, weights=x, minlength=n_groups) / counts
+        mean_y = np.bincount(codes, weights=y, minlength=n_groups) / counts
+        dx = x - mean_x[codes]
+        dy = y - mean_y[codes]
+        sxy = np.bincount(codes, weights=dx * dy, minlength=n_groups)
+        sxx = np.bincount(codes, weights=dx * dx, minlength=n_groups)
+        syy = np.bincount(codes, weights=dy * dy, minlength=n_groups)
+        r = sxy / np.sqrt(sxx * syy)
+    # Constant input has no correlation (scipy returns NaN as well)
+    r[(sxx == 0) | (syy == 0)] = np.nan
+    return np.clip(r, -1.0, 1.0), counts
+
+
+def correlation_p_values(r, n):
+    """
+    Two-sided p-values of correlation coefficients (t test, n - 2 degrees of freedom)
+    """
+    # scipy is slow to import, so it is loaded by the functions that use it
+    from scipy import stats
+    r = np.asarray(r, dtype='float64')
+    dof = np.asarray(n, dtype='float64') - 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = r * np.sqrt(dof / ((1.0 - r) * (1.0 + r)))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    p = np.where(np.abs(r) == 1.0, 0.0, p)
+    return np.where(dof > 0, p, np.nan)
+
+
+def correlate(df, by=SEGMENT_KEYS, metrics=METRICS, target=TARGET):
+    """
+    Tidy table of Pearson and Spearman correlations of each metric with the target, per segment
+
+    One row per (segment, metric) with n, pearson_r, pearson_p, spearman_r
+    and spearman_p. Segments smaller than MIN_SEGMENT_SIZE are left out.
+    """
+    data = df[by + metrics + [target]]
+    grouped = data.groupby(by, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    segments = grouped.size()
+    n_groups = len(segments)
+
+    # Within-segment ranks of every column in one call; the target's ranks are shared
+    ranks = grouped[metrics + [target]].rank(method='average')
+    y = data[target].to_numpy('float64')
+    y_rank = ranks[target].to_numpy('float64')
+
+    tables = []
+    for metric in metrics:
+        pearson, n = grouped_pearson(codes, n_groups, data[metric].to_numpy('float64'), y)
+        spearman, _ = grouped_pearson(codes, n_groups, ranks[metric].to_numpy('float64'), y_rank)
+        table = segments.index.to_frame(index=False)
+        table['metric'] = metric
+        table['n'] = n
+        table['pearson_r'] = pearson
+        table['pearson_p'] = correlation_p_values(pearson, n)
+        table['spearman_r'] = spearman
+        table['spearman_p'] = correlation_p_values(spearman, n)
+        tables.append(table)
+
+    result = pd.concat(tables, ignore_index=True)
+    result = result[result['n'] >= MIN_SEGMENT_SIZE]
+    return result.sort_values(by + ['metric'], kind='stable').reset_index(drop=True)
+
+
+def rowwise_pearson(a, b):
+    """
+    Pearson's r between matching rows of two 2D arrays
+    """
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (a * b).sum(axis=1) / np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+
+
+def bootstrap_segment(task):
+    """
+    Worker: bootstrap percentile intervals of one segment's correlations
+
+    task is (x, y, n_boot, confidence, seed) with x of shape (n, metrics).
+    Returns arrays (pearson_low, pearson_high, spearman_low, spearman_high)
+    with one value per metric.
+    """
+    from scipy import stats
+    x, y, n_boot, confidence, seed = task
+    rng = np.random.default_rng(seed)
+    n, n_metrics = x.shape
+    pearson = np.empty((n_boot, n_metrics))
+    spearman = np.empty((n_boot, n_metrics))
+
+    batch = max(1, BOOTSTRAP_BATCH_VALUES // n)
+    for start in range(0, n_boot, batch):
+        stop = min(start + batch, n_boot)
+        index = rng.integers(0, n, size=(stop - start, n))
+        y_sample = y[index]
+        y_rank = stats.rankdata(y_sample, axis=1)
+        for j in range(n_metrics):
+            x_sample = x[:, j][index]
+            pearson[start:stop, j] = rowwise_pearson(x_sample, y_sample)
+            spearman[start:stop, j] = rowwise_pearson(stats.rankdata(x_sample, axis=1), y_rank)
+
+    tail = (1 - confidence) / 2 * 100
+    # A metric constant in every resample has only NaN correlations and NaN bounds;
+    # nanpercentile warns "All-NaN slice encountered" for it
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        pearson_low, pearson_high = np.nanpercentile(pearson, [tail, 100 - tail], axis=0)
+        spearman_low, spearman_high = np.nanpercentile(spearman, [tail, 100 - tail], axis=0)
+    return pearson_low, pearson_high, spearman_low, spearman_high
+
+
+def bootstrap_intervals(df, by=SEGMENT_KEYS, metrics=METRICS, target=TARGET, n_boot=N_BOOTSTRAP,
+                        confidence=0.95, workers=None, seed=0):
+    """
+    Bootstrap confidence intervals of the correlations of every segment
+
+    Returns a tidy table keyed like correlate() with pearson_ci_low/high and
+    spearman_ci_low/high columns. Each segment gets its own random stream
+    spawned from seed, so results do not depend on the number of workers.
+    """
+    data = df[by + metrics + [target]]
+    grouped = data.groupby(by, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    segments = grouped.size()
+
+    # Rows of each segment become contiguous slices after one stable sort
+    order = np.argsort(codes, kind='stable')
+    x = data[metrics].to_numpy('float64')[order]
+    y = data[target].to_numpy('float64')[order]
+    bounds = np.concatenate([[0], np.cumsum(segments.to_numpy())])
+
+    selected = [i for i in range(len(segments)) if segments.iloc[i] >= MIN_SEGMENT_SIZE]
+    seeds = np.random.SeedSequence(seed).spawn(len(segments))
+    tasks = [(x[bounds[i]:bounds[i + 1]], y[bounds[i]:bounds[i + 1]], n_boot, confidence, seeds[i])
+             for i in selected]
+
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            intervals = list(executor.map(bootstrap_segment, tasks))
+    else:
+        intervals = [bootstrap_segment(task) for task in tasks]
+
+    keys = segments.index.to_frame(index=False)
+    tables = []
+    for i, (pearson_low, pearson_high, spearman_low, spearman_high) in zip(selected, intervals):
+        table = pd.concat([keys.iloc[[i]]] * len(metrics), ignore_index=True)
+        table['metric'] = metrics
+        table['pearson_ci_low'] = pearson_low
+        table['pearson_ci_high'] = pearson_high
+        table['spearman_ci_low'] = spearman_low
+        table['spearman_ci_high'] = spearman_high
+        tables.append(table)
+
+    if not tables:
+        return pd.DataFrame(columns=by + ['metric', 'pearson_ci_low', 'pearson_ci_high',
+                                          'spearman_ci_low', 'spearman_ci_high'])
+    return pd.concat(tables, ignore_index=True)
+
+
+def add_arguments(parser):
+    """
+    Options of the correlation analysis (shared with analytics_cli.py)
+    """
+    parser.add_argument('--bootstrap', type=int, default=N_BOOTSTRAP, help='bootstrap replicates (0 to skip)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='bootstrap worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='bootstrap random seed')
+    parser.add_argument('--output', default=CORRELATION_RESULTS_PATH, help='results CSV')
+    return parser
+
+
+def run(df=None, bootstrap=N_BOOTSTRAP, workers=None, seed=0, output=CORRELATION_RESULTS_PATH):
+    """
+    Correlations with bootstrap intervals for all segments, saved as CSV
+
+    df is the further cleaned data if already in memory; otherwise it is read from disk.
+    """
+    print('=' * 50)
+    print('Starting Segment Correlation Analysis')
+    print('=' * 50)
+
+    # ==================== 1. Load data ====================
+    print('\n1. Loading further cleaned data')
+    print('-' * 30)
+
+    columns = ['main_category', 'product_tier'] + METRICS + [TARGET]
+    try:
+        df = load_table(FURTHER_CLEANED_PATH, columns=columns) if df is None else df[columns]
+    except Exception as e:
+        print(f'Error reading file: {e}')
+        exit(1)
+
+    df = add_sales_band(rated_products(df).copy())
+    print(f'Rated products: {len(df)}')
+
+    # ==================== 2. Correlations ====================
+    print('\n2. Computing correlations per segment')
+    print('-' * 30)
+
+    start = time.perf_counter()
+    results = correlate(df)
+    print(f'{len(results)} segment x metric correlations in {time.perf_counter() - start:.2f}s')
+
+    # ==================== 3. Bootstrap intervals ====================
+    if bootstrap > 0:
+        print('\n3. Bootstrapping confidence intervals')
+        print('-' * 30)
+
+        start = time.perf_counter()
+        intervals = bootstrap_intervals(df, n_boot=bootstrap, workers=workers, seed=seed)
+        results = results.merge(intervals, on=SEGMENT_KEYS + ['metric'], how='left')
+        print(f'{bootstrap} replicates per segment in {time.perf_counter() - start:.1f}s')
+
+    # ==================== 4. Save results ====================
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    results.to_csv(output, index=False, encoding='utf-8')
+    print(f'\nSaved correlation results to {output}')
+
+    print('\nStrongest Spearman correlations:')
+    strongest = results.reindex(results['spearman_r'].abs().sort_values(ascending=False).index)
+    print(strongest.head(10).to_string(index=False))
+
+
+def main():
+    """
+    Main function: correlations with bootstrap intervals for all segments
+    """
+    parser = argparse.ArgumentParser(description='Correlations of ratings, reviews and price with sales per segment')
+    args = add_arguments(parser).parse_args()
+    run(bootstrap=args.bootstrap, workers=args.workers, seed=args.seed, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
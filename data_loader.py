@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Shared typed loader for the Amazon UK product CSV files
+
+The schema is declared once here: URL columns are never parsed, categoryName
+is read as a category, and the numeric columns use compact dtypes.
+Run this file directly to compare it against a bare pd.read_csv.
+"""
+
+import pandas as pd
+import time
+import sys
+
+# Raw dataset location
+RAW_DATA_PATH = 'archive/amz_uk_processed_data.csv'
+
+# Columns present in the raw file but not used by any stage
+URL_COLUMNS = ['imgUrl', 'productURL']
+
+# Declared schema for every column we keep
+PRODUCT_DTYPES = {
+    'asin': 'str',
+    'title': 'str',
+    'stars': 'float32',
+    'reviews': 'int32',
+    'price': 'float32',
+    'isBestSeller': 'bool',
+    'boughtInLastMonth': 'int32',
+    'categoryName': 'category',
+}
+PRODUCT_COLUMNS = list(PRODUCT_DTYPES)
+
+# Nullable fallbacks used when an integer/bool column contains missing values
+NULLABLE_DTYPES = {
+    'int32': 'Int32',
+    'bool': 'boolean',
+}
+
+
+def load_product_data(file_path=RAW_DATA_PATH, columns=None):
+    """
+    Read a product CSV with the declared schema
+
+    Only the requested columns are parsed (all non-URL columns by default).
+    If an integer or bool column contains missing values, the read is retried
+    with pandas nullable dtypes instead of failing.
+    """
+    if columns is None:
+        columns = PRODUCT_COLUMNS
+    dtypes = {col: PRODUCT_DTYPES[col] for col in columns if col in PRODUCT_DTYPES}
+
+    try:
+        return pd.read_csv(file_path, usecols=columns, dtype=dtypes)
+    except (ValueError, TypeError):
+        nullable = {col: NULLABLE_DTYPES.get(dtype, dtype) for col, dtype in dtypes.items()}
+        print('Note: missing values found in integer/bool columns, using nullable dtypes')
+        return pd.read_csv(file_path, usecols=columns, dtype=nullable)
+
+
+def iter_product_chunks(file_path=RAW_DATA_PATH, chunksize=200000, columns=None):
+    """
+    Read a product CSV in row chunks with the declared schema
+    """
+    if columns is None:
+        columns = PRODUCT_COLUMNS
+    dtypes = {col: PRODUCT_DTYPES[col] for col in columns if col in PRODUCT_DTYPES}
+    return pd.read_csv(file_path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def read_header(file_path=RAW_DATA_PATH):
+    """
+    Return the column names of a CSV file without reading any rows
+    """
+    return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+
+def frame_memory_mb(df):
+    """
+    Deep memory usage of a DataFrame in MB
+    """
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def compare_load_strategies(file_path=RAW_DATA_PATH):
+    """
+    Time and measure a bare pd.read_csv against the typed, column-pruned load
+    """
+    start = time.perf_counter()
+    df_default = pd.read_csv(file_path)
+    default_seconds = time.perf_counter() - start
+    default_mb = frame_memory_mb(df_default)
+    default_dtypes = df_default.dtypes
+    del df_default
+
+    start = time.perf_counter()
+    df_typed = load_product_data(file_path)
+    typed_seconds = time.perf_counter() - start
+    typed_mb = frame_memory_mb(df_typed)
+
+    return {
+        'rows': len(df_typed),
+        'default_seconds': default_seconds,
+        'typed_seconds': typed_seconds,
+        'default_mb': default_mb,
+        'typed_mb': typed_mb,
+        'default_dtypes': default_dtypes,
+        'typed_dtypes': df_typed.dtypes,
+    }
+
+
+def main():
+    """
+    Main function: report memory and parse-time savings of the typed loader
+    """
+    file_path = sys.argv[1] if len(sys.argv) > 1 else RAW_DATA_PATH
+
+    print('=' * 50)
+    print('Comparing CSV load strategies')
+    print('=' * 50)
+
+    try:
+        result = compare_load_strategies(file_path)
+    except Exception as e:
+        print(f'Error reading file: {e}')
+        return
+
+    print(f'\nFile: {file_path}')
+    print(f'Rows: {result["rows"]}')
+
+    print('\nDefault pd.read_csv dtypes:')
+    print(result['default_dtypes'])
+    print('\nTyped loader dtypes:')
+    print(result['typed_dtypes'])
+
+    print('\nLoad comparison')
+    print('-' * 30)
+    print(f'{"":<20}{"Parse time (s)":>16}{"Memory (MB)":>14}')
+    print(f'{"pd.read_csv":<20}{result["default_seconds"]:>16.2f}{result["default_mb"]:>14.1f}')
+    print(f'{"load_product_data":<20}{result["typed_seconds"]:>16.2f}{result["typed_mb"]:>14.1f}')
+    print(f'\nParse time saved: {result["default_seconds"] - result["typed_seconds"]:.2f}s '
+          f'({(1 - result["typed_seconds"] / result["default_seconds"]) * 100:.1f}%)')
+    print(f'Memory saved: {result["default_mb"] - result["typed_mb"]:.1f} MB '
+          f'({(1 - result["typed_mb"] / result["default_mb"]) * 100:.1f}%)')
+    print('=' * 50)
+
+
+if __name__ == '__main__':
+    main()
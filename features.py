@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Price filtering and feature engineering shared by the cleaning stages
+
+Used by further_clean_data.py on the full frame and by streaming_clean.py on
+row chunks, so both paths produce the same columns.
+"""
+
+import pandas as pd
+import numpy as np
+from tier_engine import classify_tiers
+from category_taxonomy import resolve_main_categories
+
+# Reasonable price window (GBP)
+PRICE_MIN = 1
+PRICE_MAX = 1000
+
+# Price range feature
+PRICE_BINS = [1, 10, 20, 50, 100, 200, 500, 1000]
+PRICE_LABELS = ['1-10', '10-20', '20-50', '50-100', '100-200', '200-500', '500-1000']
+
+# Price range feature when prices outside the window are kept (per-category outlier filter)
+OPEN_PRICE_BINS = [0] + PRICE_BINS + [np.inf]
+OPEN_PRICE_LABELS = ['0-1'] + PRICE_LABELS + ['1000+']
+
+# Product tier feature
+TIER_ORDER = ['Premium', 'Quality', 'Standard', 'Basic', 'Unknown']
+
+
+def filter_price_window(df, low=PRICE_MIN, high=PRICE_MAX):
+    """
+    Keep products priced within [low, high]
+    """
+    return df[(df['price'] >= low) & (df['price'] <= high)].copy()
+
+
+def add_price_range(df, bins=PRICE_BINS, labels=PRICE_LABELS):
+    """
+    Add the price_range feature (ordered categorical)
+    """
+    df['price_range'] = pd.cut(df['price'], bins=bins, labels=labels)
+    return df
+
+
+def add_main_category(df):
+    """
+    Add the main_category feature (categorical)
+
+    Resolved once per distinct categoryName by the taxonomy resolver
+    (overrides, prefix rules, then first word of the name).
+    """
+    df['main_category'] = resolve_main_categories(df['categoryName'])
+    return df
+
+
+def get_product_tier(row):
+    """
+    Classify one product based on stars and review count
+
+    Row-wise reference implementation of the default tier scheme, kept for the
+    tier_engine.py benchmark and equivalence check.
+    """
+    stars = row['stars']
+    reviews = row['reviews']
+
+    if pd.isna(stars) or pd.isna(reviews):
+        return 'Unknown'
+
+    if stars >= 4.5 and reviews >= 1000:
+        return 'Premium'
+    elif stars >= 4.0 and reviews >= 100:
+        return 'Quality'
+    elif stars >= 3.5 and reviews >= 10:
+        return 'Standard'
+    else:
+        return 'Basic'
+
+
+def add_product_tier(df, rules=None):
+    """
+    Add the product_tier feature (ordered categorical)
+
+    Uses the vectorized tier engine with the configured default scheme
+    unless a rule list is given.
+    """
+    df['product_tier'] = classify_tiers(df, rules)
+    return df
+
+
+def add_features(df, price_bins=PRICE_BINS, price_labels=PRICE_LABELS):
+    """
+    Add price_range, main_category and product_tier to a price-filtered frame
+    """
+    add_price_range(df, price_bins, price_labels)
+    add_main_category(df)
+    add_product_tier(df)
+    return df
@@ -1,208 +1,269 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
 import re
+from data_loader import RAW_DATA_PATH, load_product_data
+from columnar_store import CLEANED_DATA_PATH, FURTHER_CLEANED_PATH, load_table, save_table, table_exists
+from features import (PRICE_MIN, PRICE_MAX, PRICE_BINS, PRICE_LABELS, OPEN_PRICE_BINS, OPEN_PRICE_LABELS,
+                      TIER_ORDER, filter_price_window, add_price_range, add_main_category, add_product_tier)
+from summaries import write_further_analysis_summary
+from aggregation_cube import CUBE_PATH, build_cube, save_cube, rollup, key_counts
+from column_cache import build_column_cache, cache_dir_for
+from instrumentation import begin_stage, end_stage, set_rows
+from near_duplicates import find_near_duplicates, collapse_clusters
+from outlier_detection import METHODS, FLAG_COLUMNS, detect_outliers
+from chart_rendering import pyplot
 
 """
 Further Cleaning of Amazon Dataset and Feature Engineering
 """
 
-# Create output directory
-if not os.path.exists('output'):
-    os.makedirs('output')
 
-print('=' * 50)
-print('Starting Further Data Cleaning and Feature Engineering')
-print('=' * 50)
+def run(df=None, collapse_near_duplicates=False, workers=None, price_filter='window', outlier_method='mad'):
+    """
+    Filter prices, engineer features and save the further cleaned table
 
-# ==================== 1. Load Cleaned CSV File ====================
-print('\n1. Loading Cleaned CSV File')
-print('-' * 30)
+    df is the cleaned data if already in memory; otherwise it is loaded from
+    the cleaned table (or the raw file). price_filter 'window' keeps prices
+    of 1-1000 GBP; 'robust' drops the price outliers of each category
+    (outlier_detection.py, outlier_method 'mad' or 'iqr') whatever their
+    price. With collapse_near_duplicates, each
+    cluster of near-duplicate listings (near_duplicates.py) is reduced to one
+    listing before anything is aggregated. Returns the further cleaned
+    DataFrame and its aggregation cube.
+    """
+    # Create output directory
+    if not os.path.exists('output'):
+        os.makedirs('output')
 
-try:
-    # Load from cleaned file if available; otherwise, load from raw and drop unnecessary columns
-    if os.path.exists('output/amz_uk_cleaned_data.csv'):
-        df = pd.read_csv('output/amz_uk_cleaned_data.csv')
-        print('Successfully loaded cleaned file: output/amz_uk_cleaned_data.csv')
-    else:
-        df = pd.read_csv('archive/amz_uk_processed_data.csv')
-        df = df.drop(['imgUrl', 'productURL'], axis=1)
-        print('Loaded from raw file and dropped unnecessary columns')
-    
-    print(f'Data shape: {df.shape}')
-except Exception as e:
-    print(f'Error loading file: {e}')
-    exit(1)
-
-# ==================== 2. Handle Price Outliers ====================
-print('\n2. Handling Price Outliers')
-print('-' * 30)
-
-# Show outlier stats
-low_price = df[df['price'] < 1]
-high_price = df[df['price'] > 1000]
-print(f'Number of products with price = 0: {len(df[df["price"] == 0])}')
-print(f'Number of products with price < 1: {len(low_price)}')
-print(f'Number of products with price > 1000: {len(high_price)}')
-
-# Filter out products with reasonable price range (1-1000 GBP)
-df_filtered = df.copy()
-df_filtered = df_filtered[(df_filtered['price'] >= 1) & (df_filtered['price'] <= 1000)]
-print(f'Shape after filtering: {df_filtered.shape}')
-print(f'Number of products filtered out: {df.shape[0] - df_filtered.shape[0]} '
-      f'({(df.shape[0] - df_filtered.shape[0]) / df.shape[0] * 100:.2f}%)')
-
-# ==================== 3. Feature Engineering ====================
-print('\n3. Feature Engineering')
-print('-' * 30)
-
-# 1. Create price range feature
-print('Creating price range feature...')
-bins = [1, 10, 20, 50, 100, 200, 500, 1000]
-labels = ['1-10', '10-20', '20-50', '50-100', '100-200', '200-500', '500-1000']
-df_filtered['price_range'] = pd.cut(df_filtered['price'], bins=bins, labels=labels)
-
-# Plot price range distribution
-plt.figure(figsize=(12, 6))
-df_filtered['price_range'].value_counts().sort_index().plot(kind='bar')
-plt.title('Product Price Range Distribution')
-plt.xlabel('Price Range (£)')
-plt.ylabel('Number of Products')
-plt.savefig('output/price_range_distribution.png')
-plt.close()
-
-# 2. Create main category feature (first word of category name)
-print('Creating main category feature...')
-df_filtered['main_category'] = df_filtered['categoryName'].apply(lambda x: x.split()[0] if isinstance(x, str) else 'Unknown')
-
-# Plot main category distribution
-plt.figure(figsize=(12, 8))
-main_category_counts = df_filtered['main_category'].value_counts().head(15)
-main_category_counts.plot(kind='barh')
-plt.title('Top 15 Main Categories')
-plt.xlabel('Number of Products')
-plt.ylabel('Main Category')
-plt.tight_layout()
-plt.savefig('output/main_category_distribution.png')
-plt.close()
-
-# 3. Create product tier feature based on stars and review count
-print('Creating product tier feature...')
-
-def get_product_tier(row):
-    stars = row['stars']
-    reviews = row['reviews']
-    
-    if pd.isna(stars) or pd.isna(reviews):
-        return 'Unknown'
-    
-    if stars >= 4.5 and reviews >= 1000:
-        return 'Premium'
-    elif stars >= 4.0 and reviews >= 100:
-        return 'Quality'
-    elif stars >= 3.5 and reviews >= 10:
-        return 'Standard'
+    print('=' * 50)
+    print('Starting Further Data Cleaning and Feature Engineering')
+    print('=' * 50)
+
+    # ==================== 1. Load Cleaned Data ====================
+    print('\n1. Loading Cleaned Data')
+    print('-' * 30)
+    begin_stage('load')
+
+    try:
+        # Use the data passed in, else the cleaned file if available; otherwise, load from raw
+        if df is not None:
+            print('Using cleaned data already in memory')
+        elif table_exists(CLEANED_DATA_PATH):
+            df = load_table(CLEANED_DATA_PATH)
+            print(f'Successfully loaded cleaned file: {CLEANED_DATA_PATH}')
+        else:
+            df = load_product_data(RAW_DATA_PATH)
+            print('Loaded from raw file without unnecessary columns')
+
+        print(f'Data shape: {df.shape}')
+        set_rows(len(df))
+    except Exception as e:
+        print(f'Error loading file: {e}')
+        exit(1)
+
+    # ==================== 2. Handle Price Outliers ====================
+    print('\n2. Handling Price Outliers')
+    print('-' * 30)
+    begin_stage('price_filter', rows=len(df))
+
+    # Show outlier stats
+    low_price = df[df['price'] < 1]
+    high_price = df[df['price'] > 1000]
+    print(f'Number of products with price = 0: {len(df[df["price"] == 0])}')
+    print(f'Number of products with price < 1: {len(low_price)}')
+    print(f'Number of products with price > 1000: {len(high_price)}')
+
+    # The unfiltered frame is released once filtered; only its shape is reported later
+    original_shape = df.shape
+    if price_filter == 'robust':
+        # Drop the products whose price is an outlier within their own category
+        flags, stats, _ = detect_outliers(df, outlier_method)
+        print(f'Per-category outlier detection ({outlier_method}) over {len(stats)} categories')
+        for col in FLAG_COLUMNS.values():
+            print(f'Number of products flagged {col}: {int(flags[col].sum())}')
+        df_filtered = df[~flags['price_outlier']].copy()
+        price_bins, price_labels = OPEN_PRICE_BINS, OPEN_PRICE_LABELS
+        filter_condition = f'Per-category price outliers removed ({outlier_method} on log price)'
+        del flags
     else:
-        return 'Basic'
-
-df_filtered['product_tier'] = df_filtered.apply(get_product_tier, axis=1)
-
-# Plot product tier distribution
-plt.figure(figsize=(10, 6))
-tier_order = ['Premium', 'Quality', 'Standard', 'Basic', 'Unknown']
-tier_counts = df_filtered['product_tier'].value_counts().reindex(tier_order)
-tier_counts.plot(kind='bar')
-plt.title('Product Tier Distribution')
-plt.xlabel('Product Tier')
-plt.ylabel('Number of Products')
-plt.savefig('output/product_tier_distribution.png')
-plt.close()
-
-# ==================== 4. Statistics and Visualization ====================
-print('\n4. Statistics and Visualization')
-print('-' * 30)
-
-# 1. Average price by product tier
-print('Analyzing average price per product tier...')
-tier_price = df_filtered.groupby('product_tier')['price'].agg(['mean', 'median', 'count'])
-print(tier_price)
-
-plt.figure(figsize=(10, 6))
-sns.barplot(x=df_filtered['product_tier'], y=df_filtered['price'], order=tier_order)
-plt.title('Average Price by Product Tier')
-plt.xlabel('Product Tier')
-plt.ylabel('Average Price (£)')
-plt.savefig('output/tier_avg_price.png')
-plt.close()
-
-# 2. Product tier distribution by top 10 main categories
-print('Analyzing product tier distribution by top main categories...')
-top10_categories = df_filtered['main_category'].value_counts().head(10).index
-df_top_categories = df_filtered[df_filtered['main_category'].isin(top10_categories)]
-
-plt.figure(figsize=(15, 10))
-ax = sns.countplot(x='main_category', hue='product_tier', data=df_top_categories,
-                  hue_order=tier_order, order=top10_categories)
-plt.title('Product Tier Distribution by Top 10 Main Categories')
-plt.xlabel('Main Category')
-plt.ylabel('Number of Products')
-plt.xticks(rotation=45)
-plt.legend(title='Product Tier')
-plt.tight_layout()
-plt.savefig('output/category_tier_distribution.png')
-plt.close()
-
-# ==================== 5. Save Further Cleaned Data ====================
-print('\n5. Saving Further Cleaned Data')
-print('-' * 30)
-
-# Save cleaned and processed data
-cleaned_file_path = 'output/amz_uk_further_cleaned.csv'
-df_filtered.to_csv(cleaned_file_path, index=False)
-print(f'Saved further cleaned data to: {cleaned_file_path}')
-
-# Create summary report
-with open('output/further_analysis_summary.txt', 'w', encoding='utf-8') as f:
-    f.write('# Amazon UK Product Further Analysis Summary\n\n')
-    f.write(f'## 1. Data Cleaning\n')
-    f.write(f'- Original data shape: {df.shape[0]} rows x {df.shape[1]} columns\n')
-    f.write(f'- Filtered data shape: {df_filtered.shape[0]} rows x {df_filtered.shape[1]} columns\n')
-    f.write(f'- Number of products filtered out: {df.shape[0] - df_filtered.shape[0]} '
-            f'({(df.shape[0] - df_filtered.shape[0])/df.shape[0]*100:.2f}%)\n\n')
-    
-    f.write(f'## 2. Price Analysis\n')
-    f.write(f'- Filter condition: Price between 1 and 1000 GBP\n')
-    f.write(f'- Price range distribution:\n')
-    price_range_dist = df_filtered['price_range'].value_counts().sort_index()
-    for range, count in price_range_dist.items():
-        f.write(f'  * £{range}: {count} products ({count / df_filtered.shape[0] * 100:.2f}%)\n')
-    
-    f.write(f'\n## 3. Product Tier Analysis\n')
-    f.write(f'- Product Tier Definitions:\n')
-    f.write(f'  * Premium: Rating ≥ 4.5 and Reviews ≥ 1000\n')
-    f.write(f'  * Quality: Rating ≥ 4.0 and Reviews ≥ 100\n')
-    f.write(f'  * Standard: Rating ≥ 3.5 and Reviews ≥ 10\n')
-    f.write(f'  * Basic: Others\n\n')
-    
-    f.write(f'- Product Tier Distribution:\n')
-    tier_dist = df_filtered['product_tier'].value_counts().reindex(tier_order)
-    for tier, count in tier_dist.items():
-        f.write(f'  * {tier}: {count} products ({count / df_filtered.shape[0] * 100:.2f}%)\n')
-    
-    f.write(f'\n## 4. Average Price by Tier\n')
-    for tier in tier_order:
-        if tier in tier_price.index:
-            f.write(f'- {tier}:\n')
-            f.write(f'  * Number of Products: {tier_price.loc[tier, "count"]}\n')
-            f.write(f'  * Average Price: £{tier_price.loc[tier, "mean"]:.2f}\n')
-            f.write(f'  * Median Price: £{tier_price.loc[tier, "median"]:.2f}\n')
-
-print('Saved further analysis summary to output/further_analysis_summary.txt')
-
-print('\nFurther analysis and cleaning completed')
-print('=' * 50)
+        # Filter out products with reasonable price range (1-1000 GBP)
+        df_filtered = filter_price_window(df, PRICE_MIN, PRICE_MAX)
+        price_bins, price_labels = PRICE_BINS, PRICE_LABELS
+        filter_condition = None
+    del df, low_price, high_price
+    print(f'Shape after filtering: {df_filtered.shape}')
+    print(f'Number of products filtered out: {original_shape[0] - df_filtered.shape[0]} '
+          f'({(original_shape[0] - df_filtered.shape[0]) / original_shape[0] * 100:.2f}%)')
+
+    # The same product listed under several ASINs would count its sales several times
+    if collapse_near_duplicates:
+        begin_stage('near_duplicates', rows=len(df_filtered))
+        clusters, _ = find_near_duplicates(df_filtered, workers=workers)
+        df_filtered, removed = collapse_clusters(df_filtered, clusters['cluster_id'])
+        print(f'Near-duplicate listings collapsed: {removed} rows removed, {len(df_filtered)} remaining')
+
+    # ==================== 3. Feature Engineering ====================
+    print('\n3. Feature Engineering')
+    print('-' * 30)
+
+    # 1. Create price range feature
+    print('Creating price range feature...')
+    begin_stage('price_range', rows=len(df_filtered))
+    add_price_range(df_filtered, price_bins, price_labels)
+
+    # Plot price range distribution
+    begin_stage('price_range_chart')
+    plt = pyplot()
+    plt.figure(figsize=(12, 6))
+    df_filtered['price_range'].value_counts().sort_index().plot(kind='bar')
+    plt.title('Product Price Range Distribution')
+    plt.xlabel('Price Range (£)')
+    plt.ylabel('Number of Products')
+    plt.savefig('output/price_range_distribution.png')
+    plt.close()
+
+    # 2. Create main category feature (taxonomy resolver, first word by default)
+    print('Creating main category feature...')
+    begin_stage('main_category', rows=len(df_filtered))
+    add_main_category(df_filtered)
+
+    # Plot main category distribution
+    begin_stage('main_category_chart')
+    plt.figure(figsize=(12, 8))
+    main_category_counts = df_filtered['main_category'].value_counts().head(15)
+    main_category_counts.plot(kind='barh')
+    plt.title('Top 15 Main Categories')
+    plt.xlabel('Number of Products')
+    plt.ylabel('Main Category')
+    plt.tight_layout()
+    plt.savefig('output/main_category_distribution.png')
+    plt.close()
+
+    # 3. Create product tier feature based on stars and review count
+    print('Creating product tier feature...')
+    begin_stage('product_tier', rows=len(df_filtered))
+    tier_order = TIER_ORDER
+    add_product_tier(df_filtered)
+
+    # Plot product tier distribution
+    begin_stage('product_tier_chart')
+    plt.figure(figsize=(10, 6))
+    tier_counts = df_filtered['product_tier'].value_counts().reindex(tier_order)
+    tier_counts.plot(kind='bar')
+    plt.title('Product Tier Distribution')
+    plt.xlabel('Product Tier')
+    plt.ylabel('Number of Products')
+    plt.savefig('output/product_tier_distribution.png')
+    plt.close()
+
+    # ==================== 4. Statistics and Visualization ====================
+    print('\n4. Statistics and Visualization')
+    print('-' * 30)
+
+    # Aggregate once; the statistics below roll up from the cube
+    begin_stage('cube', rows=len(df_filtered))
+    cube = build_cube(df_filtered)
+    print(f'Aggregation cube: {len(cube)} cells')
+
+    # 1. Average price by product tier
+    print('Analyzing average price per product tier...')
+    tier_price = rollup(cube, 'product_tier', 'price')[['mean', 'count']]
+    # Medians are not additive, so they still come from the rows
+    tier_price.insert(1, 'median', df_filtered.groupby('product_tier', observed=True)['price'].median())
+    print(tier_price)
+
+    begin_stage('tier_avg_price_chart', rows=len(df_filtered))
+    import seaborn as sns
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x=df_filtered['product_tier'], y=df_filtered['price'], order=tier_order)
+    plt.title('Average Price by Product Tier')
+    plt.xlabel('Product Tier')
+    plt.ylabel('Average Price (£)')
+    plt.savefig('output/tier_avg_price.png')
+    plt.close()
+
+    # 2. Product tier distribution by top 10 main categories
+    print('Analyzing product tier distribution by top main categories...')
+    top10_categories = key_counts(cube, 'main_category').sort_values(ascending=False, kind='stable').head(10).index
+    df_top_categories = df_filtered[df_filtered['main_category'].isin(top10_categories)]
+    begin_stage('category_tier_chart', rows=len(df_top_categories))
+
+    plt.figure(figsize=(15, 10))
+    ax = sns.countplot(x='main_category', hue='product_tier', data=df_top_categories,
+                      hue_order=tier_order, order=top10_categories)
+    plt.title('Product Tier Distribution by Top 10 Main Categories')
+    plt.xlabel('Main Category')
+    plt.ylabel('Number of Products')
+    plt.xticks(rotation=45)
+    plt.legend(title='Product Tier')
+    plt.tight_layout()
+    plt.savefig('output/category_tier_distribution.png')
+    plt.close()
+
+    # ==================== 5. Save Further Cleaned Data ====================
+    print('\n5. Saving Further Cleaned Data')
+    print('-' * 30)
+
+    # Save cleaned and processed data
+    begin_stage('save', rows=len(df_filtered))
+    cleaned_file_path = FURTHER_CLEANED_PATH
+    save_table(df_filtered, cleaned_file_path)
+    print(f'Saved further cleaned data to: {cleaned_file_path}')
+
+    # Saved after the table, so readers see the cube as current
+    save_cube(cube)
+    print(f'Saved aggregation cube to: {CUBE_PATH}')
+
+    # Memory-mapped columns for the analysis scripts (also rebuilt on demand when stale)
+    build_column_cache(df_filtered, cleaned_file_path)
+    print(f'Saved column cache to: {cache_dir_for(cleaned_file_path)}')
+
+    # Create summary report
+    begin_stage('summary')
+    write_further_analysis_summary('output/further_analysis_summary.txt',
+                                   original_shape=original_shape,
+                                   filtered_shape=df_filtered.shape,
+                                   price_range_dist=key_counts(cube, 'price_range'),
+                                   tier_dist=key_counts(cube, 'product_tier').reindex(tier_order),
+                                   tier_price=tier_price,
+                                   filter_condition=filter_condition)
+
+    print('Saved further analysis summary to output/further_analysis_summary.txt')
+    end_stage()
+
+    print('\nFurther analysis and cleaning completed')
+    print('=' * 50)
+    # Match the table saved above
+    return df_filtered.reset_index(drop=True), cube
+
+
+def add_arguments(parser):
+    """
+    Further cleaning options, shared with analytics_cli.py
+    """
+    parser.add_argument('--collapse-near-duplicates', action='store_true',
+                        help='keep one listing per cluster of near-duplicate titles')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='title hashing processes')
+    parser.add_argument('--price-filter', choices=['window', 'robust'], default='window',
+                        help=f'fixed {PRICE_MIN}-{PRICE_MAX} GBP window or per-category price outliers')
+    parser.add_argument('--outlier-method', choices=METHODS, default='mad',
+                        help='robust rule of the per-category filter')
+    return parser
+
+
+def main():
+    """
+    Main function: further clean the cleaned table
+    """
+    parser = argparse.ArgumentParser(description='Price filter and feature engineering')
+    args = add_arguments(parser).parse_args()
+    run(collapse_near_duplicates=args.collapse_near_duplicates, workers=args.workers,
+        price_filter=args.price_filter, outlier_method=args.outlier_method)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stage-level instrumentation and run reports for the pipeline scripts
+
+A script marks its stages either with a context manager
+
+    with stage('load') as s:
+        df = load_table(...)
+        s.rows = len(df)
+
+or, in scripts written as top-level code, with begin_stage('load'), which
+also ends the stage begun before it (end_stage() ends the last one).
+set_rows(n) records the rows processed by the innermost open stage.
+
+Each stage records wall time, CPU time, peak RSS (reset per stage on Linux
+via /proc/self/clear_refs; elsewhere the process peak so far), RSS growth,
+the rows processed and the enclosing stage (parent), if any.
+render_charts() adds one record per chart. The report also records the
+start-up time before the first stage (interpreter start and module
+imports) and which of the slow-to-import libraries the run loaded. When the
+script exits, the run report is written as JSON to
+output/run_reports/<script>.json and appended to output/run_reports/history.jsonl.
+
+Environment variables (so every script is configured the same way, also
+when run by pipeline_runner.py):
+    ANALYTICS_REPORT_DIR    report directory ('' disables the report)
+    ANALYTICS_TRACEMALLOC   1 to also record peak Python allocations (slower)
+    ANALYTICS_PROFILE       comma-separated stage names (or 'all') to run
+                            under cProfile; each dumps <script>.<stage>.prof
+                            next to the report
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Default directory of the run reports
+REPORT_DIR = 'output/run_reports'
+
+# Append-only log of every run report
+HISTORY_FILE = 'history.jsonl'
+
+# Libraries that are slow to import, loaded only by the code that needs them
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'scipy', 'pyarrow']
+
+
+# ==================== Memory probes ====================
+
+def current_rss_mb():
+    """
+    Resident memory of this process in MB (None if unavailable)
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory counter (Linux only)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory in MB since the last reset (or process start)
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def process_age_seconds():
+    """
+    Seconds since this process started (None if unavailable)
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesized command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ==================== Run report ====================
+
+def _settings():
+    profile = os.environ.get('ANALYTICS_PROFILE', '')
+    return {
+        'report_dir': os.environ.get('ANALYTICS_REPORT_DIR', REPORT_DIR),
+        'tracemalloc': os.environ.get('ANALYTICS_TRACEMALLOC', '') not in ('', '0'),
+        'profile': {name.strip() for name in profile.split(',') if name.strip()},
+    }
+
+
+def _slug(name):
+    return re.sub(r'[^\w-]+', '_', name).strip('_')
+
+
+class RunReport:
+    """
+    Stage and chart records of one script run
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.settings = _settings()
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        # Interpreter start-up and module imports, up to the first stage
+        self.startup_seconds = process_age_seconds()
+        self.stages = []
+        self.charts = []
+        self.peak_rss_mb = current_rss_mb() or 0.0
+        if self.settings['tracemalloc'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def profile_path(self, stage_name):
+        return os.path.join(self.settings['report_dir'] or '.', f'{self.script}.{_slug(stage_name)}.prof')
+
+    def add_stage(self, record):
+        self.stages.append(record)
+        self.peak_rss_mb = max(self.peak_rss_mb, record['peak_rss_mb'])
+
+    def add_charts(self, results):
+        for result in results:
+            self.charts.append({key: result.get(key) for key in
+                                ['name', 'output', 'seconds', 'cpu_seconds', 'peak_rss_mb', 'pid', 'cached', 'error']})
+
+    def to_dict(self):
+        return {
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'pid': os.getpid(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_seconds': round(time.perf_counter() - self.wall_start, 4),
+            'cpu_seconds': round(time.process_time() - self.cpu_start, 4),
+            'peak_rss_mb': round(max(self.peak_rss_mb, peak_rss_mb()), 1),
+            'startup_seconds': round(self.startup_seconds, 3) if self.startup_seconds is not None else None,
+            'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+            'tracemalloc': self.settings['tracemalloc'],
+            'stages': self.stages,
+            'charts': self.charts,
+        }
+
+    def write(self):
+        """
+        Write <script>.json and append the report to the history log
+        """
+        report_dir = self.settings['report_dir']
+        if not report_dir or not (self.stages or self.charts):
+            return None
+        if not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+        report = self.to_dict()
+        path = os.path.join(report_dir, f'{self.script}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(report_dir, HISTORY_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+        return path
+
+
+_report = None
+
+# Open stages, innermost last
+_open_stages = []
+
+# Stage begun by begin_stage() and not yet ended
+_current = None
+
+
+def get_report():
+    """
+    Run report of this process (created on first use, written at exit)
+    """
+    global _report
+    if _report is None:
+        _report = RunReport(os.path.splitext(os.path.basename(sys.argv[0] or 'interactive'))[0])
+        atexit.register(_finish)
+    return _report
+
+
+def _finish():
+    end_stage()
+    while _open_stages:
+        _open_stages[-1].stop()
+    try:
+        path = _report.write()
+        if path:
+            print(f'Run report saved to {path}')
+    except OSError as e:
+        print(f'Warning: could not write run report: {e}')
+
+
+# ==================== Stages ====================
+
+class Stage:
+    """
+    One timed stage; use stage(), begin_stage() or start()/stop()
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self.child_peak_mb = 0.0
+        self.profiler = None
+        self.record = None
+
+    def start(self):
+        report = get_report()
+        profile = report.settings['profile']
+        # Only one profiler can be active: nested profiled stages share the outer dump
+        if (self.name in profile or 'all' in profile) and not any(s.profiler for s in _open_stages):
+            self.profiler = cProfile.Profile()
+        # Hand the peak so far to the enclosing stages before resetting the counter
+        note_peak_rss(peak_rss_mb())
+        self.per_stage_peak = reset_peak_rss()
+        self.rss_before = current_rss_mb()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.parent = _open_stages[-1].name if _open_stages else None
+        _open_stages.append(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.profiler:
+            self.profiler.enable()
+        return self
+
+    def stop(self):
+        if self.record is not None:
+            return self.record
+        if self.profiler:
+            self.profiler.disable()
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        # Nested stages reset the peak counter, so include the peaks they saw
+        peak = max(peak_rss_mb(), self.child_peak_mb)
+        if self in _open_stages:
+            _open_stages.remove(self)
+        note_peak_rss(peak)
+
+        report = get_report()
+        self.record = {
+            'name': self.name,
+            'wall_seconds': round(wall, 4),
+            'cpu_seconds': round(cpu, 4),
+            'peak_rss_mb': round(peak, 1),
+            'peak_rss_scope': 'stage' if self.per_stage_peak else 'process',
+            'rss_growth_mb': round(peak - self.rss_before, 1) if self.rss_before is not None else None,
+            'rows': self.rows,
+            'parent': self.parent,
+        }
+        if tracemalloc.is_tracing():
+            self.record['peak_traced_mb'] = round((tracemalloc.get_traced_memory()[1] - self.traced_before)
+                                                  / 1024 ** 2, 1)
+        if self.profiler:
+            path = report.profile_path(self.name)
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.profiler.dump_stats(path)
+            self.record['profile'] = path
+        report.add_stage(self.record)
+        return self.record
+
+
+def note_peak_rss(peak_mb):
+    """
+    Pass a peak measured after a reset of the counter on to the open stages
+    """
+    for open_stage in _open_stages:
+        open_stage.child_peak_mb = max(open_stage.child_peak_mb, peak_mb)
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Time the enclosed block as a stage; set .rows on the yielded stage
+    """
+    current = Stage(name, rows).start()
+    try:
+        yield current
+    finally:
+        current.stop()
+
+
+def begin_stage(name, rows=None):
+    """
+    End the stage begun by the previous begin_stage() call and start a new one
+    """
+    global _current
+    end_stage()
+    _current = Stage(name, rows).start()
+    return _current
+
+
+def end_stage(rows=None):
+    """
+    End the stage begun by begin_stage(), if any
+    """
+    global _current
+    if _current is not None:
+        if rows is not None:
+            _current.rows = rows
+        _current.stop()
+        _current = None
+
+
+def set_rows(rows):
+    """
+    Record the rows processed by the innermost open stage
+    """
+    if _open_stages:
+        _open_stages[-1].rows = int(rows)
+
+
+def record_charts(results):
+    """
+    Add per-chart records (from chart_rendering.render_charts) to the run report
+    """
+    get_report().add_charts(results)
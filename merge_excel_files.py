@@ -2,92 +2,283 @@
 # -*- coding: utf-8 -*-
 
 """
-Batch read all .csv files in the archive folder and merge them into a single DataFrame
+Batch read all .csv files in the archive folder and merge them into a single dataset
+
+Files are ingested in parallel worker processes. Each file's encoding is
+sniffed from a byte prefix, its columns are reconciled against one schema
+shared by all files, and it is streamed in chunks into its own partition of
+a Parquet dataset (output/merged_data/source_file=<name>/). No merged
+DataFrame is ever held in memory, so peak memory per worker is one chunk.
+Each worker also returns quantile sketches of its file's numeric product
+columns, which are merged into approximate statistics of the whole dataset.
 """
 
 import pandas as pd
-import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import argparse
+import codecs
 import glob
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from data_loader import PRODUCT_DTYPES, NULLABLE_DTYPES, URL_COLUMNS
+from columnar_store import MERGED_DATASET_PATH, ChunkedTableWriter
+from quantile_sketch import KLLSketch, merge_sketches
+
+# Bytes inspected to guess the encoding of a file
+SNIFF_BYTES = 64 * 1024
+
+# Rows sampled per file to infer the dtypes of columns outside the product schema
+SAMPLE_ROWS = 1000
+
+# Storage dtypes of known product columns in the merged dataset. Nullable, so
+# a column missing from one file can be filled with NA for that file.
+MERGED_DTYPES = {col: 'str' if dtype == 'category' else NULLABLE_DTYPES.get(dtype, dtype)
+                 for col, dtype in PRODUCT_DTYPES.items()}
+
+# Columns summarized by quantile sketches in each worker
+SKETCH_COLUMNS = ["price", "reviews", "boughtInLastMonth"]
+
+# Arrow types of the storage dtypes
+ARROW_TYPES = {
+    'str': pa.string(),
+    'float32': pa.float32(),
+    'float64': pa.float64(),
+    'Int32': pa.int32(),
+    'boolean': pa.bool_(),
+}
+
+
+def sniff_encoding(file_path, prefix_bytes=SNIFF_BYTES):
+    """
+    Guess the encoding of a file from its first bytes
+    """
+    with open(file_path, "rb") as f:
+        prefix = f.read(prefix_bytes)
+
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Incremental decoding tolerates a multi-byte character cut at the end of the prefix
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+
+
+def read_file_schema(file_path):
+    """
+    Encoding, column names and sampled dtypes of one file
+    """
+    encoding = sniff_encoding(file_path)
+    try:
+        sample = pd.read_csv(file_path, encoding=encoding, nrows=SAMPLE_ROWS)
+    except UnicodeDecodeError:
+        encoding = "latin1"
+        sample = pd.read_csv(file_path, encoding=encoding, nrows=SAMPLE_ROWS)
+    return {
+        "file_path": file_path,
+        "encoding": encoding,
+        "columns": sample.columns.tolist(),
+        "kinds": {col: dtype.kind for col, dtype in sample.dtypes.items()},
+    }
+
+
+def reconcile_schemas(file_schemas):
+    """
+    Build one schema covering the columns of every file
+
+    Known product columns keep the declared schema. Other columns become
+    float64 when every file sampled them as numeric, boolean when every file
+    sampled them as bool, and strings otherwise. URL columns are dropped.
+    """
+    columns = []
+    kinds = {}
+    for schema in file_schemas:
+        for col in schema["columns"]:
+            if col in URL_COLUMNS:
+                continue
+            if col not in kinds:
+                columns.append(col)
+                kinds[col] = set()
+            kinds[col].add(schema["kinds"][col])
+
+    dtypes = {}
+    for col in columns:
+        if col in MERGED_DTYPES:
+            dtypes[col] = MERGED_DTYPES[col]
+        elif kinds[col] <= set("iuf"):
+            dtypes[col] = "float64"
+        elif kinds[col] == {"b"}:
+            dtypes[col] = "boolean"
+        else:
+            dtypes[col] = "str"
+    return dtypes
+
+
+def missing_column(index, dtype):
+    """
+    An all-missing column of a storage dtype (NaN for numpy dtypes, NA for nullable ones)
+    """
+    fill = pd.NA if pd.api.types.is_extension_array_dtype(pd.api.types.pandas_dtype(dtype)) else np.nan
+    return pd.Series(fill, index=index, dtype=dtype)
+
+
+def _write_partition(file_path, encoding, dtypes, partition_path, chunksize):
+    """
+    Stream one file into its partition with the shared schema
+
+    The partition is written under a hidden temporary name (skipped by
+    dataset readers) and renamed once complete, so a failed file leaves
+    nothing behind. Returns the row count and sketches of the file's
+    SKETCH_COLUMNS.
+    """
+    header = pd.read_csv(file_path, encoding=encoding, nrows=0).columns
+    present = {col: dtype for col, dtype in dtypes.items() if col in header}
+    schema = pa.schema([pa.field(col, ARROW_TYPES[dtype]) for col, dtype in dtypes.items()])
+    sketches = {col: KLLSketch() for col in SKETCH_COLUMNS if col in present}
+
+    directory, name = os.path.split(partition_path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    rows = 0
+    try:
+        with ChunkedTableWriter(temp_path, schema=schema) as writer:
+            for chunk in pd.read_csv(file_path, encoding=encoding, usecols=list(present),
+                                     dtype=present, chunksize=chunksize):
+                for col, dtype in dtypes.items():
+                    if col not in present:
+                        chunk[col] = missing_column(chunk.index, dtype)
+                writer.write(chunk[list(dtypes)])
+                for col, sketch in sketches.items():
+                    sketch.update(chunk[col].to_numpy(dtype="float64", na_value=np.nan))
+                rows += len(chunk)
+        # A file without rows writes no partition
+        if os.path.exists(temp_path):
+            os.replace(temp_path, partition_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+        raise
+    return rows, sketches
+
+
+def ingest_file(file_path, encoding, dtypes, output_dir, chunksize):
+    """
+    Worker: write one file as a partition of the merged dataset
+    """
+    start = time.perf_counter()
+    file_name = os.path.basename(file_path)
+    partition_path = os.path.join(output_dir, f"source_file={file_name}", "part-0.parquet")
+
+    try:
+        rows, sketches = _write_partition(file_path, encoding, dtypes, partition_path, chunksize)
+    except UnicodeDecodeError:
+        # Non UTF-8 bytes after the sniffed prefix: redo the file as latin1
+        encoding = "latin1"
+        rows, sketches = _write_partition(file_path, encoding, dtypes, partition_path, chunksize)
+
+    header = pd.read_csv(file_path, encoding=encoding, nrows=0).columns
+    return {
+        "file_name": file_name,
+        "rows": rows,
+        "encoding": encoding,
+        "missing_columns": [col for col in dtypes if col not in header],
+        "sketches": sketches,
+        "seconds": time.perf_counter() - start,
+    }
+
 
 def main():
     """
-    Main function: read all CSV files and merge them
+    Main function: read all CSV files in parallel and merge them
     """
-    # File path pattern
-    csv_path = 'archive/*.csv'
-    
-    # List to store all successfully read DataFrames
-    all_dfs = []
-    
-    # Dictionary to store row count for each file
-    file_stats = {}
-    
+    parser = argparse.ArgumentParser(description="Merge the archive CSV files into one Parquet dataset")
+    parser.add_argument("--input", default="archive/*.csv", help="glob pattern of the CSV files")
+    parser.add_argument("--output", default=MERGED_DATASET_PATH, help="partitioned dataset directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunksize", type=int, default=200000, help="rows per chunk within a file")
+    args = parser.parse_args()
+
     # Get all matching file paths
-    csv_files = glob.glob(csv_path)
-    
+    csv_files = sorted(glob.glob(args.input))
+
     if not csv_files:
-        print(f"Warning: No .csv files found in the archive directory")
+        print(f"Warning: No .csv files found matching {args.input}")
         return
-    
+
     print(f"Found {len(csv_files)} CSV files...")
-    
-    # Iterate through each file and read
-    for file_path in csv_files:
-        file_name = os.path.basename(file_path)
-        try:
-            print(f"Reading file: {file_name}")
-            
-            # Try different encodings
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        # Sniff encodings and sample column types, then agree on one schema
+        file_schemas = list(executor.map(read_file_schema, csv_files))
+        dtypes = reconcile_schemas(file_schemas)
+        print(f"\nReconciled schema ({len(dtypes)} columns):")
+        for col, dtype in dtypes.items():
+            print(f"  {col}: {dtype}")
+
+        if os.path.exists(args.output):
+            shutil.rmtree(args.output)
+
+        futures = {}
+        for schema in file_schemas:
+            print(f"Reading file: {os.path.basename(schema['file_path'])} ({schema['encoding']})")
+            future = executor.submit(ingest_file, schema["file_path"], schema["encoding"],
+                                     dtypes, args.output, args.chunksize)
+            futures[future] = os.path.basename(schema["file_path"])
+
+        # Dictionary to store row count for each file
+        file_stats = {}
+        file_sketches = []
+        for future, file_name in futures.items():
             try:
-                df = pd.read_csv(file_path, encoding='utf-8')
-            except UnicodeDecodeError:
-                df = pd.read_csv(file_path, encoding='latin1')
-            
-            # Add a column with the source file name
-            df['source_file'] = file_name
-            
-            # Record row count
-            file_stats[file_name] = len(df)
-            
-            # Append to list
-            all_dfs.append(df)
-            
-            print(f"Successfully read {file_name} with {len(df)} rows")
-        
-        except Exception as e:
-            print(f"Failed to read file {file_name}: {str(e)}")
-    
+                result = future.result()
+                file_stats[file_name] = result["rows"]
+                file_sketches.append(result["sketches"])
+                note = f", missing columns filled with NA: {result['missing_columns']}" if result["missing_columns"] else ""
+                print(f"Successfully read {file_name} with {result['rows']} rows "
+                      f"({result['encoding']}, {result['seconds']:.1f}s{note})")
+            except Exception as e:
+                print(f"Failed to read file {file_name}: {str(e)}")
+
     # Check if any files were read successfully
-    if not all_dfs:
+    if not file_stats:
         print("Error: No files were successfully read")
         return
-    
-    # Merge all DataFrames
+
     try:
-        df_all = pd.concat(all_dfs, ignore_index=True)
-        print("\nFiles merged successfully!")
-        
+        dataset = ds.dataset(args.output, format="parquet", partitioning="hive")
+        print(f"\nFiles merged successfully in {time.perf_counter() - start:.1f}s!")
+
         # Print merged data info
-        print(f"\nMerged data dimensions (rows, columns): {df_all.shape}")
-        
+        print(f"\nMerged data dimensions (rows, columns): ({sum(file_stats.values())}, {len(dataset.schema.names)})")
+
         print("\nColumn names:")
-        print(df_all.columns.tolist())
-        
+        print(dataset.schema.names)
+
         # Show number of rows contributed by each file
         print("\nNumber of rows from each file:")
-        file_counts = df_all.groupby('source_file').size()
-        for file_name, count in file_counts.items():
+        for file_name, count in sorted(file_stats.items()):
             print(f"{file_name}: {count} rows")
-        
+
+        sketches = merge_sketches(file_sketches)
+        if sketches:
+            print("\nStatistics of the merged data (quartiles approximate):")
+            print(pd.DataFrame({col: sketch.describe() for col, sketch in sketches.items()}))
+
         print("\nPreview of first 5 rows:")
-        print(df_all.head())
-        
-        # Optionally: save the merged data
-        df_all.to_csv('merged_data.csv', index=False)
-        print("\nMerged data saved to merged_data.csv")
-        
+        print(dataset.head(5).to_pandas())
+
+        print(f"\nMerged data saved to {args.output}/ (one partition per source file)")
+
     except Exception as e:
-        print(f"Error merging files: {str(e)}")
+        print(f"Error reading merged dataset: {str(e)}")
+
 
 if __name__ == "__main__":
     main()
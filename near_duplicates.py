@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Near-duplicate listing detection with MinHash and LSH on product titles
+
+De-duplication by ASIN (asin_dedup.py) misses the same product listed under
+several ASINs (variants, resellers), which still counts its sales several
+times. Listings whose titles are nearly identical are grouped here:
+
+- each title is normalized (lower-cased word tokens, as in title_index.py)
+  and cut into overlapping character shingles of SHINGLE_SIZE bytes
+- a MinHash signature of NUM_PERM values summarizes the shingle set; two
+  signatures agree in a position with probability equal to the Jaccard
+  similarity of the two shingle sets. Signatures are computed with numpy
+  over chunks of titles, in parallel worker processes
+- LSH banding splits each signature into BANDS bands; titles sharing a
+  band land in the same bucket, which gives the candidate pairs without
+  comparing every pair of titles. Each member of a bucket is paired with
+  the bucket's first row
+- candidate pairs whose estimated similarity reaches SIMILARITY_THRESHOLD
+  are linked, and the connected groups of linked listings become clusters
+- titles without any word token (missing, empty or punctuation only) have
+  nothing to compare; they are left out of hashing and each stays a
+  cluster of its own
+
+The clusters are saved as (asin, cluster_id, cluster_size) for every row of
+the further cleaned table. further_clean_data.py can collapse each cluster
+to one listing before aggregating (--collapse-near-duplicates); the survivor
+is chosen by the asin_dedup survivor policy (highest reviews by default).
+"""
+
+import argparse
+import os
+import time
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from columnar_store import FURTHER_CLEANED_PATH, load_table, save_table
+from asin_dedup import DEFAULT_POLICY, policy_columns
+from title_index import TOKEN_PATTERN
+
+# Near-duplicate clusters of the further cleaned table
+CLUSTERS_PATH = 'output/near_duplicate_clusters.parquet'
+
+# Character shingle length in bytes of the normalized title (at most 8: a
+# shingle is packed into one 64-bit integer)
+SHINGLE_SIZE = 5
+
+# MinHash signature length, split into BANDS bands of NUM_PERM // BANDS values
+NUM_PERM = 128
+BANDS = 16
+
+# Estimated Jaccard similarity of two titles' shingles from which they are near duplicates
+SIMILARITY_THRESHOLD = 0.8
+
+# Titles hashed per worker task
+CHUNK_ROWS = 50000
+
+# Candidate pairs compared per step when verifying
+VERIFY_BATCH = 500000
+
+# Clusters listed in the report
+TOP_CLUSTERS = 10
+
+
+def hash_parameters(num_perm=NUM_PERM, seed=0):
+    """
+    Multipliers (odd) and offsets of the num_perm multiply-shift hash functions
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def normalize_titles(titles):
+    """
+    Lower-cased word tokens of each title joined by single spaces
+    """
+    return titles.fillna('').astype(str).str.lower().str.findall(TOKEN_PATTERN).str.join(' ')
+
+
+def has_tokens(titles):
+    """
+    Whether each title has at least one word token
+    """
+    return titles.fillna('').astype(str).str.contains(TOKEN_PATTERN).to_numpy(dtype=bool)
+
+
+def signature_chunk(task):
+    """
+    MinHash signatures (rows x num_perm, uint32) of one chunk of titles
+
+    Every title must have at least one word token (see has_tokens()).
+    """
+    titles, a, b, shingle_size = task
+    # Titles shorter than a shingle are padded, so every title has at least one
+    normalized = normalize_titles(pd.Series(titles)).str.pad(shingle_size, side='right')
+    encoded = [title.encode('utf-8') for title in normalized]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    # Every window of shingle_size bytes packed into one integer
+    windows = np.lib.stride_tricks.sliding_window_view(data, shingle_size).astype(np.uint64)
+    shifts = np.arange(shingle_size, dtype=np.uint64) * np.uint64(8)
+    packed = np.bitwise_or.reduce(windows << shifts, axis=1)
+
+    # Keep the windows that lie inside one title; each title's windows are contiguous
+    counts = lengths - shingle_size + 1
+    title_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    first_window = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    positions = np.repeat(title_starts - first_window, counts) + np.arange(counts.sum())
+    shingles = packed[positions]
+
+    signatures = np.empty((len(encoded), len(a)), dtype=np.uint32)
+    for i in range(len(a)):
+        # Multiply-shift hashing: the high 32 bits of a * x + b (mod 2**64)
+        hashed = ((a[i] * shingles + b[i]) >> np.uint64(32)).astype(np.uint32)
+        signatures[:, i] = np.minimum.reduceat(hashed, first_window)
+    return signatures
+
+
+def minhash_signatures(titles, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, workers=None, seed=0,
+                       chunk_rows=CHUNK_ROWS):
+    """
+    MinHash signatures of a Series of titles, computed in parallel chunks
+    """
+    if not 1 <= shingle_size <= 8:
+        raise ValueError(f'Shingle size must be between 1 and 8 bytes, got {shingle_size}')
+    a, b = hash_parameters(num_perm, seed)
+    values = titles.tolist()
+    tasks = [(values[start:start + chunk_rows], a, b, shingle_size)
+             for start in range(0, len(values), chunk_rows)]
+    if not tasks:
+        return np.empty((0, num_perm), dtype=np.uint32)
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(signature_chunk, tasks))
+    else:
+        parts = [signature_chunk(task) for task in tasks]
+    return np.concatenate(parts)
+
+
+def candidate_pairs(signatures, bands=BANDS):
+    """
+    (first, second) row pairs that share at least one LSH band, each pair once
+    """
+    rows, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f'{bands} bands do not divide a signature of {num_perm} values')
+    if rows < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    width = num_perm // bands
+    # Bucket key of a band: its values combined with random odd multipliers
+    # (mod 2**64). Unequal bands that collide only add candidates, which
+    # verify_pairs() then drops
+    multipliers, _ = hash_parameters(width, seed=bands)
+    index = np.arange(rows)
+    pairs = []
+    for band in range(bands):
+        keys = (signatures[:, band * width:(band + 1) * width].astype(np.uint64) * multipliers).sum(axis=1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]])
+        # Pair every row of a bucket with the bucket's first (lowest) row,
+        # encoded as first * rows + row to de-duplicate across bands
+        first = order[np.maximum.accumulate(np.where(starts, index, 0))]
+        pairs.append(first[~starts].astype(np.int64) * rows + order[~starts])
+    pairs = np.sort(np.concatenate(pairs))
+    pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])] if len(pairs) else pairs
+    return np.stack([pairs // rows, pairs % rows], axis=1)
+
+
+def verify_pairs(signatures, pairs, threshold=SIMILARITY_THRESHOLD, batch=VERIFY_BATCH):
+    """
+    The candidate pairs whose estimated Jaccard similarity reaches threshold
+    """
+    keep = np.zeros(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), batch):
+        part = pairs[start:start + batch]
+        similarity = (signatures[part[:, 0]] == signatures[part[:, 1]]).mean(axis=1)
+        keep[start:start + batch] = similarity >= threshold
+    return pairs[keep]
+
+
+def cluster_labels(rows, pairs):
+    """
+    Cluster number of each row, linking the rows of every pair (connected components)
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(rows, rows))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def find_near_duplicates(df, num_perm=NUM_PERM, bands=BANDS, shingle_size=SHINGLE_SIZE,
+                         threshold=SIMILARITY_THRESHOLD, workers=None, seed=0):
+    """
+    Near-duplicate clusters of the titles of df
+
+    Returns a DataFrame aligned with df's rows with asin, cluster_id (the
+    same for every listing of a cluster, numbered in order of the cluster's
+    first row) and cluster_size, and the number of candidate and linked pairs.
+    Titles without word tokens are never linked: each is its own cluster.
+    """
+    hashed = np.flatnonzero(has_tokens(df['title']))
+    signatures = minhash_signatures(df['title'].iloc[hashed], num_perm, shingle_size, workers, seed)
+    candidates = candidate_pairs(signatures, bands)
+    linked = verify_pairs(signatures, candidates, threshold)
+    # Back to df's row numbers; rows left out of hashing stay unlinked
+    labels = cluster_labels(len(df), hashed[linked])
+    clusters = pd.DataFrame({'asin': df['asin'].to_numpy(), 'cluster_id': labels.astype('int64')})
+    clusters['cluster_size'] = clusters.groupby('cluster_id')['cluster_id'].transform('size').astype('int64')
+    return clusters, {'candidate_pairs': len(candidates), 'linked_pairs': len(linked)}
+
+
+def collapse_clusters(df, cluster_ids, policy=DEFAULT_POLICY):
+    """
+    Keep one listing per near-duplicate cluster, chosen by the survivor policy
+
+    cluster_ids is aligned with df's rows. Returns the surviving rows (in
+    their original order) and the number of rows removed.
+    """
+    cluster_ids = np.asarray(cluster_ids)
+    if len(np.unique(cluster_ids)) == len(df):
+        return df, 0
+    ordered = df.assign(_cluster=cluster_ids).sort_values(policy_columns(policy, df.columns),
+                                                          ascending=False, kind='stable', na_position='last')
+    survivors = ordered[~ordered.duplicated('_cluster')].sort_index().drop(columns='_cluster')
+    return survivors, len(df) - len(survivors)
+
+
+def cluster_stats(df, clusters, top=TOP_CLUSTERS):
+    """
+    Size of the clustering and its largest clusters, with the sales counted more than once
+    """
+    duplicated = clusters['cluster_size'] > 1
+    sales = df['boughtInLastMonth'].to_numpy(dtype='float64') if 'boughtInLastMonth' in df.columns else None
+    stats = {
+        'rows': len(clusters),
+        'clusters': int(clusters.loc[duplicated, 'cluster_id'].nunique()),
+        'clustered_rows': int(duplicated.sum()),
+        'removable_rows': int(duplicated.sum() - clusters.loc[duplicated, 'cluster_id'].nunique()),
+    }
+    sizes = clusters.loc[duplicated].groupby('cluster_id').size().sort_values(ascending=False, kind='stable')
+    examples = []
+    for cluster_id, size in sizes.head(top).items():
+        members = np.flatnonzero(clusters['cluster_id'].to_numpy() == cluster_id)
+        examples.append({'cluster_id': cluster_id, 'size': int(size),
+                         'title': df['title'].iloc[members[0]],
+                         'sales': float(np.nansum(sales[members])) if sales is not None else None})
+    stats['top_clusters'] = examples
+    return stats
+
+
+def run(df=None, num_perm=NUM_PERM, bands=BANDS, shingle_size=SHINGLE_SIZE, threshold=SIMILARITY_THRESHOLD,
+        workers=None, output=CLUSTERS_PATH):
+    """
+    Find the near-duplicate listings of the further cleaned data and save the clusters
+
+    df is the further cleaned data if already in memory; otherwise it is read from disk.
+    Returns the clusters DataFrame.
+    """
+    print('=' * 50)
+    print('Starting near-duplicate listing detection')
+    print('=' * 50)
+
+    # ==================== 1. Load Data ====================
+    print('\n1. Loading Data')
+    print('-' * 30)
+    if df is None:
+        try:
+            df = load_table(FURTHER_CLEANED_PATH, columns=['asin', 'title', 'boughtInLastMonth'])
+            print(f'Successfully loaded: {FURTHER_CLEANED_PATH}')
+        except Exception as e:
+            print(f'Error reading file: {e}')
+            exit(1)
+    print(f'Listings: {len(df)}')
+
+    # ==================== 2. MinHash and LSH ====================
+    print('\n2. MinHash Signatures and LSH Candidates')
+    print('-' * 30)
+    print(f'{shingle_size}-byte shingles, {num_perm} hash functions, {bands} bands of {num_perm // bands}, '
+          f'similarity threshold {threshold}')
+    start = time.perf_counter()
+    try:
+        clusters, pair_counts = find_near_duplicates(df, num_perm, bands, shingle_size, threshold, workers)
+    except Exception as e:
+        print(f'Error finding near duplicates: {e}')
+        return None
+    print(f'Candidate pairs: {pair_counts["candidate_pairs"]}, linked pairs: {pair_counts["linked_pairs"]} '
+          f'({time.perf_counter() - start:.1f}s)')
+
+    # ==================== 3. Clusters ====================
+    print('\n3. Near-Duplicate Clusters')
+    print('-' * 30)
+    stats = cluster_stats(df, clusters)
+    print(f'Clusters of near-duplicate listings: {stats["clusters"]}')
+    print(f'Listings in clusters: {stats["clustered_rows"]}')
+    print(f'Listings removed if collapsed: {stats["removable_rows"]} '
+          f'({stats["removable_rows"] / max(stats["rows"], 1) * 100:.2f}%)')
+    if stats['top_clusters']:
+        print(f'\nTop {len(stats["top_clusters"])} Largest Clusters:')
+        for cluster in stats['top_clusters']:
+            sales = f', {cluster["sales"]:.0f} bought last month' if cluster['sales'] is not None else ''
+            print(f'  #{cluster["cluster_id"]}: {cluster["size"]} listings{sales} - {cluster["title"]}')
+
+    save_table(clusters, output)
+    print(f'\nSaved clusters to: {output}')
+    print('=' * 50)
+    return clusters
+
+
+def add_arguments(parser):
+    """
+    Detection options, shared with analytics_cli.py
+    """
+    parser.add_argument('--num-perm', type=int, default=NUM_PERM, help='MinHash signature length')
+    parser.add_argument('--bands', type=int, default=BANDS, help='LSH bands (must divide --num-perm)')
+    parser.add_argument('--shingle-size', type=int, default=SHINGLE_SIZE, help='character shingle length (1-8)')
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='estimated title similarity from which listings are near duplicates')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='hashing processes')
+    parser.add_argument('--output', default=CLUSTERS_PATH, help='clusters table')
+    return parser
+
+
+def main():
+    """
+    Main function: cluster the near-duplicate listings of the further cleaned data
+    """
+    parser = argparse.ArgumentParser(description='Find near-duplicate listings by title similarity')
+    args = add_arguments(parser).parse_args()
+    run(num_perm=args.num_perm, bands=args.bands, shingle_size=args.shingle_size, threshold=args.threshold,
+        workers=args.workers, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Per-category robust outlier detection on log price, reviews and sales
+
+The fixed 1-1000 GBP window treats every category alike: it drops genuine
+expensive equipment and keeps implausibly cheap items in categories where
+everything else costs far more. Here each categoryName gets its own robust
+statistics of log10(price), and a product is a price outlier when its log
+price lies far from its category's centre:
+
+- mad: more than Z_THRESHOLD scaled MADs (1.4826 * MAD) from the median
+- iqr: more than IQR_MULTIPLIER interquartile ranges outside the quartiles
+
+Prices of zero or less (or missing) are always outliers. Reviews and
+boughtInLastMonth are checked the same way on the high side only, over the
+products with a positive count (most products have none, so zeros never
+count as anomalies); these are flagged for review, not filtered.
+
+The statistics come from fixed-width histograms of log10 values (LOG_BIN
+decades wide) per category and measure. A chunk of rows updates every
+category in one grouped pass, and histograms of different chunks, files or
+processes merge by adding counts, so a whole table costs one scan however
+many categories it has. Medians, quartiles and MADs read from the
+histograms are within about one bin (2.3% in price) of the exact values.
+Categories with fewer than MIN_CATEGORY_ROWS values use the statistics of
+all categories pooled.
+"""
+
+import argparse
+import os
+import time
+import pandas as pd
+import numpy as np
+from columnar_store import CLEANED_DATA_PATH, load_table
+from features import PRICE_MIN, PRICE_MAX
+
+# Per-category bounds of the last run (in GBP / counts)
+OUTLIER_STATS_PATH = 'output/outlier_statistics.csv'
+
+# Checked measures: name -> column
+MEASURES = {'price': 'price', 'reviews': 'reviews', 'sales': 'boughtInLastMonth'}
+
+# Flag column of each measure
+FLAG_COLUMNS = {'price': 'price_outlier', 'reviews': 'reviews_anomaly', 'sales': 'sales_anomaly'}
+
+# Measures checked on both sides (the others only for unusually high values)
+TWO_SIDED = ['price']
+
+# Histogram range and bin width in log10 units (values outside fall in the end bins)
+LOG_MIN = -2.0
+LOG_MAX = 7.0
+LOG_BIN = 0.01
+N_BINS = int(round((LOG_MAX - LOG_MIN) / LOG_BIN))
+
+# Detection rules
+METHODS = ['mad', 'iqr']
+Z_THRESHOLD = 3.5
+IQR_MULTIPLIER = 3.0
+MAD_SCALE = 1.4826
+
+# Smallest spread used, so categories of identical values do not flag every difference
+MIN_SPREAD = 0.05
+
+# Categories with fewer values than this use the pooled statistics
+MIN_CATEGORY_ROWS = 30
+
+# Label of rows without a category
+MISSING_CATEGORY = '(missing)'
+
+
+class CategoryLogHistograms:
+    """
+    Mergeable per-category histograms of log10 price, reviews and sales
+    """
+
+    def __init__(self, measures=MEASURES):
+        self.measures = dict(measures)
+        self.categories = []
+        self._index = {}
+        self.hist = {name: np.zeros((0, N_BINS), dtype=np.int64) for name in self.measures}
+        # Rows whose value is zero or negative (not in the histogram)
+        self.nonpositive = {name: np.zeros(0, dtype=np.int64) for name in self.measures}
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    def _category_rows(self, names):
+        """
+        Histogram row of each category name, adding rows for new categories
+        """
+        positions = []
+        for name in names:
+            if name not in self._index:
+                self._index[name] = len(self.categories)
+                self.categories.append(name)
+            positions.append(self._index[name])
+        grow = len(self.categories) - len(self.rows)
+        if grow:
+            for name in self.measures:
+                self.hist[name] = np.vstack([self.hist[name], np.zeros((grow, N_BINS), dtype=np.int64)])
+                self.nonpositive[name] = np.concatenate([self.nonpositive[name], np.zeros(grow, dtype=np.int64)])
+            self.rows = np.concatenate([self.rows, np.zeros(grow, dtype=np.int64)])
+        return np.array(positions, dtype=np.int64)
+
+    def update(self, df):
+        """
+        Add the rows of a chunk (categoryName plus the measure columns)
+        """
+        codes, uniques = pd.factorize(df['categoryName'])
+        names = [str(name) for name in uniques] + [MISSING_CATEGORY]
+        # factorize marks missing names with -1, which picks the last entry
+        rows = self._category_rows(names)[codes]
+        n = len(self.categories)
+        self.rows += np.bincount(rows, minlength=n)
+        for name, col in self.measures.items():
+            values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+            positive = values > 0
+            self.nonpositive[name] += np.bincount(rows[values <= 0], minlength=n)
+            bins = log_bins(values[positive])
+            self.hist[name] += np.bincount(rows[positive] * N_BINS + bins,
+                                           minlength=n * N_BINS).reshape(n, N_BINS)
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of histograms built on other rows
+        """
+        rows = self._category_rows(other.categories)
+        for name in self.measures:
+            self.hist[name][rows] += other.hist[name]
+            self.nonpositive[name][rows] += other.nonpositive[name]
+        self.rows[rows] += other.rows
+        return self
+
+    def statistics(self, min_rows=MIN_CATEGORY_ROWS):
+        """
+        Robust statistics of each category (log10 units), indexed by categoryName
+
+        For every measure: <measure>_count (positive values), _median, _mad,
+        _q1, _q3 and _pooled (True where the category was too small and the
+        pooled statistics were used).
+        """
+        stats = pd.DataFrame({'rows': self.rows}, index=pd.Index(self.categories, name='categoryName'))
+        for name in self.measures:
+            hist = self.hist[name]
+            pooled = hist.sum(axis=0, keepdims=True)
+            table = histogram_statistics(np.vstack([hist, pooled]))
+            small = hist.sum(axis=1) < min_rows
+            for key, values in table.items():
+                values = np.where(small, values[-1], values[:-1]) if key != 'count' else values[:-1]
+                stats[f'{name}_{key}'] = values
+            stats[f'{name}_pooled'] = small
+        return stats
+
+
+def log_bins(values):
+    """
+    Histogram bin of each positive value
+    """
+    bins = np.floor((np.log10(values) - LOG_MIN) / LOG_BIN)
+    return np.clip(bins, 0, N_BINS - 1).astype(np.int64)
+
+
+def histogram_statistics(hist):
+    """
+    count, median, mad, q1 and q3 (log10 units) of each row of histograms
+    """
+    count = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+
+    def quantile(q):
+        # Linear interpolation inside the bin holding the q-th value
+        target = q * count
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), N_BINS - 1)
+        rows = np.arange(len(hist))
+        before = np.where(index > 0, cumulative[rows, index - 1], 0)
+        in_bin = hist[rows, index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.5)
+        return np.where(count > 0, LOG_MIN + (index + fraction) * LOG_BIN, np.nan)
+
+    median = quantile(0.5)
+    # MAD: the median distance of the bin centres from the median
+    centres = LOG_MIN + (np.arange(N_BINS) + 0.5) * LOG_BIN
+    distance = np.abs(centres[None, :] - np.nan_to_num(median)[:, None])
+    order = np.argsort(distance, axis=1, kind='stable')
+    sorted_counts = np.take_along_axis(hist, order, axis=1).cumsum(axis=1)
+    half = np.minimum((sorted_counts < (count / 2)[:, None]).sum(axis=1), N_BINS - 1)
+    mad = np.where(count > 0, np.take_along_axis(distance, order, axis=1)[np.arange(len(hist)), half], np.nan)
+    return {'count': count, 'median': median, 'mad': mad, 'q1': quantile(0.25), 'q3': quantile(0.75)}
+
+
+def outlier_bounds(stats, method='mad', threshold=None):
+    """
+    Lower and upper log10 bounds of each category and measure
+
+    threshold is the number of scaled MADs (mad) or interquartile ranges
+    (iqr); by default Z_THRESHOLD or IQR_MULTIPLIER. One-sided measures get
+    a lower bound of -inf.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown outlier method: {method} (choose from {METHODS})')
+    bounds = pd.DataFrame(index=stats.index)
+    for name in [col[:-len('_median')] for col in stats.columns if col.endswith('_median')]:
+        if method == 'mad':
+            spread = np.maximum(MAD_SCALE * stats[f'{name}_mad'], MIN_SPREAD) * (threshold or Z_THRESHOLD)
+            low, high = stats[f'{name}_median'] - spread, stats[f'{name}_median'] + spread
+        else:
+            spread = np.maximum(stats[f'{name}_q3'] - stats[f'{name}_q1'], MIN_SPREAD) * (threshold or IQR_MULTIPLIER)
+            low, high = stats[f'{name}_q1'] - spread, stats[f'{name}_q3'] + spread
+        bounds[f'{name}_low'] = low if name in TWO_SIDED else -np.inf
+        bounds[f'{name}_high'] = high
+    return bounds
+
+
+def flag_outliers(df, bounds, measures=MEASURES):
+    """
+    Outlier flags of each row of df, from the per-category bounds
+
+    Returns a DataFrame aligned with df with one boolean column per measure
+    (FLAG_COLUMNS). Categories without statistics are only flagged for prices
+    that are missing, zero or negative.
+    """
+    codes, uniques = pd.factorize(df['categoryName'])
+    names = [str(name) for name in uniques] + [MISSING_CATEGORY]
+    per_category = bounds.reindex(names)
+    # Unseen categories are never flagged (no statistics to compare with)
+    per_category = per_category.fillna({col: -np.inf for col in bounds.columns if col.endswith('_low')})
+    per_category = per_category.fillna(np.inf)
+    flags = pd.DataFrame(index=df.index)
+    for name, col in measures.items():
+        values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+        low = per_category[f'{name}_low'].to_numpy()[codes]
+        high = per_category[f'{name}_high'].to_numpy()[codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logs = np.log10(values)
+        if name in TWO_SIDED:
+            # Missing, zero and negative values cannot be placed in the distribution
+            flagged = ~(values > 0) | (logs < low) | (logs > high)
+        else:
+            flagged = (values > 0) & (logs > high)
+        flags[FLAG_COLUMNS[name]] = flagged
+    return flags
+
+
+def detect_outliers(df, method='mad', threshold=None, min_rows=MIN_CATEGORY_ROWS):
+    """
+    Statistics, bounds and flags of an in-memory frame (one grouped pass)
+    """
+    stats = CategoryLogHistograms().update(df).statistics(min_rows)
+    bounds = outlier_bounds(stats, method, threshold)
+    return flag_outliers(df, bounds), stats, bounds
+
+
+def scan_statistics(chunks, min_rows=MIN_CATEGORY_ROWS):
+    """
+    Per-category statistics of a stream of row chunks, in one pass
+    """
+    histograms = CategoryLogHistograms()
+    for chunk in chunks:
+        histograms.update(chunk)
+    return histograms.statistics(min_rows)
+
+
+def bounds_table(stats, bounds):
+    """
+    Readable per-category bounds (GBP and counts instead of log10 values)
+    """
+    table = pd.DataFrame({'rows': stats['rows']})
+    for name in MEASURES:
+        table[f'{name}_median'] = 10 ** stats[f'{name}_median']
+        if name in TWO_SIDED:
+            table[f'{name}_low'] = 10 ** bounds[f'{name}_low']
+        table[f'{name}_high'] = 10 ** bounds[f'{name}_high']
+        table[f'{name}_pooled'] = stats[f'{name}_pooled']
+    return table
+
+
+def run(df=None, method='mad', threshold=None, output=OUTLIER_STATS_PATH):
+    """
+    Compare per-category outlier detection with the fixed price window on the cleaned data
+
+    df is the cleaned data if already in memory; otherwise it is read from disk.
+    Returns the flags DataFrame.
+    """
+    print('=' * 50)
+    print('Starting per-category outlier detection')
+    print('=' * 50)
+
+    # ==================== 1. Load Cleaned Data ====================
+    print('\n1. Loading Cleaned Data')
+    print('-' * 30)
+    if df is None:
+        try:
+            df = load_table(CLEANED_DATA_PATH, columns=['categoryName'] + list(MEASURES.values()))
+            print(f'Successfully loaded: {CLEANED_DATA_PATH}')
+        except Exception as e:
+            print(f'Error reading file: {e}')
+            exit(1)
+    print(f'Products: {len(df)}')
+
+    # ==================== 2. Category Statistics ====================
+    print('\n2. Per-Category Statistics')
+    print('-' * 30)
+    start = time.perf_counter()
+    try:
+        flags, stats, bounds = detect_outliers(df, method, threshold)
+    except Exception as e:
+        print(f'Error detecting outliers: {e}')
+        return None
+    print(f'Categories: {len(stats)} ({int(stats["price_pooled"].sum())} with fewer than {MIN_CATEGORY_ROWS} '
+          f'prices use the pooled statistics)')
+    print(f'Method: {method}, threshold {threshold or (Z_THRESHOLD if method == "mad" else IQR_MULTIPLIER)} '
+          f'({time.perf_counter() - start:.2f}s)')
+
+    # ==================== 3. Outliers ====================
+    print('\n3. Outliers and Anomalies')
+    print('-' * 30)
+    for name, col in FLAG_COLUMNS.items():
+        print(f'{col}: {int(flags[col].sum())} products ({flags[col].mean() * 100:.2f}%)')
+
+    # ==================== 4. Comparison with the Price Window ====================
+    print(f'\n4. Comparison with the Fixed {PRICE_MIN}-{PRICE_MAX} GBP Window')
+    print('-' * 30)
+    in_window = (df['price'] >= PRICE_MIN) & (df['price'] <= PRICE_MAX)
+    robust_keeps = ~flags['price_outlier']
+    rescued = robust_keeps & ~in_window
+    dropped = ~robust_keeps & in_window
+    print(f'Kept by the window: {int(in_window.sum())}, kept by per-category detection: {int(robust_keeps.sum())}')
+    print(f'Outside the window but typical of their category (kept): {int(rescued.sum())}')
+    print(f'Inside the window but outliers in their category (dropped): {int(dropped.sum())}')
+    for label, mask in [('kept', rescued), ('dropped', dropped)]:
+        if mask.any():
+            top = df.loc[mask, 'categoryName'].astype('object').value_counts().head(5)
+            print(f'\nCategories with the most products {label}:')
+            for category, count in top.items():
+                median = 10 ** stats.loc[str(category), 'price_median']
+                print(f'  {category}: {count} (category median £{median:.2f})')
+
+    # ==================== 5. Save Bounds ====================
+    if not os.path.exists(os.path.dirname(output) or '.'):
+        os.makedirs(os.path.dirname(output))
+    bounds_table(stats, bounds).to_csv(output, encoding='utf-8')
+    print(f'\nSaved per-category bounds to: {output}')
+    print('=' * 50)
+    return flags
+
+
+def add_arguments(parser):
+    """
+    Detection options, shared with analytics_cli.py
+    """
+    parser.add_argument('--method', choices=METHODS, default='mad', help='robust outlier rule')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help=f'scaled MADs (default {Z_THRESHOLD}) or IQRs (default {IQR_MULTIPLIER})')
+    parser.add_argument('--output', default=OUTLIER_STATS_PATH, help='per-category bounds CSV')
+    return parser
+
+
+def main():
+    """
+    Main function: per-category outlier report on the cleaned data
+    """
+    parser = argparse.ArgumentParser(description='Per-category robust outlier detection')
+    args = add_arguments(parser).parse_args()
+    run(method=args.method, threshold=args.threshold, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline runner with content-hash caching
+
+The analysis scripts are modelled as a DAG of stages with declared inputs,
+outputs and parameters. A stage's parameters are the command-line options
+its script is run with ({'price_filter': 'robust'} runs it with
+--price-filter robust; True adds a flag, False leaves it out). Parameters
+listed in a stage's 'positional' are passed as positional arguments
+instead (one value, or each value of a list). A stage's fingerprint
+combines:
+- the content hash of each input file
+- the source of the script and of every local module it imports, which
+  covers constants such as the price bins (features.py)
+- its parameters
+
+A stage is skipped when its fingerprint matches the last successful run and
+all of its outputs still exist. Because inputs are hashed by content, a
+re-run upstream stage that produces identical output does not invalidate
+the stages after it.
+
+Usage:
+    python pipeline_runner.py                  # run what is out of date
+    python pipeline_runner.py visualization    # a stage and its upstream stages
+    python pipeline_runner.py --dry-run        # show the plan only
+    python pipeline_runner.py --force clean    # ignore the cache
+    python pipeline_runner.py --set further_clean.price_filter=robust
+    python pipeline_runner.py --set 'category_analysis.categories=["Sports", "Kitchen"]'
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from data_loader import RAW_DATA_PATH
+from columnar_store import CLEANED_DATA_PATH, FURTHER_CLEANED_PATH, SPORT_PRODUCTS_PATH
+from tier_engine import TIER_RULES_PATH
+from category_taxonomy import TAXONOMY_PATH
+from aggregation_cube import CUBE_PATH
+from correlation_engine import CORRELATION_RESULTS_PATH, N_BOOTSTRAP
+
+# Directory containing the scripts and their helper modules
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cache manifest: fingerprint of the last successful run of each stage
+CACHE_PATH = 'output/.pipeline_cache.json'
+
+STAGES = [
+    {
+        'name': 'clean',
+        'script': 'clean_and_save_data.py',
+        'inputs': [RAW_DATA_PATH],
+        'outputs': [CLEANED_DATA_PATH, 'output/data_analysis_summary.txt'],
+        'params': {},
+    },
+    {
+        'name': 'further_clean',
+        'script': 'further_clean_data.py',
+        'inputs': [CLEANED_DATA_PATH, TIER_RULES_PATH, TAXONOMY_PATH],
+        'outputs': [FURTHER_CLEANED_PATH, CUBE_PATH, 'output/further_analysis_summary.txt'],
+        'params': {'price_filter': 'window', 'outlier_method': 'mad', 'collapse_near_duplicates': False},
+    },
+    {
+        'name': 'sport_analysis',
+        'script': 'sport_analysis.py',
+        'inputs': [FURTHER_CLEANED_PATH, CUBE_PATH],
+        'outputs': [SPORT_PRODUCTS_PATH, 'output/sport_analysis/price_range_sales.png'],
+        'params': {'sales_chart': 'auto', 'log_density': False},
+    },
+    {
+        'name': 'sport_advanced_analysis',
+        'script': 'sport_advanced_analysis.py',
+        'inputs': [SPORT_PRODUCTS_PATH],
+        'outputs': ['output/sport_analysis/price_range_sales_total.png',
+                    'output/sport_analysis/price_range_sales_avg.png'],
+        'params': {},
+    },
+    {
+        'name': 'category_analysis',
+        'script': 'category_analysis.py',
+        'inputs': [FURTHER_CLEANED_PATH, CUBE_PATH],
+        'outputs': ['output/category_analysis'],
+        'params': {'categories': [], 'min_products': 1, 'sales_chart': 'auto', 'log_density': False},
+        'positional': ['categories'],
+    },
+    {
+        'name': 'correlations',
+        'script': 'correlation_engine.py',
+        'inputs': [FURTHER_CLEANED_PATH],
+        'outputs': [CORRELATION_RESULTS_PATH],
+        'params': {'bootstrap': N_BOOTSTRAP, 'seed': 0},
+    },
+    {
+        'name': 'visualization',
+        'script': 'visualization_analysis.py',
+        'inputs': [FURTHER_CLEANED_PATH, CUBE_PATH],
+        'outputs': ['output/visualization/main_category_distribution.png',
+                    'output/visualization/category_sales_ranking.png'],
+        'params': {},
+    },
+]
+
+
+def hash_file(path, hash_cache):
+    """
+    sha256 of a file (or of all files under a directory)
+
+    Hashes are memoized by (size, mtime) so unchanged large inputs are not
+    re-read on every run.
+    """
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for root, dirs, files in sorted(os.walk(path)):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+                digest.update(hash_file(file_path, hash_cache).encode('utf-8'))
+        return digest.hexdigest()
+
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    cached = hash_cache.get(key)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    hash_cache[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def local_imports(module_path, seen=None):
+    """
+    The script plus every module from CODE_DIR it imports, recursively
+    """
+    if seen is None:
+        seen = set()
+    if module_path in seen:
+        return seen
+    seen.add(module_path)
+
+    with open(module_path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=module_path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            candidate = os.path.join(CODE_DIR, name.split('.')[0] + '.py')
+            if os.path.exists(candidate):
+                local_imports(candidate, seen)
+    return seen
+
+
+def stage_fingerprint(stage, hash_cache):
+    """
+    Fingerprint of a stage's code, parameters and input contents
+    """
+    digest = hashlib.sha256()
+    digest.update(stage['name'].encode('utf-8'))
+    for source in sorted(local_imports(os.path.join(CODE_DIR, stage['script']))):
+        digest.update(os.path.basename(source).encode('utf-8'))
+        digest.update(hash_file(source, hash_cache).encode('utf-8'))
+    digest.update(json.dumps(stage['params'], sort_keys=True).encode('utf-8'))
+    for path in stage['inputs']:
+        digest.update(path.encode('utf-8'))
+        digest.update(hash_file(path, hash_cache).encode('utf-8') if os.path.exists(path) else b'missing')
+    return digest.hexdigest()
+
+
+def stage_dependencies(stages):
+    """
+    Map each stage to the stages producing its inputs
+    """
+    producers = {path: stage['name'] for stage in stages for path in stage['outputs']}
+    return {stage['name']: sorted({producers[path] for path in stage['inputs'] if path in producers})
+            for stage in stages}
+
+
+def select_stages(stages, targets):
+    """
+    Targets plus all their upstream stages, in DAG order
+    """
+    if not targets:
+        return list(stages)
+    names = {stage['name'] for stage in stages}
+    unknown = [target for target in targets if target not in names]
+    if unknown:
+        raise KeyError(f'Unknown stage(s): {unknown}. Available: {sorted(names)}')
+
+    dependencies = stage_dependencies(stages)
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies[name])
+    return [stage for stage in stages if stage['name'] in selected]
+
+
+def load_cache():
+    """
+    Read the cache manifest
+    """
+    if os.path.exists(CACHE_PATH):
+        with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'stages': {}, 'hashes': {}}
+
+
+def save_cache(cache):
+    """
+    Write the cache manifest
+    """
+    if not os.path.exists(os.path.dirname(CACHE_PATH)):
+        os.makedirs(os.path.dirname(CACHE_PATH))
+    with open(CACHE_PATH, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+
+
+def stage_arguments(params, positional=()):
+    """
+    Command-line arguments of a stage's parameters: positional ones first, then options
+    """
+    arguments = []
+    for name in positional:
+        value = params[name]
+        arguments.extend(str(item) for item in (value if isinstance(value, list) else [value]))
+    for name, value in params.items():
+        if name in positional:
+            continue
+        option = '--' + name.replace('_', '-')
+        if value is True:
+            arguments.append(option)
+        elif value is not False and value is not None:
+            arguments.extend([option, str(value)])
+    return arguments
+
+
+def apply_overrides(stages, overrides):
+    """
+    Stages with parameters replaced by STAGE.PARAM=VALUE overrides
+
+    VALUE is read as JSON when it parses (true, 500, ...), otherwise as a string.
+    """
+    stages = [dict(stage, params=dict(stage['params'])) for stage in stages]
+    by_name = {stage['name']: stage for stage in stages}
+    for override in overrides:
+        key, separator, value = override.partition('=')
+        name, _, param = key.partition('.')
+        if not separator or not param or name not in by_name:
+            raise KeyError(f'Invalid override {override!r}: expected STAGE.PARAM=VALUE with a known stage')
+        if param not in by_name[name]['params']:
+            raise KeyError(f'Stage {name} has no parameter {param!r}. Available: {sorted(by_name[name]["params"])}')
+        try:
+            by_name[name]['params'][param] = json.loads(value)
+        except ValueError:
+            by_name[name]['params'][param] = value
+    return stages
+
+
+def run_stage(stage):
+    """
+    Run a stage's script with its parameters in a subprocess; True if it succeeded
+    """
+    command = [sys.executable, os.path.join(CODE_DIR, stage['script'])] + stage_arguments(stage['params'], stage.get('positional', ()))
+    result = subprocess.run(command)
+    missing = [path for path in stage['outputs'] if not os.path.exists(path)]
+    if result.returncode != 0 or missing:
+        print(f'Stage {stage["name"]} failed (exit code {result.returncode}, missing outputs: {missing})')
+        return False
+    return True
+
+
+def main():
+    """
+    Main function: run the out-of-date stages of the pipeline
+    """
+    parser = argparse.ArgumentParser(description='Run the analysis pipeline, skipping up-to-date stages')
+    parser.add_argument('stages', nargs='*', help='target stages (default: all)')
+    parser.add_argument('--force', action='store_true', help='run selected stages even if cached')
+    parser.add_argument('--dry-run', action='store_true', help='only show which stages would run')
+    parser.add_argument('--set', action='append', default=[], metavar='STAGE.PARAM=VALUE',
+                        help='override a stage parameter (repeatable)')
+    args = parser.parse_args()
+
+    try:
+        all_stages = apply_overrides(STAGES, args.set)
+        stages = select_stages(all_stages, args.stages)
+    except KeyError as e:
+        print(f'Error: {e.args[0]}')
+        exit(1)
+
+    cache = load_cache()
+
+    print('=' * 50)
+    print('Running analysis pipeline')
+    print('=' * 50)
+
+    dependencies = stage_dependencies(all_stages)
+    planned = set()
+    timings = {}
+    for stage in stages:
+        name = stage['name']
+        fingerprint = stage_fingerprint(stage, cache['hashes'])
+        cached = cache['stages'].get(name, {}).get('fingerprint') == fingerprint
+        outputs_present = all(os.path.exists(path) for path in stage['outputs'])
+        # In a dry run upstream outputs are not refreshed, so follow the plan instead
+        upstream_planned = args.dry_run and any(dep in planned for dep in dependencies[name])
+
+        if cached and outputs_present and not args.force and not upstream_planned:
+            print(f'\n[skip] {name}: up to date')
+            continue
+
+        if args.force:
+            reason = 'forced'
+        elif upstream_planned:
+            reason = 'upstream stage will run'
+        elif cached:
+            reason = 'outputs missing'
+        else:
+            reason = 'inputs, code or parameters changed'
+        print(f'\n[run]  {name}: {reason}')
+        planned.add(name)
+        if args.dry_run:
+            continue
+
+        start = time.perf_counter()
+        if not run_stage(stage):
+            cache['stages'].pop(name, None)
+            save_cache(cache)
+            exit(1)
+        timings[name] = time.perf_counter() - start
+
+        cache['stages'][name] = {'fingerprint': fingerprint,
+                                 'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+        save_cache(cache)
+
+    print('\n' + '=' * 50)
+    if timings:
+        print('Stage run times:')
+        for name, seconds in timings.items():
+            print(f'  {name}: {seconds:.1f}s')
+    else:
+        print('Nothing to run' if not args.dry_run else 'Dry run completed')
+    print('=' * 50)
+
+
+if __name__ == '__main__':
+    main()
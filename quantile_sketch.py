@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Mergeable streaming quantile sketch (KLL)
+
+A KLLSketch summarizes a stream of numbers in O(k log(n / k)) memory. It is
+updated with whole chunks (numpy arrays or Series) and two sketches built
+on different chunks, files or worker processes can be merged into one that
+summarizes the union of their inputs.
+
+Error: a quantile query returns a value whose rank in the full input is
+within eps * n of the requested rank. Over 99 percentiles of 1M-2M values,
+the worst eps measured was about 3.5 / k (1.4% for the default k = 200)
+and the mean about half of that; main() repeats the measurement. Memory is
+a few hundred floats per sketch. count, mean, std, min and max are exact.
+
+Internally level h holds items of weight 2**h. When a level exceeds its
+capacity it is sorted and every other item (random offset) is promoted to
+the next level, which halves the items while keeping ranks unbiased.
+"""
+
+import pandas as pd
+import numpy as np
+import math
+import time
+
+# Default accuracy parameter
+DEFAULT_K = 200
+
+# Capacity decay between levels (capacity of level h is about k * C**(top - h))
+CAPACITY_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch with exact count, sum, min and max
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(math.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays at this level
+                keep = items[:1] if len(items) % 2 else items[:0]
+                items = items[len(keep):]
+                promoted = items[self.rng.integers(0, 2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        """
+        Add a chunk of values (NaN values are ignored)
+        """
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.sumsq += float(np.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Fold another sketch into this one
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def size(self):
+        """
+        Number of retained items
+        """
+        return sum(len(items) for items in self.levels)
+
+    def quantiles(self, qs):
+        """
+        Approximate quantiles (0 <= q <= 1); q = 0 and q = 1 give the exact min and max
+        """
+        qs = np.atleast_1d(np.asarray(qs, dtype='float64'))
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        # Rank of q in the weighted sample, scaled from its total weight
+        index = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        result = values[np.minimum(index, len(values) - 1)]
+        result = np.where(qs <= 0, self.min, result)
+        return np.where(qs >= 1, self.max, result)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def describe(self):
+        """
+        describe()-style statistics; the quartiles are approximate
+        """
+        n = self.count
+        mean = self.sum / n if n else np.nan
+        std = math.sqrt(max(self.sumsq - n * mean * mean, 0.0) / (n - 1)) if n > 1 else np.nan
+        q1, median, q3 = self.quantiles([0.25, 0.5, 0.75])
+        return pd.Series({'count': float(n), 'mean': mean, 'std': std,
+                          'min': self.min if n else np.nan, '25%': q1, '50%': median, '75%': q3,
+                          'max': self.max if n else np.nan})
+
+
+def sketch_columns(chunks, columns, k=DEFAULT_K, seed=None):
+    """
+    One sketch per column, updated from an iterable of DataFrame chunks
+    """
+    sketches = {col: KLLSketch(k=k, seed=seed) for col in columns}
+    for chunk in chunks:
+        for col in columns:
+            sketches[col].update(chunk[col])
+    return sketches
+
+
+def merge_sketches(sketch_dicts):
+    """
+    Merge dicts of per-column sketches (e.g. returned by worker processes)
+    """
+    merged = {}
+    for sketches in sketch_dicts:
+        for col, sketch in sketches.items():
+            if col in merged:
+                merged[col].merge(sketch)
+            else:
+                merged[col] = sketch
+    return merged
+
+
+def main():
+    """
+    Measure the rank error and memory of the sketch against exact quantiles
+    """
+    print('=' * 50)
+    print('KLL sketch accuracy check')
+    print('=' * 50)
+
+    rng = np.random.default_rng(0)
+    n = 2000000
+    values = np.round(rng.lognormal(3, 1.2, n), 2)
+    exact_sorted = np.sort(values)
+    qs = np.linspace(0.01, 0.99, 99)
+
+    for k in [100, DEFAULT_K, 400]:
+        start = time.perf_counter()
+        # Four workers' worth of chunks, merged at the end
+        parts = [KLLSketch(k=k, seed=i) for i in range(4)]
+        for i, chunk in enumerate(np.array_split(values, 40)):
+            parts[i % 4].update(chunk)
+        sketch = parts[0]
+        for part in parts[1:]:
+            sketch.merge(part)
+        seconds = time.perf_counter() - start
+
+        estimates = sketch.quantiles(qs)
+        # Normalized rank error of each estimate (midpoint of its rank range for ties)
+        ranks = (np.searchsorted(exact_sorted, estimates, side='left') +
+                 np.searchsorted(exact_sorted, estimates, side='right')) / 2 / n
+        error = np.abs(ranks - qs)
+        print(f'k={k}: {sketch.size()} items retained for {n} values, '
+              f'max rank error {error.max() * 100:.2f}%, mean {error.mean() * 100:.2f}% ({seconds:.2f}s)')
+
+    print('\nExact vs. sketch describe():')
+    print(pd.DataFrame({'exact': pd.Series(values).describe(), 'sketch': sketch.describe()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Aggregation queries over the CSV and Parquet tables, with two backends
+
+A query is a dict describing one grouped aggregation:
+
+    {'source': 'output/amz_uk_further_cleaned.parquet',
+     'by': ['categoryName'],
+     'measures': {'total_sales': ('boughtInLastMonth', 'sum')},
+     'filters': [('price', '>=', 20), ('price', '<=', 50), ('stars', '>=', 4)],
+     'bands': {'price_band': ('price', [0, 50, float('inf')], ['0-50', '50+'], False)}}
+
+- by: grouping columns (optional); a name in bands groups by value bands of
+  a column, like pd.cut(column, bins, labels=labels, right=right)
+- measures: output column -> (column, size/count/nunique/sum/mean/median/
+  min/max/std); counts are int64, everything else float64
+- filters: (column, '==', '!=', '<', '<=', '>', '>=' or 'in', value)
+
+Backends:
+- pandas loads the columns every query of a source needs once, then
+  filters and groups in memory
+- duckdb (optional, pip install duckdb) runs each query as SQL inside the
+  process, directly over the file: only the needed columns are read,
+  filters are pushed into the scan, the work is multi-threaded and spills
+  to output/.duckdb_tmp when it does not fit in memory
+
+Both return one DataFrame per query, indexed by the grouping columns (plain
+values, sorted) so the results can be compared; callers reindex to a
+category order (TIER_ORDER, PRICE_LABELS) where they need one.
+analysis_queries() expresses the aggregations of further_clean_data.py,
+sport_advanced_analysis.py and visualization_analysis.py as queries.
+
+Usage:
+    python query_backend.py --by categoryName --measure total_sales=boughtInLastMonth:sum \\
+        --where "price >= 20" --where "price <= 50" --where "stars >= 4"
+    python query_backend.py --analyses --compare    # run both backends, check they agree
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import operator
+import os
+import time
+from data_loader import RAW_DATA_PATH, load_product_data
+from columnar_store import CLEANED_DATA_PATH, FURTHER_CLEANED_PATH, legacy_csv_path, load_table
+from features import PRICE_MIN, PRICE_MAX
+from correlation_engine import HIGH_SALES_THRESHOLD
+
+# Query backends ('auto' picks duckdb when it is installed)
+BACKENDS = ['pandas', 'duckdb']
+
+# SQL of each aggregate ({} is the column)
+SQL_AGGREGATES = {
+    'size': 'count(*)',
+    'count': 'count({})',
+    'nunique': 'count(DISTINCT {})',
+    # pandas sums an empty or all-missing group to 0
+    'sum': 'coalesce(sum({}), 0)',
+    'mean': 'avg({})',
+    'median': 'median({})',
+    'min': 'min({})',
+    'max': 'max({})',
+    'std': 'stddev_samp({})',
+}
+
+# Aggregates returning counts; the others are computed in float64
+COUNT_AGGREGATES = ['size', 'count', 'nunique']
+
+# Filter operators: SQL operator and pandas comparison
+FILTER_OPERATORS = {
+    '==': ('=', operator.eq),
+    '!=': ('<>', operator.ne),
+    '<': ('<', operator.lt),
+    '<=': ('<=', operator.le),
+    '>': ('>', operator.gt),
+    '>=': ('>=', operator.ge),
+    'in': ('IN', None),
+}
+
+# Spill directory of the duckdb backend
+DUCKDB_TEMP_DIR = 'output/.duckdb_tmp'
+
+# Relative tolerance when comparing the results of the two backends
+MATCH_RTOL = 1e-6
+
+
+def duckdb_available():
+    """
+    Check whether the optional duckdb package is installed
+    """
+    try:
+        import duckdb
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_backend(backend='auto'):
+    """
+    Backend name for 'auto', 'pandas' or 'duckdb'
+    """
+    if backend == 'auto':
+        return 'duckdb' if duckdb_available() else 'pandas'
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend: {backend} (use auto, {", ".join(BACKENDS)})')
+    if backend == 'duckdb' and not duckdb_available():
+        raise ImportError('The duckdb backend needs the duckdb package (pip install duckdb)')
+    return backend
+
+
+def query_columns(query):
+    """
+    Source columns read by a query
+    """
+    bands = query.get('bands', {})
+    columns = []
+    for name in query.get('by', []):
+        columns.append(bands[name][0] if name in bands else name)
+    for column, func in query['measures'].values():
+        if func != 'size':
+            columns.append(column)
+    columns.extend(column for column, _, _ in query.get('filters', []))
+    return list(dict.fromkeys(columns))
+
+
+# ==================== pandas backend ====================
+
+def load_source(path, columns):
+    """
+    Read the columns of a source: a product CSV, a table or a partitioned dataset
+    """
+    if os.path.isdir(path):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.csv'):
+        return load_product_data(path, columns=columns)
+    return load_table(path, columns=columns)
+
+
+def filter_frame(df, filters):
+    """
+    Rows matching every (column, operator, value) filter
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f'Unknown filter operator: {op}')
+        if op == 'in':
+            mask &= df[column].isin(value).to_numpy()
+        else:
+            mask &= FILTER_OPERATORS[op][1](df[column], value).to_numpy()
+    return df[mask]
+
+
+def plain_values(values):
+    """
+    Values of a key column without the categorical dtype
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(values.cat.categories.dtype)
+    return values
+
+
+def aggregate_frame(df, query):
+    """
+    Run a query on a DataFrame holding its source columns
+    """
+    df = filter_frame(df, query.get('filters', []))
+    bands = query.get('bands', {})
+    by = query.get('by', [])
+
+    data = {}
+    for name in by:
+        if name in bands:
+            column, bins, labels, right = bands[name]
+            data[name] = plain_values(pd.cut(df[column], bins=bins, labels=labels, right=right))
+        else:
+            data[name] = plain_values(df[name])
+    aggregations = {}
+    for name, (column, func) in query['measures'].items():
+        if func == 'size':
+            data[name] = np.zeros(len(df), dtype='int8')
+        else:
+            data[name] = df[column] if func in COUNT_AGGREGATES else df[column].astype('float64')
+        aggregations[name] = pd.NamedAgg(name, func)
+    data = pd.DataFrame(data, index=df.index)
+
+    if by:
+        result = data.groupby(by, sort=True, dropna=True).agg(**aggregations)
+    else:
+        result = data.assign(_all=0).groupby('_all').agg(**aggregations).reset_index(drop=True)
+        if result.empty:
+            # One row even without matching rows, as in SQL: zero counts and sums, missing values otherwise
+            result = pd.DataFrame({name: [0 if func in COUNT_AGGREGATES + ['sum'] else np.nan]
+                                   for name, (_, func) in query['measures'].items()})
+    return normalize_result(result, query)
+
+
+def run_pandas(queries):
+    """
+    Run queries on pandas, loading the columns each source needs once
+    """
+    sources = {}
+    for query in queries.values():
+        sources.setdefault(query['source'], []).extend(query_columns(query))
+
+    results = {}
+    for source, columns in sources.items():
+        df = load_source(source, list(dict.fromkeys(columns)))
+        for name, query in queries.items():
+            if query['source'] == source:
+                results[name] = aggregate_frame(df, query)
+        del df
+    return {name: results[name] for name in queries}
+
+
+# ==================== duckdb backend ====================
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def source_sql(path):
+    """
+    Table function reading a source file (or partitioned dataset) in SQL
+    """
+    if os.path.isdir(path):
+        return f'read_parquet({quote_literal(os.path.join(path, "**", "*.parquet"))}, hive_partitioning = true)'
+    if not path.endswith('.csv') and not os.path.exists(path) and os.path.exists(legacy_csv_path(path)):
+        path = legacy_csv_path(path)
+    if path.endswith('.csv'):
+        return f'read_csv({quote_literal(path)}, header = true)'
+    return f'read_parquet({quote_literal(path)})'
+
+
+def band_sql(column, bins, labels, right):
+    """
+    CASE expression assigning the band label of a column (NULL outside the bins)
+    """
+    column = quote_identifier(column)
+    cases = []
+    for low, high, label in zip(bins[:-1], bins[1:], labels):
+        conditions = []
+        if np.isfinite(low):
+            conditions.append(f'{column} {">" if right else ">="} {float(low)!r}')
+        if np.isfinite(high):
+            conditions.append(f'{column} {"<=" if right else "<"} {float(high)!r}')
+        cases.append(f'WHEN {" AND ".join(conditions) or "true"} THEN {quote_literal(label)}')
+    return f'CASE {" ".join(cases)} END'
+
+
+def query_sql(query):
+    """
+    SQL text and parameters of a query
+    """
+    bands = query.get('bands', {})
+    by = query.get('by', [])
+    keys = [band_sql(*bands[name]) if name in bands else quote_identifier(name) for name in by]
+
+    select = [f'{key} AS {quote_identifier(name)}' for key, name in zip(keys, by)]
+    for name, (column, func) in query['measures'].items():
+        if func not in SQL_AGGREGATES:
+            raise ValueError(f'Unknown aggregate: {func}')
+        value = quote_identifier(column) if func in COUNT_AGGREGATES else f'CAST({quote_identifier(column)} AS DOUBLE)'
+        select.append(f'{SQL_AGGREGATES[func].format(value)} AS {quote_identifier(name)}')
+
+    where = []
+    params = []
+    for column, op, value in query.get('filters', []):
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f'Unknown filter operator: {op}')
+        if op == 'in':
+            value = list(value)
+            where.append(f'{quote_identifier(column)} IN ({", ".join("?" * len(value))})')
+            params.extend(value)
+        else:
+            where.append(f'{quote_identifier(column)} {FILTER_OPERATORS[op][0]} ?')
+            params.append(value)
+    # pandas drops rows whose group key is missing
+    where.extend(f'{key} IS NOT NULL' for key in keys)
+
+    sql = f'SELECT {", ".join(select)} FROM {source_sql(query["source"])}'
+    if where:
+        sql += f' WHERE {" AND ".join(where)}'
+    if by:
+        sql += f' GROUP BY {", ".join(str(i + 1) for i in range(len(by)))}'
+    return sql, params
+
+
+def duckdb_connection(threads=None):
+    """
+    In-process duckdb database; threads=None uses every core
+    """
+    import duckdb
+    connection = duckdb.connect()
+    if threads:
+        connection.execute(f'SET threads = {int(threads)}')
+    connection.execute(f'SET temp_directory = {quote_literal(DUCKDB_TEMP_DIR)}')
+    return connection
+
+
+def run_duckdb(queries, threads=None):
+    """
+    Run queries with duckdb directly over their source files
+    """
+    connection = duckdb_connection(threads)
+    try:
+        results = {}
+        for name, query in queries.items():
+            sql, params = query_sql(query)
+            results[name] = normalize_result(connection.execute(sql, params).df(), query)
+        return results
+    finally:
+        connection.close()
+
+
+# ==================== Results ====================
+
+def normalize_result(result, query):
+    """
+    Index a result by its grouping columns (sorted) with int64 counts and float64 measures
+    """
+    by = query.get('by', [])
+    result = result.reset_index() if by and list(result.index.names) == by else result
+    for name, (_, func) in query['measures'].items():
+        result[name] = result[name].astype('int64' if func in COUNT_AGGREGATES else 'float64')
+    if by:
+        result = result.sort_values(by, kind='stable').set_index(by)
+    return result.reset_index(drop=True) if not by else result
+
+
+def run_queries(queries, backend='auto', threads=None):
+    """
+    Run named queries on a backend, returning {name: result DataFrame}
+    """
+    backend = resolve_backend(backend)
+    if backend == 'duckdb':
+        return run_duckdb(queries, threads)
+    return run_pandas(queries)
+
+
+def results_match(a, b, rtol=MATCH_RTOL):
+    """
+    Check whether two results of a query agree (float keys and measures within rtol)
+    """
+    if list(a.columns) != list(b.columns) or a.index.names != b.index.names or len(a) != len(b):
+        return False
+    for level in range(a.index.nlevels):
+        left = pd.Series(a.index.get_level_values(level))
+        right = pd.Series(b.index.get_level_values(level))
+        if pd.api.types.is_float_dtype(left) and pd.api.types.is_float_dtype(right):
+            if not np.allclose(left, right, rtol=rtol, equal_nan=True):
+                return False
+        elif left.astype(str).tolist() != right.astype(str).tolist():
+            return False
+    for column in a.columns:
+        if not np.allclose(a[column].to_numpy(dtype='float64'), b[column].to_numpy(dtype='float64'),
+                           rtol=rtol, equal_nan=True):
+            return False
+    return True
+
+
+# ==================== Analyses ====================
+
+def analysis_queries(cleaned_path=CLEANED_DATA_PATH, further_path=FURTHER_CLEANED_PATH):
+    """
+    The aggregations of further_clean_data.py, sport_advanced_analysis.py and
+    visualization_analysis.py as queries over the cleaned and further cleaned tables
+    """
+    products = ('price', 'size')
+    sales = 'boughtInLastMonth'
+    sports = [('main_category', '==', 'Sports')]
+    sport_bands = {'price_range': ('price', [0, 50, 100, 150, 200, 250, 300, 350, 400, float('inf')],
+                                   ['0-50', '50-100', '100-150', '150-200', '200-250', '250-300', '300-350',
+                                    '350-400', '400+'], False)}
+    sales_bands = {'sales_band': (sales, [float('-inf'), HIGH_SALES_THRESHOLD, float('inf')],
+                                  [f'<{HIGH_SALES_THRESHOLD}', f'>={HIGH_SALES_THRESHOLD}'], False)}
+    return {
+        # further_clean_data.py
+        'zero_price': {'source': cleaned_path, 'measures': {'products': products},
+                       'filters': [('price', '==', 0)]},
+        'price_below_1': {'source': cleaned_path, 'measures': {'products': products},
+                          'filters': [('price', '<', 1)]},
+        'price_above_1000': {'source': cleaned_path, 'measures': {'products': products},
+                             'filters': [('price', '>', 1000)]},
+        'price_window': {'source': cleaned_path, 'measures': {'products': products},
+                         'filters': [('price', '>=', PRICE_MIN), ('price', '<=', PRICE_MAX)]},
+        'price_range_distribution': {'source': further_path, 'by': ['price_range'],
+                                     'measures': {'products': products}},
+        'main_category_distribution': {'source': further_path, 'by': ['main_category'],
+                                       'measures': {'products': products}},
+        'tier_distribution': {'source': further_path, 'by': ['product_tier'], 'measures': {'products': products}},
+        'tier_price': {'source': further_path, 'by': ['product_tier'],
+                       'measures': {'mean': ('price', 'mean'), 'median': ('price', 'median'),
+                                    'count': ('price', 'count')}},
+        'category_tier_distribution': {'source': further_path, 'by': ['main_category', 'product_tier'],
+                                       'measures': {'products': products}},
+        # sport_advanced_analysis.py
+        'sport_price_range_sales': {'source': further_path, 'by': ['price_range'], 'bands': sport_bands,
+                                    'filters': sports,
+                                    'measures': {'total_sales': (sales, 'sum'), 'products': products,
+                                                 'average_sales': (sales, 'mean')}},
+        'sport_sales_bands': {'source': further_path, 'by': ['sales_band'], 'bands': sales_bands,
+                              'filters': sports + [('stars', '>', 0)], 'measures': {'products': products}},
+        'sport_bestseller_ratio': {'source': further_path, 'filters': sports,
+                                   'measures': {'ratio': ('isBestSeller', 'mean')}},
+        # visualization_analysis.py
+        'category_sales_ranking': {'source': further_path, 'by': ['main_category'],
+                                   'measures': {'total_sales': (sales, 'sum')}},
+        'product_tier_sales': {'source': further_path, 'by': ['product_tier'],
+                               'measures': {'total_sales': (sales, 'sum'), 'average_sales': (sales, 'mean'),
+                                            'products': products}},
+        'bestseller_comparison': {'source': further_path, 'by': ['isBestSeller'],
+                                  'measures': {'stars': ('stars', 'mean'), 'price': ('price', 'mean'),
+                                               'sales': (sales, 'mean')}},
+        'stars_distribution': {'source': further_path, 'by': ['stars'], 'measures': {'products': products}},
+    }
+
+
+# ==================== Command line ====================
+
+def parse_filter(text):
+    """
+    ('price', '>=', 20.0) from 'price >= 20'; 'in' takes comma-separated values
+    """
+    for op in ['>=', '<=', '!=', '==', '<', '>', ' in ']:
+        if op in text:
+            column, value = (part.strip() for part in text.split(op, 1))
+            if op == ' in ':
+                return column, 'in', [parse_value(item.strip()) for item in value.split(',')]
+            return column, op, parse_value(value)
+    raise ValueError(f'Cannot parse filter: {text}')
+
+
+def parse_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    if text in ('True', 'False'):
+        return text == 'True'
+    return text.strip('\'"')
+
+
+def parse_measure(text):
+    """
+    ('total_sales', ('boughtInLastMonth', 'sum')) from 'total_sales=boughtInLastMonth:sum'
+    """
+    name, spec = text.split('=', 1)
+    column, func = spec.rsplit(':', 1)
+    return name, (column, func)
+
+
+def print_results(results):
+    for name, result in results.items():
+        print(f'\n{name}:')
+        print(result.to_string())
+
+
+def main():
+    """
+    Main function: run a query, or the analyses, on one or both backends
+    """
+    parser = argparse.ArgumentParser(description='Aggregation queries over the product tables')
+    parser.add_argument('--source', default=FURTHER_CLEANED_PATH, help=f'CSV, Parquet table or dataset '
+                                                                        f'(raw data: {RAW_DATA_PATH})')
+    parser.add_argument('--by', nargs='*', default=[], help='grouping columns')
+    parser.add_argument('--measure', action='append', default=[],
+                        help='name=column:aggregate (default: products=price:size)')
+    parser.add_argument('--where', action='append', default=[], help="filter such as 'price >= 20'")
+    parser.add_argument('--analyses', action='store_true', help='run the queries of the analysis scripts')
+    parser.add_argument('--backend', choices=['auto'] + BACKENDS, default='auto', help='query backend')
+    parser.add_argument('--compare', action='store_true', help='run both backends and compare results and times')
+    parser.add_argument('--threads', type=int, default=None, help='duckdb threads (default: all cores)')
+    args = parser.parse_args()
+
+    if args.analyses:
+        queries = analysis_queries()
+    else:
+        try:
+            measures = dict(parse_measure(text) for text in args.measure) or {'products': ('price', 'size')}
+            filters = [parse_filter(text) for text in args.where]
+        except ValueError as e:
+            print(f'Error: {e}')
+            exit(1)
+        queries = {'query': {'source': args.source, 'by': args.by, 'measures': measures, 'filters': filters}}
+
+    backends = BACKENDS if args.compare else [resolve_backend(args.backend)]
+    if args.compare and not duckdb_available():
+        print('Error: --compare needs the duckdb package (pip install duckdb)')
+        exit(1)
+
+    all_results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        try:
+            all_results[backend] = run_queries(queries, backend, threads=args.threads)
+        except Exception as e:
+            print(f'Error running queries on {backend}: {e}')
+            exit(1)
+        print(f'{backend}: {len(queries)} queries in {time.perf_counter() - start:.3f}s')
+
+    if args.compare:
+        mismatched = [name for name in queries
+                      if not results_match(all_results['pandas'][name], all_results['duckdb'][name])]
+        print(f'Results match: {len(queries) - len(mismatched)}/{len(queries)} queries')
+        for name in mismatched:
+            print(f'\nMismatch in {name}:\npandas:\n{all_results["pandas"][name]}\nduckdb:\n{all_results["duckdb"][name]}')
+    else:
+        print_results(all_results[backends[0]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental ingestion of monthly product snapshots, keyed by ASIN
+
+Each month's export is mostly the same products as the month before. This
+script keeps an ASIN-keyed store of the last ingested snapshot (one row per
+ASIN with a 64-bit digest of the cleaned row and the tracked measures) in
+output/snapshots/. A new snapshot is de-duplicated as usual, its rows are
+hashed, and each ASIN is classified against the store as new, removed,
+changed (different digest) or unchanged. Only the new and changed rows go
+through the price filter and feature engineering; they replace the rows of
+the removed and changed ASINs in the previous further cleaned table, and
+the aggregation cube is updated by adding and subtracting the cubes of
+those rows (aggregation_cube.update_cube). The resulting table and cube
+match a full run of further_clean_data.py with the default price window.
+
+    python snapshot_ingest.py --input archive/amz_uk_2023-10.csv --snapshot 2023-10
+    python snapshot_ingest.py --input archive/amz_uk_2023-11.csv --snapshot 2023-11
+
+Month-over-month changes in price, stars and boughtInLastMonth of every
+changed ASIN (and the new and removed ones) are saved to
+output/snapshots/changes_<previous>_to_<snapshot>.parquet.
+
+The previous table and cube are only reused if they are the ones written by
+the last ingestion and the tier rules, taxonomy and price window are
+unchanged; otherwise (or with --full) the whole snapshot is reprocessed,
+while the store still provides the month-over-month changes. Rows without
+an ASIN cannot be matched and are always reprocessed. Charts are not drawn;
+run the analysis scripts on the updated table as usual.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.extensions import take
+from data_loader import RAW_DATA_PATH, load_product_data
+from columnar_store import CLEANED_DATA_PATH, FURTHER_CLEANED_PATH, load_table, save_table, table_exists
+from asin_dedup import DEFAULT_POLICY, dedupe_frame
+from features import PRICE_MIN, PRICE_MAX, PRICE_BINS, PRICE_LABELS, TIER_ORDER, filter_price_window, add_features
+from aggregation_cube import CUBE_PATH, build_cube, save_cube, update_cube, rollup, key_counts
+from column_cache import build_column_cache, source_signature
+from summaries import write_further_analysis_summary
+from tier_engine import TIER_RULES_PATH
+from category_taxonomy import TAXONOMY_PATH
+from instrumentation import begin_stage, end_stage, set_rows
+
+# Store of the last ingested snapshot, with its manifest and the change tables
+SNAPSHOT_DIR = 'output/snapshots'
+STORE_PATH = os.path.join(SNAPSHOT_DIR, 'asin_store.parquet')
+MANIFEST_PATH = os.path.join(SNAPSHOT_DIR, 'manifest.json')
+
+# Store layout version (a manifest with another version means a full reprocess)
+STORE_VERSION = 1
+
+# Row statuses against the previous snapshot
+STATUSES = ['new', 'removed', 'changed', 'unchanged']
+
+# Measures compared month over month
+TRACKED_COLUMNS = ['price', 'stars', 'boughtInLastMonth']
+
+# Largest sales changes listed in the report
+TOP_MOVERS = 10
+
+
+def changes_path(previous_label, label):
+    """
+    Change table between two snapshots
+    """
+    return os.path.join(SNAPSHOT_DIR, f'changes_{previous_label}_to_{label}.parquet')
+
+
+def default_label(file_path):
+    """
+    Snapshot label from the file's modification month (YYYY-MM)
+    """
+    return time.strftime('%Y-%m', time.localtime(os.path.getmtime(file_path)))
+
+
+def feature_fingerprint():
+    """
+    sha256 of everything besides the rows that the further cleaned table depends on
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PRICE_MIN, PRICE_MAX, PRICE_BINS, PRICE_LABELS]).encode('utf-8'))
+    for path in [TIER_RULES_PATH, TAXONOMY_PATH]:
+        digest.update(path.encode('utf-8'))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def row_digests(df):
+    """
+    64-bit hash of every column of each row
+    """
+    # Titles and ASINs are nearly all distinct, so factorizing them first only costs time
+    return pd.util.hash_pandas_object(df, index=False, categorize=False).to_numpy()
+
+
+def read_store_manifest():
+    """
+    Manifest of the last ingestion, or None if there is none
+    """
+    if not os.path.exists(MANIFEST_PATH) or not table_exists(STORE_PATH):
+        return None
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != STORE_VERSION:
+        return None
+    return manifest
+
+
+def outputs_current(manifest):
+    """
+    Whether the further cleaned table and cube are still those of the last ingestion
+    """
+    for key, path in [('further', FURTHER_CLEANED_PATH), ('cube', CUBE_PATH)]:
+        if not os.path.exists(path) or manifest.get(key) != source_signature(path):
+            return False
+    return manifest.get('features') == feature_fingerprint()
+
+
+def classify_rows(current, previous):
+    """
+    Status of every ASIN of either snapshot: new, removed, changed or unchanged
+
+    current and previous (None for the first snapshot) have asin and digest
+    columns. Returns a frame with the status and the row positions in
+    current and previous (-1 where the ASIN is absent); the rows of current
+    come first, in order, followed by the removed ASINs.
+    """
+    if previous is None:
+        previous = current.iloc[:0]
+    previous_rows = pc.index_in(pa.array(current['asin']), value_set=pa.array(previous['asin']))
+    previous_rows = previous_rows.fill_null(-1).to_numpy().astype('int64')
+    found = previous_rows >= 0
+    changed = np.zeros(len(current), dtype=bool)
+    changed[found] = previous['digest'].to_numpy()[previous_rows[found]] != current['digest'].to_numpy()[found]
+    removed = np.ones(len(previous), dtype=bool)
+    removed[previous_rows[found]] = False
+    removed_rows = np.flatnonzero(removed)
+
+    codes = np.select([~found, changed], [STATUSES.index('new'), STATUSES.index('changed')],
+                      default=STATUSES.index('unchanged'))
+    codes = np.concatenate([codes, np.full(len(removed_rows), STATUSES.index('removed'))])
+    return pd.DataFrame({
+        'status': pd.Categorical.from_codes(codes, categories=STATUSES),
+        'current': np.concatenate([np.arange(len(current)), np.full(len(removed_rows), -1)]),
+        'previous': np.concatenate([previous_rows, removed_rows]),
+    })
+
+
+def month_over_month(current, previous, statuses):
+    """
+    Previous value, current value and change of the tracked measures per ASIN
+
+    Covers the new and removed ASINs and the changed ones whose tracked
+    measures differ (missing on both sides counts as equal).
+    """
+    listed = statuses[statuses['status'] != 'unchanged']
+    current_rows = listed['current'].to_numpy()
+    previous_rows = listed['previous'].to_numpy()
+    # Absent rows (-1) become missing values
+    asins = pd.Series(take(current['asin'].array, current_rows, allow_fill=True))
+    asins = asins.fillna(pd.Series(take(previous['asin'].array, previous_rows, allow_fill=True)))
+    changes = pd.DataFrame({'asin': asins, 'status': listed['status'].astype('str').to_numpy()})
+
+    differs = np.zeros(len(changes), dtype=bool)
+    for col in TRACKED_COLUMNS:
+        before = pd.Series(take(previous[col].array, previous_rows, allow_fill=True))
+        after = pd.Series(take(current[col].array, current_rows, allow_fill=True))
+        changes[f'{col}_previous'] = before
+        changes[col] = after
+        changes[f'{col}_change'] = after - before
+        differs |= ~((before == after).fillna(False) | (before.isna() & after.isna())).to_numpy(dtype=bool)
+
+    keep = (changes['status'] != 'changed').to_numpy() | differs
+    return changes[keep].sort_values('asin', kind='stable').reset_index(drop=True)
+
+
+def combine_further(kept, kept_positions, added, cleaned):
+    """
+    Kept rows of the previous table plus the newly processed ones, in the order of a full run
+
+    kept_positions are the kept rows' positions in cleaned; the added rows
+    are indexed by theirs. A full run keeps the cleaned snapshot's row order
+    and the category sets it would derive, so both are restored here.
+    Returns the table and the positions of its rows in cleaned.
+    """
+    main_categories = sorted(set(kept['main_category'].dropna().unique())
+                             | set(added['main_category'].dropna().unique()))
+    dtypes = {'categoryName': cleaned['categoryName'].dtype,
+              'main_category': pd.CategoricalDtype(main_categories),
+              'price_range': added['price_range'].dtype,
+              'product_tier': added['product_tier'].dtype}
+    combined = pd.concat([kept[added.columns].astype(dtypes), added.astype(dtypes)], ignore_index=True)
+    positions = np.concatenate([kept_positions, added.index.to_numpy()])
+    order = np.argsort(positions, kind='stable')
+    return combined.take(order).reset_index(drop=True), positions[order]
+
+
+def ingest(file_path, label, full=False):
+    """
+    Ingest one snapshot and update the tables, cube and store
+
+    Returns the further cleaned table, its cube, the month-over-month changes
+    and the label of the previous snapshot (both None for the first one).
+    """
+    # ==================== 1. Load and Clean the Snapshot ====================
+    print('\n1. Loading and Cleaning the Snapshot')
+    print('-' * 30)
+    begin_stage('read_csv')
+    try:
+        raw = load_product_data(file_path)
+        print(f'Successfully read file: {file_path} ({raw.shape[0]} rows)')
+    except Exception as e:
+        print(f'Error reading file: {e}')
+        exit(1)
+    set_rows(len(raw))
+
+    begin_stage('dedupe', rows=len(raw))
+    cleaned, duplicate_stats = dedupe_frame(raw, DEFAULT_POLICY)
+    cleaned = cleaned.reset_index(drop=True)
+    del raw
+    print(f'Duplicate ASIN rows removed: {duplicate_stats["removed_rows"]}')
+    print(f'Data shape after cleaning: {cleaned.shape}')
+
+    # ==================== 2. Compare with the Previous Snapshot ====================
+    print('\n2. Comparing with the Previous Snapshot')
+    print('-' * 30)
+    begin_stage('digest', rows=len(cleaned))
+    keyed = cleaned['asin'].notna().to_numpy()
+    current = cleaned.loc[keyed, ['asin'] + TRACKED_COLUMNS].assign(digest=row_digests(cleaned)[keyed])
+
+    manifest = read_store_manifest()
+    previous = load_table(STORE_PATH) if manifest is not None else None
+    if previous is None:
+        print('No previous snapshot: every row is new')
+    else:
+        print(f'Previous snapshot: {manifest["snapshot"]} ({manifest["rows"]} ASINs)')
+    statuses = classify_rows(current, previous)
+    counts = statuses['status'].value_counts().reindex(STATUSES)
+    for status, count in counts.items():
+        print(f'{status.capitalize()} ASINs: {count}')
+    print(f'Rows without an ASIN: {int((~keyed).sum())}')
+
+    incremental = previous is not None and not full and outputs_current(manifest)
+    if previous is not None and not incremental:
+        reason = 'requested' if full else 'the further cleaned table, cube or feature settings changed'
+        print(f'Full reprocess: {reason}')
+
+    # ==================== 3. Process the Delta ====================
+    print('\n3. Price Filter and Feature Engineering')
+    print('-' * 30)
+    if incremental:
+        # Rows of the cleaned snapshot, of the store and of the further table are all in
+        # snapshot order, so they are matched by position rather than by ASIN
+        keyed_positions = np.flatnonzero(keyed)
+        current_statuses = statuses.iloc[:len(current)]
+        unchanged = (current_statuses['status'] == 'unchanged').to_numpy()
+        current_of_previous = np.full(len(previous), -1)
+        current_of_previous[current_statuses['previous'].to_numpy()[unchanged]] = np.flatnonzero(unchanged)
+
+        begin_stage('load_previous')
+        previous_further = load_table(FURTHER_CLEANED_PATH)
+        previous_cube = load_table(CUBE_PATH)
+        # Store rows of the previous table's rows (rows without an ASIN are never kept)
+        further_keyed = previous_further['asin'].notna().to_numpy()
+        kept_current = np.full(len(previous_further), -1)
+        kept_current[further_keyed] = current_of_previous[np.flatnonzero(previous['in_further'].to_numpy())]
+        drop = kept_current < 0
+
+        delta_mask = ~keyed
+        delta_mask[keyed_positions[~unchanged]] = True
+        delta = cleaned[delta_mask]
+
+        begin_stage('features', rows=len(delta))
+        added = add_features(filter_price_window(delta, PRICE_MIN, PRICE_MAX))
+        further, further_positions = combine_further(previous_further[~drop], keyed_positions[kept_current[~drop]],
+                                                     added, cleaned)
+        print(f'Rows processed: {len(delta)} of {len(cleaned)} ({len(added)} kept by the price filter)')
+        print(f'Rows kept from the previous table: {len(previous_further) - int(drop.sum())}, '
+              f'replaced or removed: {int(drop.sum())}')
+
+        begin_stage('cube', rows=len(added) + int(drop.sum()))
+        cube = update_cube(previous_cube, added, previous_further[drop], further)
+        del previous_further, previous_cube, added, delta
+    else:
+        begin_stage('features', rows=len(cleaned))
+        further = filter_price_window(cleaned, PRICE_MIN, PRICE_MAX)
+        further_positions = further.index.to_numpy()
+        further = add_features(further).reset_index(drop=True)
+        print(f'Rows processed: {len(cleaned)} ({len(further)} kept by the price filter)')
+        begin_stage('cube', rows=len(further))
+        cube = build_cube(further)
+    print(f'Further cleaned data shape: {further.shape}, aggregation cube: {len(cube)} cells')
+
+    # ==================== 4. Month-over-Month Changes ====================
+    changes = None
+    if previous is not None:
+        begin_stage('month_over_month', rows=len(statuses))
+        changes = month_over_month(current, previous, statuses)
+
+    # ==================== 5. Save ====================
+    begin_stage('save', rows=len(further))
+    save_table(cleaned, CLEANED_DATA_PATH)
+    save_table(further, FURTHER_CLEANED_PATH)
+    # Saved after the table, so readers see the cube as current
+    save_cube(cube)
+    build_column_cache(further, FURTHER_CLEANED_PATH)
+
+    tier_price = rollup(cube, 'product_tier', 'price')[['mean', 'count']]
+    tier_price.insert(1, 'median', further.groupby('product_tier', observed=True)['price'].median())
+    write_further_analysis_summary('output/further_analysis_summary.txt',
+                                   original_shape=cleaned.shape,
+                                   filtered_shape=further.shape,
+                                   price_range_dist=key_counts(cube, 'price_range'),
+                                   tier_dist=key_counts(cube, 'product_tier').reindex(TIER_ORDER),
+                                   tier_price=tier_price)
+
+    if changes is not None:
+        save_table(changes, changes_path(manifest['snapshot'], label))
+    in_further = np.zeros(len(cleaned), dtype=bool)
+    in_further[further_positions] = True
+    save_table(current[['asin', 'digest'] + TRACKED_COLUMNS].assign(in_further=in_further[keyed]), STORE_PATH)
+    # Written last: an interrupted ingestion leaves a stale manifest and the next one reprocesses fully
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'snapshot': label, 'source': os.path.abspath(file_path),
+                   'rows': len(current), 'features': feature_fingerprint(),
+                   'further': source_signature(FURTHER_CLEANED_PATH), 'cube': source_signature(CUBE_PATH),
+                   'counts': {status: int(count) for status, count in counts.items()}}, f, indent=2)
+    end_stage()
+    return further, cube, changes, manifest['snapshot'] if previous is not None else None
+
+
+def print_changes(changes):
+    """
+    Summary of the month-over-month changes
+    """
+    changed = changes[changes['status'] == 'changed']
+    print(f'ASINs with a changed price, rating or sales figure: {len(changed)}')
+    for col in TRACKED_COLUMNS:
+        delta = changed[f'{col}_change'].dropna()
+        print(f'- {col}: {int((delta > 0).sum())} up, {int((delta < 0).sum())} down')
+
+    price = changed.dropna(subset=['price_previous', 'price'])
+    price = price[price['price_previous'] > 0]
+    if len(price):
+        relative = (price['price'] / price['price_previous'] - 1) * 100
+        print(f'Median price change of repriced products: {relative[relative != 0].median():.2f}%')
+
+    sales_before = changes['boughtInLastMonth_previous'].fillna(0)
+    sales_after = changes['boughtInLastMonth'].fillna(0)
+    is_new = changes['status'] == 'new'
+    is_removed = changes['status'] == 'removed'
+    print(f'Net change in monthly sales: {(sales_after - sales_before).sum():+.0f} '
+          f'(new ASINs {sales_after[is_new].sum():+.0f}, removed ASINs {-sales_before[is_removed].sum():+.0f})')
+
+    movers = changed.assign(magnitude=changed['boughtInLastMonth_change'].abs()).dropna(subset=['magnitude'])
+    if len(movers):
+        print('\nLargest sales changes:')
+        movers = movers.nlargest(TOP_MOVERS, 'magnitude', keep='first')
+        print(movers[['asin', 'boughtInLastMonth_previous', 'boughtInLastMonth', 'price_previous', 'price']]
+              .to_string(index=False, float_format='{:.2f}'.format))
+
+
+def run(file_path=RAW_DATA_PATH, snapshot=None, full=False):
+    """
+    Ingest a snapshot and report what changed since the previous one
+    """
+    if not os.path.exists(SNAPSHOT_DIR):
+        os.makedirs(SNAPSHOT_DIR)
+    label = snapshot or default_label(file_path)
+
+    print('=' * 50)
+    print(f'Ingesting snapshot {label}')
+    print('=' * 50)
+
+    start = time.perf_counter()
+    further, cube, changes, previous_label = ingest(file_path, label, full)
+    elapsed = time.perf_counter() - start
+
+    print('\n4. Month-over-Month Changes')
+    print('-' * 30)
+    if changes is None:
+        print('First snapshot: nothing to compare with')
+    else:
+        print_changes(changes)
+
+    print('\n5. Saved')
+    print('-' * 30)
+    print(f'Further cleaned data: {FURTHER_CLEANED_PATH} ({len(further)} rows)')
+    print(f'Aggregation cube: {CUBE_PATH} ({len(cube)} cells)')
+    if changes is not None:
+        print(f'Month-over-month changes: {changes_path(previous_label, label)} '
+              f'({len(changes)} ASINs)')
+    print(f'ASIN store: {STORE_PATH}')
+    print(f'\nSnapshot {label} ingested in {elapsed:.1f}s')
+    print('=' * 50)
+    return further, cube, changes
+
+
+def add_arguments(parser):
+    """
+    Ingestion options, shared with analytics_cli.py
+    """
+    parser.add_argument('--input', default=RAW_DATA_PATH, help='product CSV of the snapshot')
+    parser.add_argument('--snapshot', help='snapshot label (default: YYYY-MM of the file)')
+    parser.add_argument('--full', action='store_true', help='reprocess every row, not only the changed ones')
+    return parser
+
+
+def main():
+    """
+    Main function: ingest one snapshot
+    """
+    parser = argparse.ArgumentParser(description='Incremental ingestion of a product snapshot')
+    args = add_arguments(parser).parse_args()
+    run(args.input, snapshot=args.snapshot, full=args.full)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,20 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
-from scipy import stats
-
-# Set up Chinese font display (optional if not needed)
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-def main():
+from columnar_store import SPORT_PRODUCTS_PATH, table_exists
+from column_cache import load_columns
+from instrumentation import begin_stage, end_stage, set_rows
+from correlation_engine import HIGH_SALES_THRESHOLD, add_sales_band, rated_products, correlate
+from chart_rendering import pyplot
+
+def run(sport_df=None):
+    """
+    Sales by price range and rating correlations of the Sports products
+
+    sport_df is the Sports product table if already in memory (it is not
+    modified); otherwise it is read from disk.
+    """
     # Create output directory
     if not os.path.exists('output/sport_analysis'):
         os.makedirs('output/sport_analysis')
@@ -26,19 +30,30 @@ def main():
     print('-' * 30)
 
     try:
-        if not os.path.exists('output/sport_analysis/sport_products.csv'):
+        required_columns = ['price', 'boughtInLastMonth', 'stars', 'reviews', 'isBestSeller', 'categoryName']
+        if sport_df is not None:
+            print('Using sports product data already in memory')
+            if not all(col in sport_df.columns for col in required_columns):
+                print('Error: missing required columns')
+                return
+            # A copy, as the price bands below are added as a column
+            begin_stage('load')
+            sport_df = sport_df[required_columns + ['product_tier']].copy()
+        elif not table_exists(SPORT_PRODUCTS_PATH):
             print('Error: sports product data file not found')
             return
-
-        print('Reading data file...')
-        sport_df = pd.read_csv('output/sport_analysis/sport_products.csv')
+        else:
+            print('Reading data file...')
+            # Only the analyzed columns, memory-mapped from the column cache
+            begin_stage('load')
+            sport_df = load_columns(SPORT_PRODUCTS_PATH, required_columns + ['product_tier'])
+        set_rows(len(sport_df))
         print(f'Successfully loaded data, shape: {sport_df.shape}')
         
         if sport_df.empty:
             print('Error: data is empty')
             return
             
-        required_columns = ['price', 'boughtInLastMonth', 'stars', 'reviews', 'isBestSeller', 'categoryName']
         if not all(col in sport_df.columns for col in required_columns):
             print('Error: missing required columns')
             return
@@ -51,6 +66,7 @@ def main():
     print('\n2. Analyzing sales by price range')
     print('-' * 30)
 
+    begin_stage('price_range_sales', rows=len(sport_df))
     try:
         bins = [0, 50, 100, 150, 200, 250, 300, 350, 400, float('inf')]
         labels = ['0-50', '50-100', '100-150', '150-200', '200-250', '250-300', '300-350', '350-400', '400+']
@@ -69,6 +85,9 @@ def main():
         print(stats_df)
 
         # Total sales bar chart
+        begin_stage('price_range_charts')
+        plt = pyplot()
+        import seaborn as sns
         plt.figure(figsize=(12, 6))
         sns.barplot(x=price_range_sales.index, y=price_range_sales.values)
         plt.title('Total Sales by Price Range')
@@ -104,28 +123,27 @@ def main():
     print('\n3. Analyzing correlation between ratings and sales')
     print('-' * 30)
 
+    begin_stage('correlations', rows=len(sport_df))
     try:
-        high_sales_df = sport_df[(sport_df['boughtInLastMonth'] >= 1000) & (sport_df['stars'] > 0)].copy()
-        normal_sales_df = sport_df[(sport_df['boughtInLastMonth'] < 1000) & (sport_df['stars'] > 0)].copy()
+        rated_df = add_sales_band(rated_products(sport_df).copy())
+        band_counts = rated_df['sales_band'].value_counts()
+        high_band, normal_band = f'>={HIGH_SALES_THRESHOLD}', f'<{HIGH_SALES_THRESHOLD}'
 
         print(f'\nGroup statistics:')
-        print(f'High-sales products (>=1000/month): {len(high_sales_df)}')
-        print(f'Normal-sales products (<1000/month): {len(normal_sales_df)}')
-
-        print('\nCorrelation for high-sales products:')
-        if len(high_sales_df) > 0:
-            pearson_high = stats.pearsonr(high_sales_df['stars'], high_sales_df['boughtInLastMonth'])
-            spearman_high = stats.spearmanr(high_sales_df['stars'], high_sales_df['boughtInLastMonth'])
-            print(f'Pearson: {pearson_high[0]:.4f} (p={pearson_high[1]:.4f})')
-            print(f'Spearman: {spearman_high[0]:.4f} (p={spearman_high[1]:.4f})')
-        else:
-            print('No high-sales products with valid ratings.')
+        print(f'High-sales products (>=1000/month): {band_counts[high_band]}')
+        print(f'Normal-sales products (<1000/month): {band_counts[normal_band]}')
+
+        # Both bands in one pass of the correlation engine
+        correlations = correlate(rated_df, by=['sales_band'], metrics=['stars']).set_index('sales_band')
 
-        print('\nCorrelation for normal-sales products:')
-        pearson_normal = stats.pearsonr(normal_sales_df['stars'], normal_sales_df['boughtInLastMonth'])
-        spearman_normal = stats.spearmanr(normal_sales_df['stars'], normal_sales_df['boughtInLastMonth'])
-        print(f'Pearson: {pearson_normal[0]:.4f} (p={pearson_normal[1]:.4f})')
-        print(f'Spearman: {spearman_normal[0]:.4f} (p={spearman_normal[1]:.4f})')
+        for title, band in [('high-sales', high_band), ('normal-sales', normal_band)]:
+            print(f'\nCorrelation for {title} products:')
+            if band in correlations.index:
+                row = correlations.loc[band]
+                print(f'Pearson: {row["pearson_r"]:.4f} (p={row["pearson_p"]:.4f})')
+                print(f'Spearman: {row["spearman_r"]:.4f} (p={row["spearman_p"]:.4f})')
+            else:
+                print(f'No {title} products with valid ratings.')
 
         # Scatter plots for both groups (code remains unchanged)
 
@@ -136,6 +154,7 @@ def main():
     # ==================== 4. Best Seller comparison ====================
     print('\n4. Best Seller Product Comparison')
     print('-' * 30)
+    end_stage()
 
     try:
         # Stats and boxplots already shown correctly in your code, just update labels and print messages if needed
@@ -173,6 +192,11 @@ def main():
         print(f'Error generating composite score charts: {str(e)}')
         return
 
+
+def main():
+    run()
+
+
 if __name__ == '__main__':
     try:
         main()
@@ -3,19 +3,270 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
 import sys
+from columnar_store import FURTHER_CLEANED_PATH, SPORT_PRODUCTS_PATH, load_table, save_table, table_exists
+from chart_rendering import CHART_CACHE_PATH, render_charts, print_timing_report
+from aggregation_cube import get_cube, rollup, key_counts
+from column_cache import CACHED_COLUMNS, load_columns
+from instrumentation import stage
+from chart_stats import histogram, box_stats, density_grid, plot_histogram, plot_boxes, plot_density
 
-# Set font to display Chinese labels if needed
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+# Output directory of the charts
+OUTPUT_DIR = 'output/sport_analysis'
 
-def main():
+# £50 price bands of the price range sales chart
+PRICE_BAND_BINS = [0, 50, 100, 150, 200, 250, 300, 350, 400, float('inf')]
+PRICE_BAND_LABELS = ['0-50', '50-100', '100-150', '150-200', '200-250', '250-300', '300-350', '350-400', '400+']
+
+# Sales vs. rating chart: 'auto' draws a scatter up to this many points, a density grid above
+SCATTER_MAX_POINTS = 50000
+
+# Density grid cells: one column per 0.1 star, 50 bands of monthly sales below 1000
+STAR_EDGES = np.round(np.arange(-0.05, 5.1, 0.1), 2)
+SALES_EDGES = np.linspace(0, 1000, 51)
+
+
+# ==================== Chart renderers (run in worker processes) ====================
+
+# matplotlib and seaborn are imported by the renderers, so importing this module stays cheap
+
+def render_price_distribution(price_hist, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    plot_histogram(price_hist)
+    plt.title(f'Price Distribution of {category} Products (Price < 500)', fontsize=14)
+    plt.xlabel('Price (£)', fontsize=12)
+    plt.ylabel('Number of Products', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_stars_distribution(stars_counts, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x=stars_counts.index, y=stars_counts.values)
+    plt.title(f'Star Rating Distribution of {category} Products', fontsize=14)
+    plt.xlabel('Star Rating', fontsize=12)
+    plt.ylabel('Number of Products', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_reviews_distribution(reviews_hist, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    plot_histogram(reviews_hist)
+    plt.title('Review Count Distribution (Reviews < 2000)', fontsize=14)
+    plt.xlabel('Number of Reviews', fontsize=12)
+    plt.ylabel('Number of Products', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_sales_stars_relation(sales_filtered, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(12, 6))
+    sns.scatterplot(data=sales_filtered, x='stars', y='boughtInLastMonth', alpha=0.5)
+    plt.title('Monthly Sales vs. Star Rating (Sales < 1000)', fontsize=14)
+    plt.xlabel('Star Rating', fontsize=12)
+    plt.ylabel('Monthly Sales', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_sales_stars_density(density, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    plot_density(density['grid'], log=density['log'],
+                 label='Number of Products (log scale)' if density['log'] else 'Number of Products')
+    plt.title('Monthly Sales vs. Star Rating (Sales < 1000)', fontsize=14)
+    plt.xlabel('Star Rating', fontsize=12)
+    plt.ylabel('Monthly Sales', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_bestseller_comparison(bestseller_boxes, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    stars_box, price_box, sales_box = bestseller_boxes
+    fig, axes = plt.subplots(1, 3, figsize=(18, 6))
+
+    plot_boxes(stars_box, ax=axes[0])
+    axes[0].set_title('Star Rating Comparison')
+    axes[0].set_xlabel('Best Seller')
+    axes[0].set_ylabel('Star Rating')
+    axes[0].set_xticklabels(['Not Best Seller', 'Best Seller'])
+
+    plot_boxes(price_box, ax=axes[1])
+    axes[1].set_title('Price Comparison (Price < 500)')
+    axes[1].set_xlabel('Best Seller')
+    axes[1].set_ylabel('Price (£)')
+    axes[1].set_xticklabels(['Not Best Seller', 'Best Seller'])
+
+    plot_boxes(sales_box, ax=axes[2])
+    axes[2].set_title('Sales Comparison (Monthly Sales < 1000)')
+    axes[2].set_xlabel('Best Seller')
+    axes[2].set_ylabel('Monthly Sales')
+    axes[2].set_xticklabels(['Not Best Seller', 'Best Seller'])
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_tier_sales_comparison(tier_sales, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x=tier_sales.index, y=tier_sales.values)
+    plt.title(f'Average Sales by Product Tier ({category})', fontsize=14)
+    plt.xlabel('Product Tier', fontsize=12)
+    plt.ylabel('Average Monthly Sales', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+def render_price_range_sales(price_range_sales, output_path, category='Sports'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x=price_range_sales.index, y=price_range_sales.values)
+    plt.title(f'Total Sales by Price Range ({category})', fontsize=14)
+    plt.xlabel('Price Range (£)', fontsize=12)
+    plt.ylabel('Total Sales', fontsize=12)
+    for i, v in enumerate(price_range_sales.values):
+        plt.text(i, v, f'{v:,.0f}', ha='center', va='bottom')
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300)
+    plt.close()
+
+
+# ==================== Chart data (main process) ====================
+
+def price_band_sales(sport_df):
+    """
+    Total monthly sales per £50 price band
+    """
+    price_band = pd.cut(sport_df['price'], bins=PRICE_BAND_BINS, labels=PRICE_BAND_LABELS, right=False)
+    return sport_df.groupby(price_band, observed=False)['boughtInLastMonth'].sum().sort_index()
+
+
+def prepare_charts(sport_df, sport_cube, sales_chart='auto', log_density=False,
+                   category='Sports', output_dir=OUTPUT_DIR):
+    """
+    Build the chart tasks a-g from the products of one main category
+
+    sport_cube holds the aggregation cube cells of that category.
+    sales_chart selects how chart d is drawn: 'scatter' (every product),
+    'density' (2D count grid) or 'auto' (by number of products).
+    """
+    tasks = []
+
+    # a. Price distribution
+    print('\na. Price distribution analysis')
+    tasks.append({'name': 'a. price_distribution', 'render': render_price_distribution,
+                  'data': histogram(sport_df.loc[sport_df['price'] < 500, 'price'], bins=50),
+                  'output': f'{output_dir}/price_distribution.png'})
+
+    # b. Star rating distribution
+    print('\nb. Star rating distribution analysis')
+    stars_counts = key_counts(sport_cube, 'stars')
+    # float32 ratings as one-decimal float64 labels (seaborn mismatches float32 category levels)
+    stars_counts.index = stars_counts.index.astype('float64').round(1)
+    tasks.append({'name': 'b. stars_distribution', 'render': render_stars_distribution,
+                  'data': stars_counts,
+                  'output': f'{output_dir}/stars_distribution.png'})
+
+    # c. Review count distribution
+    print('\nc. Review count distribution analysis')
+    tasks.append({'name': 'c. reviews_distribution', 'render': render_reviews_distribution,
+                  'data': histogram(sport_df.loc[sport_df['reviews'] < 2000, 'reviews'], bins=50),
+                  'output': f'{output_dir}/reviews_distribution.png'})
+
+    # d. Sales vs. Rating
+    print('\nd. Monthly Sales vs. Star Rating')
+    sales_filtered = sport_df.loc[sport_df['boughtInLastMonth'] < 1000, ['stars', 'boughtInLastMonth']]
+    if sales_chart == 'auto':
+        sales_chart = 'scatter' if len(sales_filtered) <= SCATTER_MAX_POINTS else 'density'
+    if sales_chart == 'density':
+        grid = density_grid(sales_filtered['stars'], sales_filtered['boughtInLastMonth'],
+                            bins=[STAR_EDGES, SALES_EDGES])
+        tasks.append({'name': 'd. sales_stars_relation', 'render': render_sales_stars_density,
+                      'data': {'grid': grid, 'log': log_density},
+                      'output': f'{output_dir}/sales_stars_relation.png'})
+    else:
+        tasks.append({'name': 'd. sales_stars_relation', 'render': render_sales_stars_relation,
+                      'data': sales_filtered,
+                      'output': f'{output_dir}/sales_stars_relation.png'})
+    print(f'Sales vs. rating chart: {sales_chart} ({len(sales_filtered)} products)')
+
+    # e. BestSeller vs Non-BestSeller Comparison
+    print('\ne. BestSeller vs Non-BestSeller Comparison')
+    price_filtered = sport_df[sport_df['price'] < 500]
+    sales_filtered = sport_df[sport_df['boughtInLastMonth'] < 1000]
+    tasks.append({'name': 'e. bestseller_comparison', 'render': render_bestseller_comparison,
+                  'data': (box_stats(sport_df['stars'], sport_df['isBestSeller']),
+                           box_stats(price_filtered['price'], price_filtered['isBestSeller']),
+                           box_stats(sales_filtered['boughtInLastMonth'], sales_filtered['isBestSeller'])),
+                  'output': f'{output_dir}/bestseller_comparison.png'})
+
+    # f. Product tier sales difference
+    print('\nf. Product Tier Sales Difference')
+    tier_sales = rollup(sport_cube, 'product_tier', 'boughtInLastMonth')['mean'].sort_values(ascending=False)
+    # Plain labels so the bars keep the sorted order rather than the tier order
+    tier_sales.index = tier_sales.index.astype(str)
+    tasks.append({'name': 'f. tier_sales_comparison', 'render': render_tier_sales_comparison,
+                  'data': tier_sales,
+                  'output': f'{output_dir}/tier_sales_comparison.png'})
+
+    # g. Sales by price range
+    print('\ng. Sales by Price Range')
+    price_range_sales = price_band_sales(sport_df)
+    tasks.append({'name': 'g. price_range_sales', 'render': render_price_range_sales,
+                  'data': price_range_sales,
+                  'output': f'{output_dir}/price_range_sales.png'})
+
+    print('\nSales by Price Range Statistics:')
+    print(price_range_sales)
+
+    for task in tasks:
+        task['options'] = {'category': category}
+    return tasks
+
+
+def add_arguments(parser):
+    """
+    Options of the Sports analysis (shared with analytics_cli.py)
+    """
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='chart rendering processes')
+    parser.add_argument('--no-cache', action='store_true', help='re-render charts even if unchanged')
+    parser.add_argument('--sales-chart', choices=['auto', 'scatter', 'density'], default='auto',
+                        help=f'sales vs. rating chart type (auto: density above {SCATTER_MAX_POINTS} products)')
+    parser.add_argument('--log-density', action='store_true', help='log color scale for the density chart')
+    return parser
+
+
+def run(df=None, cube=None, workers=None, use_cache=True, sales_chart='auto', log_density=False):
+    """
+    Filter the Sports products, save them and render their charts
+
+    df and cube are the further cleaned data and its aggregation cube if
+    already in memory; otherwise they are read from disk. Returns the Sports
+    products (None if the analysis stopped early).
+    """
     # Create output directory
-    if not os.path.exists('output/sport_analysis'):
-        os.makedirs('output/sport_analysis')
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
 
     print('=' * 50)
     print('Starting Sports & Outdoors Product Analysis')
@@ -26,12 +277,20 @@ def main():
     print('-' * 30)
 
     try:
-        if not os.path.exists('output/amz_uk_further_cleaned.csv'):
+        if df is not None:
+            print('Using further cleaned data already in memory')
+            full_df = df
+            df = df[CACHED_COLUMNS]
+        elif not table_exists(FURTHER_CLEANED_PATH):
             print('Error: data file not found')
             return
-
-        print('Reading data file...')
-        df = pd.read_csv('output/amz_uk_further_cleaned.csv')
+        else:
+            print('Reading data file...')
+            full_df = None
+            # Numeric and categorical columns only, memory-mapped from the column cache
+            with stage('load') as load_stage:
+                df = load_columns(FURTHER_CLEANED_PATH, CACHED_COLUMNS)
+                load_stage.rows = len(df)
         print(f'Data loaded successfully, shape: {df.shape}')
         
         if df.empty:
@@ -54,15 +313,22 @@ def main():
     print('-' * 30)
 
     try:
-        sport_df = df[df['main_category'] == 'Sports'].copy()
+        # Full rows of the Sports products only
+        with stage('filter_sports') as filter_stage:
+            if full_df is not None:
+                sport_df = full_df[full_df['main_category'] == 'Sports'].reset_index(drop=True)
+            else:
+                sport_df = load_table(FURTHER_CLEANED_PATH, filters=[('main_category', '==', 'Sports')])
+            filter_stage.rows = len(sport_df)
         print(f'Number of Sports products: {len(sport_df)}')
 
         if len(sport_df) == 0:
             print('Warning: No Sports products found')
             return
 
-        sport_df.to_csv('output/sport_analysis/sport_products.csv', index=False)
-        print('Saved Sports products to output/sport_analysis/sport_products.csv')
+        with stage('save', rows=len(sport_df)):
+            save_table(sport_df, SPORT_PRODUCTS_PATH)
+        print(f'Saved Sports products to {SPORT_PRODUCTS_PATH}')
 
     except Exception as e:
         print(f'Error processing data: {str(e)}')
@@ -73,123 +339,33 @@ def main():
     print('-' * 30)
 
     try:
-        # a. Price distribution
-        print('\na. Price distribution analysis')
-        plt.figure(figsize=(12, 6))
-        price_filtered = sport_df[sport_df['price'] < 500]
-        sns.histplot(data=price_filtered, x='price', bins=50)
-        plt.title('Price Distribution of Sports Products (Price < 500)', fontsize=14)
-        plt.xlabel('Price (£)', fontsize=12)
-        plt.ylabel('Number of Products', fontsize=12)
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/price_distribution.png', dpi=300)
-        plt.close()
-        print('Price distribution chart generated')
-
-        # b. Star rating distribution
-        print('\nb. Star rating distribution analysis')
-        plt.figure(figsize=(12, 6))
-        sns.countplot(data=sport_df, x='stars')
-        plt.title('Star Rating Distribution of Sports Products', fontsize=14)
-        plt.xlabel('Star Rating', fontsize=12)
-        plt.ylabel('Number of Products', fontsize=12)
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/stars_distribution.png', dpi=300)
-        plt.close()
-        print('Star rating chart generated')
-
-        # c. Review count distribution
-        print('\nc. Review count distribution analysis')
-        plt.figure(figsize=(12, 6))
-        reviews_filtered = sport_df[sport_df['reviews'] < 2000]
-        sns.histplot(data=reviews_filtered, x='reviews', bins=50)
-        plt.title('Review Count Distribution (Reviews < 2000)', fontsize=14)
-        plt.xlabel('Number of Reviews', fontsize=12)
-        plt.ylabel('Number of Products', fontsize=12)
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/reviews_distribution.png', dpi=300)
-        plt.close()
-        print('Review count chart generated')
-
-        # d. Sales vs. Rating
-        print('\nd. Monthly Sales vs. Star Rating')
-        plt.figure(figsize=(12, 6))
-        sales_filtered = sport_df[sport_df['boughtInLastMonth'] < 1000]
-        sns.scatterplot(data=sales_filtered, x='stars', y='boughtInLastMonth', alpha=0.5)
-        plt.title('Monthly Sales vs. Star Rating (Sales < 1000)', fontsize=14)
-        plt.xlabel('Star Rating', fontsize=12)
-        plt.ylabel('Monthly Sales', fontsize=12)
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/sales_stars_relation.png', dpi=300)
-        plt.close()
-        print('Monthly Sales vs. Rating chart generated')
-
-        # e. BestSeller vs Non-BestSeller Comparison
-        print('\ne. BestSeller vs Non-BestSeller Comparison')
-        fig, axes = plt.subplots(1, 3, figsize=(18, 6))
-
-        sns.boxplot(data=sport_df, x='isBestSeller', y='stars', ax=axes[0])
-        axes[0].set_title('Star Rating Comparison')
-        axes[0].set_xlabel('Best Seller')
-        axes[0].set_ylabel('Star Rating')
-        axes[0].set_xticklabels(['Not Best Seller', 'Best Seller'])
-
-        sns.boxplot(data=sport_df[sport_df['price'] < 500], x='isBestSeller', y='price', ax=axes[1])
-        axes[1].set_title('Price Comparison (Price < 500)')
-        axes[1].set_xlabel('Best Seller')
-        axes[1].set_ylabel('Price (£)')
-        axes[1].set_xticklabels(['Not Best Seller', 'Best Seller'])
-
-        sns.boxplot(data=sport_df[sport_df['boughtInLastMonth'] < 1000], x='isBestSeller', y='boughtInLastMonth', ax=axes[2])
-        axes[2].set_title('Sales Comparison (Monthly Sales < 1000)')
-        axes[2].set_xlabel('Best Seller')
-        axes[2].set_ylabel('Monthly Sales')
-        axes[2].set_xticklabels(['Not Best Seller', 'Best Seller'])
-
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/bestseller_comparison.png', dpi=300)
-        plt.close()
-        print('BestSeller comparison chart generated')
-
-        # f. Product tier sales difference
-        print('\nf. Product Tier Sales Difference')
-        plt.figure(figsize=(12, 6))
-        tier_sales = sport_df.groupby('product_tier')['boughtInLastMonth'].mean().sort_values(ascending=False)
-        sns.barplot(x=tier_sales.index, y=tier_sales.values)
-        plt.title('Average Sales by Product Tier (Sports)', fontsize=14)
-        plt.xlabel('Product Tier', fontsize=12)
-        plt.ylabel('Average Monthly Sales', fontsize=12)
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/tier_sales_comparison.png', dpi=300)
-        plt.close()
-        print('Product tier sales comparison chart generated')
-
-        # g. Sales by price range
-        print('\ng. Sales by Price Range')
-        bins = [0, 50, 100, 150, 200, 250, 300, 350, 400, float('inf')]
-        labels = ['0-50', '50-100', '100-150', '150-200', '200-250', '250-300', '300-350', '350-400', '400+']
-        sport_df['price_range'] = pd.cut(sport_df['price'], bins=bins, labels=labels, right=False)
-        price_range_sales = sport_df.groupby('price_range')['boughtInLastMonth'].sum().sort_index()
-
-        plt.figure(figsize=(12, 6))
-        sns.barplot(x=price_range_sales.index, y=price_range_sales.values)
-        plt.title('Total Sales by Price Range (Sports)', fontsize=14)
-        plt.xlabel('Price Range (£)', fontsize=12)
-        plt.ylabel('Total Sales', fontsize=12)
-        for i, v in enumerate(price_range_sales.values):
-            plt.text(i, v, f'{v:,.0f}', ha='center', va='bottom')
-        plt.tight_layout()
-        plt.savefig('output/sport_analysis/price_range_sales.png', dpi=300)
-        plt.close()
-
-        print('\nSales by Price Range Statistics:')
-        print(price_range_sales)
-        print('Price range sales chart generated')
+        with stage('chart_data', rows=len(sport_df)):
+            if cube is None:
+                cube = get_cube()
+            sport_cube = cube[cube['main_category'] == 'Sports']
+            tasks = prepare_charts(sport_df, sport_cube, sales_chart=sales_chart, log_density=log_density)
+        cache_path = CHART_CACHE_PATH if use_cache else None
+        with stage('render_charts'):
+            results, wall_seconds = render_charts(tasks, workers=workers, cache_path=cache_path)
+        print_timing_report(results, wall_seconds)
+        for result in results:
+            if result['error'] is None:
+                print(f'{result["name"]} chart generated: {result["output"]}')
 
     except Exception as e:
         print(f'Error generating charts: {str(e)}')
         return
 
+    return sport_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sports & Outdoors product analysis')
+    args = add_arguments(parser).parse_args()
+    run(workers=args.workers, use_cache=not args.no_cache, sales_chart=args.sales_chart,
+        log_density=args.log_density)
+
+
 if __name__ == '__main__':
     try:
         main()
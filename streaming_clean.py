@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming version of clean_and_save_data.py + further_clean_data.py
+
+The raw CSV is processed in row chunks: URL columns are never loaded, each
+chunk is de-duplicated by ASIN and appended to the cleaned table, filtered
+to the 1-1000 GBP window,
+given the price_range/main_category/product_tier features and appended to
+the further cleaned table. Counts and price statistics are accumulated
+across chunks so both summary files are still written, while memory stays
+bounded by the chunk size instead of the dataset size.
+
+De-duplication needs every copy of an ASIN, so a first pass reads only
+the ASIN and survivor policy columns and picks the surviving rows
+(asin_dedup.dedupe_chunks, spilling hash buckets to disk for large files).
+The later passes keep those rows in their original order, so the tables
+hold the same rows as with clean_and_save_data.py + further_clean_data.py.
+
+With --price-filter robust the window is replaced by per-category outlier
+detection (outlier_detection.py). Its statistics are mergeable histograms,
+so they are gathered by one extra pass over the chunks before the main pass
+filters with them.
+
+Quantiles (medians, quartiles) come from KLL sketches (quantile_sketch.py)
+instead of exact describe(): they use bounded memory and are approximate
+within the documented rank error. Counts, means, minima and maxima remain
+exact.
+
+Charts are not produced in streaming mode; run the analysis scripts on the
+resulting tables for those.
+"""
+
+import pandas as pd
+import argparse
+import math
+import os
+from data_loader import RAW_DATA_PATH, PRODUCT_COLUMNS, iter_product_chunks
+from asin_dedup import DEFAULT_POLICY, MEMORY_BUDGET_MB, policy_columns, dedupe_chunks
+from columnar_store import CLEANED_DATA_PATH, FURTHER_CLEANED_PATH, ChunkedTableWriter
+from features import (PRICE_MIN, PRICE_MAX, PRICE_LABELS, OPEN_PRICE_BINS, OPEN_PRICE_LABELS, TIER_ORDER,
+                      filter_price_window, add_features)
+from summaries import write_data_analysis_summary, write_further_analysis_summary
+from quantile_sketch import KLLSketch
+from outlier_detection import METHODS, MEASURES, scan_statistics, outlier_bounds, flag_outliers
+
+# Columns of the cleaned data summarized by quantile sketches
+SKETCH_COLUMNS = ['price', 'reviews', 'boughtInLastMonth']
+
+
+def add_counts(total, counts):
+    """
+    Merge a value_counts() result into a running total
+    """
+    return total.add(counts, fill_value=0)
+
+
+def new_aggregates(price_labels=PRICE_LABELS):
+    """
+    Empty running aggregates for the streaming pipeline
+    """
+    return {
+        # Cleaned data (all rows)
+        'rows': 0,
+        'columns': 0,
+        'sketches': {col: KLLSketch(seed=i) for i, col in enumerate(SKETCH_COLUMNS)},
+        'category_counts': pd.Series(dtype='float64'),
+        'price_zero': 0,
+        'price_low': 0,
+        'price_high': 0,
+        # Further cleaned data (price window)
+        'filtered_rows': 0,
+        'filtered_columns': 0,
+        'price_labels': price_labels,
+        'filter_condition': None,
+        'price_range_counts': pd.Series(0, index=price_labels, dtype='float64'),
+        'tier_counts': pd.Series(0, index=TIER_ORDER, dtype='float64'),
+        'tier_price_sketches': {tier: KLLSketch(seed=i) for i, tier in enumerate(TIER_ORDER)},
+    }
+
+
+def update_cleaned_aggregates(aggs, chunk):
+    """
+    Accumulate statistics of one cleaned (unfiltered) chunk
+    """
+    price = chunk['price']
+    aggs['rows'] += len(chunk)
+    aggs['columns'] = chunk.shape[1]
+    for col, sketch in aggs['sketches'].items():
+        sketch.update(chunk[col])
+    aggs['category_counts'] = add_counts(aggs['category_counts'],
+                                         chunk['categoryName'].astype('object').value_counts())
+    aggs['price_zero'] += int((price == 0).sum())
+    aggs['price_low'] += int((price < PRICE_MIN).sum())
+    aggs['price_high'] += int((price > PRICE_MAX).sum())
+
+
+def update_filtered_aggregates(aggs, filtered):
+    """
+    Accumulate statistics of one price-filtered chunk with features
+    """
+    aggs['filtered_rows'] += len(filtered)
+    aggs['filtered_columns'] = filtered.shape[1]
+    aggs['price_range_counts'] = add_counts(aggs['price_range_counts'], filtered['price_range'].value_counts())
+    aggs['tier_counts'] = add_counts(aggs['tier_counts'], filtered['product_tier'].value_counts())
+    for tier, prices in filtered.groupby('product_tier', observed=True)['price']:
+        aggs['tier_price_sketches'][tier].update(prices)
+
+
+def price_stats_from_aggregates(aggs):
+    """
+    describe()-style price statistics of the cleaned data (approximate quartiles)
+    """
+    return aggs['sketches']['price'].describe()
+
+
+def tier_price_from_aggregates(aggs):
+    """
+    Per-tier price count/mean/median, in the layout of groupby().agg() (approximate medians)
+    """
+    rows = {}
+    for tier in TIER_ORDER:
+        sketch = aggs['tier_price_sketches'][tier]
+        if sketch.count == 0:
+            continue
+        rows[tier] = {
+            'mean': sketch.sum / sketch.count,
+            'median': sketch.quantile(0.5),
+            'count': sketch.count,
+        }
+    return pd.DataFrame.from_dict(rows, orient='index', columns=['mean', 'median', 'count'])
+
+
+def dedupe_buckets(file_path, memory_mb=MEMORY_BUDGET_MB):
+    """
+    Hash buckets for de-duplicating a CSV (its size bounds that of the key columns)
+    """
+    return max(1, math.ceil(os.path.getsize(file_path) / (memory_mb * 1024 ** 2)))
+
+
+def deduplicated_chunks(file_path, keep, chunksize=200000, columns=None):
+    """
+    Row chunks of a product CSV, restricted to the rows marked in keep
+    """
+    start = 0
+    for chunk in iter_product_chunks(file_path, chunksize=chunksize, columns=columns):
+        mask = keep[start:start + len(chunk)]
+        start += len(chunk)
+        yield chunk if mask.all() else chunk[mask]
+
+
+def run_streaming(file_path=RAW_DATA_PATH, chunksize=200000, price_filter='window', outlier_method='mad'):
+    """
+    Run the cleaning and feature engineering stages chunk by chunk
+    """
+    # De-duplication pass: surviving rows chosen from the key columns only
+    key_columns = ['asin'] + policy_columns(DEFAULT_POLICY, PRODUCT_COLUMNS)
+    keep, duplicate_stats = dedupe_chunks(iter_product_chunks(file_path, chunksize=chunksize, columns=key_columns),
+                                          DEFAULT_POLICY, dedupe_buckets(file_path))
+    print(f'Duplicate ASIN rows removed: {duplicate_stats.get("removed_rows", 0)} '
+          f'(survivor policy: {" > ".join(DEFAULT_POLICY)})')
+
+    if price_filter == 'robust':
+        # Statistics pass: per-category histograms merged across chunks
+        columns = ['categoryName'] + list(MEASURES.values())
+        stats = scan_statistics(deduplicated_chunks(file_path, keep, chunksize, columns))
+        bounds = outlier_bounds(stats, outlier_method)
+        print(f'Per-category outlier statistics of {len(stats)} categories ({outlier_method})')
+        aggs = new_aggregates(OPEN_PRICE_LABELS)
+        aggs['filter_condition'] = f'Per-category price outliers removed ({outlier_method} on log price)'
+    else:
+        aggs = new_aggregates()
+
+    with ChunkedTableWriter(CLEANED_DATA_PATH) as cleaned_writer, \
+            ChunkedTableWriter(FURTHER_CLEANED_PATH) as further_writer:
+        for i, chunk in enumerate(deduplicated_chunks(file_path, keep, chunksize)):
+            cleaned_writer.write(chunk)
+            update_cleaned_aggregates(aggs, chunk)
+
+            if price_filter == 'robust':
+                filtered = chunk[~flag_outliers(chunk, bounds)['price_outlier']].copy()
+                filtered = add_features(filtered, OPEN_PRICE_BINS, OPEN_PRICE_LABELS)
+            else:
+                filtered = add_features(filter_price_window(chunk, PRICE_MIN, PRICE_MAX))
+            further_writer.write(filtered)
+            update_filtered_aggregates(aggs, filtered)
+
+            print(f'Chunk {i + 1}: {len(chunk)} rows after de-duplication, {len(filtered)} rows kept '
+                  f'(total {aggs["rows"]} cleaned, {aggs["filtered_rows"]} kept)')
+
+    aggs['removed_duplicates'] = duplicate_stats.get('removed_rows', 0)
+    return aggs
+
+
+def write_summaries(aggs):
+    """
+    Write both summary files from the accumulated aggregates
+    """
+    category_counts = aggs['category_counts'].astype('int64').sort_values(ascending=False)
+    price_range_counts = aggs['price_range_counts'].reindex(aggs['price_labels']).astype('int64')
+    write_data_analysis_summary('output/data_analysis_summary.txt',
+                                total_products=aggs['rows'],
+                                category_counts=category_counts,
+                                price_stats=price_stats_from_aggregates(aggs),
+                                low_price_count=aggs['price_low'],
+                                high_price_count=aggs['price_high'])
+
+    write_further_analysis_summary('output/further_analysis_summary.txt',
+                                   original_shape=(aggs['rows'], aggs['columns']),
+                                   filtered_shape=(aggs['filtered_rows'], aggs['filtered_columns']),
+                                   price_range_dist=price_range_counts,
+                                   tier_dist=aggs['tier_counts'].reindex(TIER_ORDER).astype('int64'),
+                                   tier_price=tier_price_from_aggregates(aggs),
+                                   filter_condition=aggs['filter_condition'])
+
+
+def main():
+    """
+    Main function: streaming cleaning pipeline
+    """
+    parser = argparse.ArgumentParser(description='Chunked cleaning and feature engineering')
+    parser.add_argument('--input', default=RAW_DATA_PATH, help='raw product CSV file')
+    parser.add_argument('--chunksize', type=int, default=200000, help='rows per chunk')
+    parser.add_argument('--price-filter', choices=['window', 'robust'], default='window',
+                        help=f'fixed {PRICE_MIN}-{PRICE_MAX} GBP window or per-category price outliers')
+    parser.add_argument('--outlier-method', choices=METHODS, default='mad',
+                        help='robust rule of the per-category filter')
+    args = parser.parse_args()
+
+    if not os.path.exists('output'):
+        os.makedirs('output')
+
+    print('=' * 50)
+    print('Starting streaming data cleaning and feature engineering')
+    print('=' * 50)
+
+    print(f'\n1. Processing {args.input} in chunks of {args.chunksize} rows')
+    print('-' * 30)
+    try:
+        aggs = run_streaming(args.input, args.chunksize, args.price_filter, args.outlier_method)
+    except Exception as e:
+        print(f'Error processing file: {e}')
+        exit(1)
+
+    if aggs['rows'] == 0:
+        print('Error: input file contains no rows')
+        exit(1)
+
+    print(f'Saved cleaned data to: {CLEANED_DATA_PATH}')
+    print(f'Saved further cleaned data to: {FURTHER_CLEANED_PATH}')
+
+    print('\n2. Running Aggregates')
+    print('-' * 30)
+    print(f'Rows after de-duplication: {aggs["rows"]} ({aggs["removed_duplicates"]} duplicate ASIN rows removed)')
+    print(f'Number of products with price = 0: {aggs["price_zero"]}')
+    print(f'Number of products with price < 1: {aggs["price_low"]}')
+    print(f'Number of products with price > 1000: {aggs["price_high"]}')
+    print(f'Rows kept after price filter: {aggs["filtered_rows"]}')
+    print('\nProduct tier distribution:')
+    print(aggs['tier_counts'].astype('int64'))
+    print('\nStatistics of the cleaned data (quartiles approximate):')
+    print(pd.DataFrame({col: sketch.describe() for col, sketch in aggs['sketches'].items()}))
+
+    print('\n3. Saving Summaries')
+    print('-' * 30)
+    write_summaries(aggs)
+    print('Saved summary to output/data_analysis_summary.txt')
+    print('Saved further analysis summary to output/further_analysis_summary.txt')
+
+    print('\nStreaming cleaning completed')
+    print('=' * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Writers for the text summary reports
+
+The inputs are small aggregates (counts and price statistics), so the same
+writers serve the in-memory scripts and the chunked streaming pipeline.
+"""
+
+from features import PRICE_MIN, PRICE_MAX, TIER_ORDER
+from tier_engine import get_scheme, describe_rules
+
+
+def write_data_analysis_summary(path, total_products, category_counts, price_stats,
+                                low_price_count, high_price_count):
+    """
+    Write output/data_analysis_summary.txt
+
+    price_stats needs 'mean', '50%', 'min' and 'max' entries (as in describe()).
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# Amazon UK Product Data Analysis Summary\n\n')
+        f.write(f'## 1. Data Overview\n')
+        f.write(f'- Total number of products: {total_products}\n')
+        f.write(f'- Total number of categories: {len(category_counts)}\n\n')
+
+        f.write(f'## 2. Price Analysis\n')
+        f.write(f'- Average price: £{price_stats["mean"]:.2f}\n')
+        f.write(f'- Median price: £{price_stats["50%"]:.2f}\n')
+        f.write(f'- Minimum price: £{price_stats["min"]:.2f}\n')
+        f.write(f'- Maximum price: £{price_stats["max"]:.2f}\n')
+        f.write(f'- Number of products with price < 1: {low_price_count}\n')
+        f.write(f'- Number of products with price > 1000: {high_price_count}\n\n')
+
+        f.write(f'## 3. Top Categories\n')
+        for i, (cat, count) in enumerate(category_counts.head(10).items()):
+            f.write(f'{i+1}. {cat}: {count} items\n')
+
+
+def write_further_analysis_summary(path, original_shape, filtered_shape, price_range_dist,
+                                   tier_dist, tier_price, filter_condition=None):
+    """
+    Write output/further_analysis_summary.txt
+
+    tier_price is indexed by tier with 'count', 'mean' and 'median' columns.
+    filter_condition describes the price filter (default: the fixed window).
+    """
+    if filter_condition is None:
+        filter_condition = f'Price between {PRICE_MIN} and {PRICE_MAX} GBP'
+    filtered_out = original_shape[0] - filtered_shape[0]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# Amazon UK Product Further Analysis Summary\n\n')
+        f.write(f'## 1. Data Cleaning\n')
+        f.write(f'- Original data shape: {original_shape[0]} rows x {original_shape[1]} columns\n')
+        f.write(f'- Filtered data shape: {filtered_shape[0]} rows x {filtered_shape[1]} columns\n')
+        f.write(f'- Number of products filtered out: {filtered_out} '
+                f'({filtered_out / original_shape[0] * 100:.2f}%)\n\n')
+
+        f.write(f'## 2. Price Analysis\n')
+        f.write(f'- Filter condition: {filter_condition}\n')
+        f.write(f'- Price range distribution:\n')
+        for price_range, count in price_range_dist.items():
+            f.write(f'  * £{price_range}: {count} products ({count / filtered_shape[0] * 100:.2f}%)\n')
+
+        f.write(f'\n## 3. Product Tier Analysis\n')
+        f.write(f'- Product Tier Definitions:\n')
+        for line in describe_rules(get_scheme()):
+            f.write(f'  * {line}\n')
+        f.write('\n')
+
+        f.write(f'- Product Tier Distribution:\n')
+        for tier, count in tier_dist.items():
+            f.write(f'  * {tier}: {count} products ({count / filtered_shape[0] * 100:.2f}%)\n')
+
+        f.write(f'\n## 4. Average Price by Tier\n')
+        for tier in TIER_ORDER:
+            if tier in tier_price.index:
+                f.write(f'- {tier}:\n')
+                f.write(f'  * Number of Products: {tier_price.loc[tier, "count"]}\n')
+                f.write(f'  * Average Price: £{tier_price.loc[tier, "mean"]:.2f}\n')
+                f.write(f'  * Median Price: £{tier_price.loc[tier, "median"]:.2f}\n')
+
+
+def write_category_summary(path, category, product_count, bestseller_ratio, measure_stats,
+                           tier_dist, price_band_sales):
+    """
+    Write the summary of one main category (output/category_analysis/<category>/summary.txt)
+
+    measure_stats is indexed by measure with 'mean', 'std', 'min' and 'max' columns.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'# {category} Product Analysis Summary\n\n')
+        f.write(f'## 1. Overview\n')
+        f.write(f'- Number of products: {product_count}\n')
+        f.write(f'- Best Seller ratio: {bestseller_ratio * 100:.2f}%\n\n')
+
+        f.write(f'## 2. Statistics\n')
+        for measure, row in measure_stats.iterrows():
+            f.write(f'- {measure}: mean {row["mean"]:.2f}, std {row["std"]:.2f}, '
+                    f'min {row["min"]:.2f}, max {row["max"]:.2f}\n')
+
+        f.write(f'\n## 3. Product Tiers\n')
+        for tier, count in tier_dist.items():
+            f.write(f'- {tier}: {count} products ({count / product_count * 100:.2f}%)\n')
+
+        f.write(f'\n## 4. Total Monthly Sales by Price Range (£)\n')
+        for price_band, sales in price_band_sales.items():
+            f.write(f'- {price_band}: {sales:,.0f}\n')
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Vectorized product tier classification
+
+Tier rules (minimum stars and reviews per tier) are read from
+config/tier_rules.json. Each scheme is an ordered list of rules. The first
+rule a product satisfies gives its tier. Products that match no rule get
+the fallback tier, and products with missing stars or reviews get the
+unknown tier.
+
+Run this file directly to benchmark against the row-wise apply, check that
+both give exactly the same result, and compare all configured schemes.
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import time
+from functools import lru_cache
+
+# Rule table location (shipped with the code, not with the data)
+TIER_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'tier_rules.json')
+
+
+@lru_cache(maxsize=None)
+def load_tier_config(path=TIER_RULES_PATH):
+    """
+    Read the tier rule table
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_scheme(name=None, path=TIER_RULES_PATH):
+    """
+    Rules of one scheme (the configured default if no name is given)
+    """
+    config = load_tier_config(path)
+    if name is None:
+        name = config['default_scheme']
+    if name not in config['schemes']:
+        raise KeyError(f'Unknown tier scheme: {name}')
+    return config['schemes'][name]
+
+
+def tier_categories(rules, path=TIER_RULES_PATH):
+    """
+    Ordered tier labels of a scheme: rule tiers, then fallback and unknown
+    """
+    config = load_tier_config(path)
+    categories = []
+    for tier in [rule['tier'] for rule in rules] + [config['fallback_tier'], config['unknown_tier']]:
+        if tier not in categories:
+            categories.append(tier)
+    return categories
+
+
+def describe_rules(rules, path=TIER_RULES_PATH):
+    """
+    Human-readable rule definitions, one line per tier
+    """
+    config = load_tier_config(path)
+    lines = [f'{rule["tier"]}: Rating ≥ {rule["min_stars"]:.1f} and Reviews ≥ {rule["min_reviews"]}'
+             for rule in rules]
+    lines.append(f'{config["fallback_tier"]}: Others')
+    return lines
+
+
+def _rating_arrays(df):
+    """
+    stars/reviews as numpy arrays plus the mask of rows with missing values
+    """
+    stars = df['stars'].to_numpy()
+    if stars.dtype.kind != 'f':
+        stars = df['stars'].to_numpy(dtype='float64', na_value=np.nan)
+    reviews = df['reviews'].to_numpy(dtype='float64', na_value=np.nan)
+    unknown = np.isnan(stars) | np.isnan(reviews)
+    return stars, reviews, unknown
+
+
+def _classify_codes(stars, reviews, unknown, rules, categories, mask_cache, path=TIER_RULES_PATH):
+    """
+    Category codes for one scheme, reusing threshold masks across schemes
+    """
+    config = load_tier_config(path)
+
+    def threshold_mask(column, values, threshold):
+        key = (column, threshold)
+        if key not in mask_cache:
+            # Compare in the column's own dtype so 4.2 in the table matches a float32 4.2 rating
+            mask_cache[key] = values >= values.dtype.type(threshold)
+        return mask_cache[key]
+
+    conditions = [unknown]
+    choices = [categories.index(config['unknown_tier'])]
+    for rule in rules:
+        conditions.append(threshold_mask('stars', stars, rule['min_stars'])
+                          & threshold_mask('reviews', reviews, rule['min_reviews']))
+        choices.append(categories.index(rule['tier']))
+
+    return np.select(conditions, choices, default=categories.index(config['fallback_tier']))
+
+
+def classify_tiers(df, rules=None, path=TIER_RULES_PATH):
+    """
+    Tier of every row as an ordered categorical
+    """
+    if rules is None:
+        rules = get_scheme(path=path)
+    categories = tier_categories(rules, path)
+    stars, reviews, unknown = _rating_arrays(df)
+    codes = _classify_codes(stars, reviews, unknown, rules, categories, {}, path)
+    return pd.Categorical.from_codes(codes, categories=categories, ordered=True)
+
+
+def classify_schemes(df, scheme_names=None, path=TIER_RULES_PATH):
+    """
+    Classify rows under several schemes in one pass for what-if comparisons
+
+    The stars/reviews arrays and missing-value mask are extracted once and
+    threshold masks are shared between schemes. Returns one column per scheme.
+    """
+    config = load_tier_config(path)
+    if scheme_names is None:
+        scheme_names = list(config['schemes'])
+
+    stars, reviews, unknown = _rating_arrays(df)
+    mask_cache = {}
+    result = {}
+    for name in scheme_names:
+        rules = get_scheme(name, path)
+        categories = tier_categories(rules, path)
+        codes = _classify_codes(stars, reviews, unknown, rules, categories, mask_cache, path)
+        result[name] = pd.Categorical.from_codes(codes, categories=categories, ordered=True)
+    return pd.DataFrame(result, index=df.index)
+
+
+def synthetic_ratings(rows, seed=0):
+    """
+    Random stars/reviews columns for benchmarking when no data is available
+    """
+    rng = np.random.default_rng(seed)
+    stars = np.round(rng.uniform(0, 5, rows), 1).astype('float32')
+    stars[rng.random(rows) < 0.01] = np.nan
+    reviews = (rng.pareto(1.2, rows) * 10).astype('int32')
+    return pd.DataFrame({'stars': stars, 'reviews': reviews})
+
+
+def main():
+    """
+    Main function: benchmark and equivalence check against the row-wise apply
+    """
+    from features import get_product_tier
+    from columnar_store import FURTHER_CLEANED_PATH, load_table, table_exists
+
+    parser = argparse.ArgumentParser(description='Benchmark the vectorized tier engine')
+    parser.add_argument('--rows', type=int, default=0,
+                        help='use this many synthetic rows instead of the further cleaned data')
+    parser.add_argument('--rules', default=TIER_RULES_PATH, help='tier rule table (JSON)')
+    args = parser.parse_args()
+
+    print('=' * 50)
+    print('Product Tier Engine Benchmark')
+    print('=' * 50)
+
+    print('\n1. Loading ratings')
+    print('-' * 30)
+    if args.rows == 0 and table_exists(FURTHER_CLEANED_PATH):
+        df = load_table(FURTHER_CLEANED_PATH, columns=['stars', 'reviews'])
+        print(f'Loaded {len(df)} rows from {FURTHER_CLEANED_PATH}')
+    else:
+        df = synthetic_ratings(args.rows or 1000000)
+        print(f'Generated {len(df)} synthetic rows')
+
+    print('\n2. Row-wise apply vs vectorized engine')
+    print('-' * 30)
+    start = time.perf_counter()
+    rowwise = df.apply(get_product_tier, axis=1)
+    rowwise_seconds = time.perf_counter() - start
+
+    rules = get_scheme(path=args.rules)
+    start = time.perf_counter()
+    vectorized = classify_tiers(df, rules, args.rules)
+    vectorized_seconds = time.perf_counter() - start
+
+    print(f'Row-wise apply: {rowwise_seconds:.3f}s')
+    print(f'Vectorized:     {vectorized_seconds:.3f}s')
+    print(f'Speedup:        {rowwise_seconds / max(vectorized_seconds, 1e-9):.1f}x')
+
+    mismatches = int((rowwise.to_numpy() != np.asarray(vectorized, dtype=object)).sum())
+    if mismatches == 0:
+        print('Equivalence check: passed (identical tiers for every row)')
+    else:
+        print(f'Equivalence check: FAILED ({mismatches} rows differ)')
+
+    print('\n3. What-if comparison of all schemes')
+    print('-' * 30)
+    start = time.perf_counter()
+    schemes = classify_schemes(df, path=args.rules)
+    schemes_seconds = time.perf_counter() - start
+    print(f'Classified {len(schemes.columns)} schemes in {schemes_seconds:.3f}s')
+    comparison = pd.DataFrame({name: schemes[name].value_counts() for name in schemes.columns})
+    print(comparison.fillna(0).astype('int64'))
+
+    print('=' * 50)
+    if mismatches:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Inverted keyword index over product titles
+
+Titles are lower-cased and split into word tokens (letters and digits). For
+every token the index stores the sorted row numbers of the products whose
+title contains it (its posting list), so a keyword query intersects a few
+short arrays instead of scanning every title:
+
+    python title_index.py "yoga mat" --category Sports --max-price 30
+    python title_index.py nike --tier Premium --limit 10
+    python title_index.py '"yoga mat" non-slip' --price-range 20-50
+    python title_index.py --rebuild           # only (re)build the index
+
+Query syntax: words must all appear in the title, in any order; a trailing *
+matches every token with that prefix (yog*); a quoted phrase must appear as
+consecutive words. Category, price range, tier and price filters are applied
+to the matching rows through the column cache (column_cache.py), whose rows
+line up with the index.
+
+The index of a table lives next to it (output/amz_uk_further_cleaned.title_index/
+for output/amz_uk_further_cleaned.parquet) as memory-mapped .npy files:
+vocabulary (sorted tokens), offsets and postings (the posting lists, one
+after another), and the titles and ASINs for displaying results. Like the
+column cache it records the size and modification time of the table and is
+rebuilt when the table changes.
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from columnar_store import FURTHER_CLEANED_PATH, load_table
+from column_cache import source_signature, save_array, save_manifest, load_columns
+
+# Word tokens: runs of letters and digits (accented letters included)
+TOKEN_PATTERN = r'[^\W_]+'
+
+# Titles tokenized per chunk, to bound the memory of the token lists
+BUILD_CHUNK_ROWS = 200000
+
+# Index layout version (a manifest with another version is rebuilt)
+INDEX_VERSION = 1
+
+# Column-cache columns used to filter and sort the matching products
+RESULT_COLUMNS = ['main_category', 'categoryName', 'price_range', 'product_tier',
+                  'price', 'stars', 'reviews', 'boughtInLastMonth']
+
+# Number of products printed by default
+DEFAULT_LIMIT = 20
+
+_token_re = re.compile(TOKEN_PATTERN)
+
+
+def index_dir_for(path):
+    """
+    Index directory of a table
+    """
+    return os.path.splitext(path)[0] + '.title_index'
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens of a title or query
+    """
+    return _token_re.findall(text.lower())
+
+
+# ==================== Building ====================
+
+def _chunk_postings(titles, vocabulary):
+    """
+    (token id, row) pairs of one chunk of titles, each pair once
+
+    titles is indexed by row number. New tokens are added to vocabulary
+    (token -> id, in order of first appearance).
+    """
+    tokens = titles.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+    pairs = pd.DataFrame({'row': tokens.index.to_numpy(), 'token': tokens.to_numpy()})
+    pairs = pairs.drop_duplicates()
+    codes, uniques = pd.factorize(pairs['token'])
+    ids = np.array([vocabulary.setdefault(token, len(vocabulary)) for token in uniques], dtype=np.int64)
+    return ids[codes], pairs['row'].to_numpy(dtype=np.int32)
+
+
+def build_title_index(df, source_path, index_dir=None):
+    """
+    Write the title index of df (asin and title columns) as the index of source_path
+
+    Returns the manifest. Row numbers in the index are positions in df, which
+    match the rows of the column cache of the same table.
+    """
+    index_dir = index_dir or index_dir_for(source_path)
+    if not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+
+    titles = df['title'].fillna('').astype(str).reset_index(drop=True)
+    vocabulary = {}
+    token_ids, rows = [], []
+    for start in range(0, len(titles), BUILD_CHUNK_ROWS):
+        chunk_ids, chunk_rows = _chunk_postings(titles.iloc[start:start + BUILD_CHUNK_ROWS], vocabulary)
+        token_ids.append(chunk_ids)
+        rows.append(chunk_rows)
+    token_ids = np.concatenate(token_ids) if token_ids else np.empty(0, dtype=np.int64)
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+
+    # Number the tokens in sorted order, so lookups can binary search the
+    # vocabulary and a prefix covers one contiguous range of it
+    tokens = np.array(list(vocabulary), dtype=str) if vocabulary else np.empty(0, dtype='U1')
+    order = np.argsort(tokens, kind='stable')
+    rank = np.empty(len(tokens), dtype=np.int64)
+    rank[order] = np.arange(len(tokens))
+    token_ids = rank[token_ids]
+
+    # Group the rows by token; the stable sort keeps each posting list in row order
+    by_token = np.argsort(token_ids, kind='stable')
+    postings = rows[by_token]
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(token_ids, minlength=len(tokens)), out=offsets[1:])
+
+    # Titles as one UTF-8 buffer plus offsets (the Arrow large_string layout),
+    # so they can be memory-mapped too
+    encoded = [title.encode('utf-8') for title in titles]
+    title_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=title_offsets[1:])
+
+    save_array(index_dir, 'vocabulary.npy', tokens[order])
+    save_array(index_dir, 'offsets.npy', offsets)
+    save_array(index_dir, 'postings.npy', postings)
+    save_array(index_dir, 'titles.npy', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    save_array(index_dir, 'title_offsets.npy', title_offsets)
+    save_array(index_dir, 'asin.npy', df['asin'].fillna('').astype(str).to_numpy(dtype=str))
+
+    manifest = {'version': INDEX_VERSION, 'source': source_signature(source_path),
+                'rows': len(titles), 'tokens': len(tokens), 'postings': len(postings)}
+    save_manifest(index_dir, manifest)
+    return manifest
+
+
+def read_index_manifest(source_path, index_dir=None):
+    """
+    Manifest of the title index of source_path, or None if it is missing or stale
+    """
+    path = os.path.join(index_dir or index_dir_for(source_path), 'manifest.json')
+    if not os.path.exists(path) or not os.path.exists(source_path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != INDEX_VERSION or manifest.get('source') != source_signature(source_path):
+        return None
+    return manifest
+
+
+# ==================== Searching ====================
+
+def intersect(row_lists):
+    """
+    Rows present in every sorted row array, smallest array first
+    """
+    row_lists = sorted(row_lists, key=len)
+    result = row_lists[0]
+    for rows in row_lists[1:]:
+        if len(result) == 0:
+            break
+        # Binary search each remaining candidate in the longer list
+        positions = np.searchsorted(rows, result)
+        positions[positions == len(rows)] = 0
+        result = result[rows[positions] == result]
+    return result
+
+
+def parse_query(query):
+    """
+    (words, prefixes, phrases) of a query string
+
+    Quoted parts are phrases (lists of tokens); a word ending in * is a prefix.
+    """
+    phrases = [tokenize(text) for text in re.findall(r'"([^"]*)"', query)]
+    words, prefixes = [], []
+    for part in re.sub(r'"[^"]*"', ' ', query).split():
+        if part.endswith('*'):
+            prefixes.extend(tokenize(part[:-1])[-1:])
+            words.extend(tokenize(part[:-1])[:-1])
+        else:
+            words.extend(tokenize(part))
+    return words, prefixes, [phrase for phrase in phrases if phrase]
+
+
+def phrase_pattern(phrase):
+    """
+    Regular expression (RE2 syntax, for pyarrow.compute) matching phrase (a
+    list of tokens) as consecutive tokens of a title
+    """
+    # Tokens are separated by anything that is not a letter or digit
+    separator = r'[^\p{L}\p{N}]'
+    body = f'{separator}+'.join(re.escape(token) for token in phrase)
+    return f'(?:^|{separator}){body}(?:{separator}|$)'
+
+
+class TitleIndex:
+    """
+    Memory-mapped title index of a table
+    """
+
+    def __init__(self, source_path=FURTHER_CLEANED_PATH, index_dir=None, manifest=None):
+        self.source_path = source_path
+        self.index_dir = index_dir or index_dir_for(source_path)
+        self.manifest = manifest or read_index_manifest(source_path, self.index_dir)
+        if self.manifest is None:
+            raise FileNotFoundError(f'No up-to-date title index for {source_path} in {self.index_dir}')
+        arrays = {name: np.load(os.path.join(self.index_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in ['vocabulary', 'offsets', 'postings', 'titles', 'title_offsets', 'asin']}
+        self.vocabulary = arrays['vocabulary']
+        self.offsets = arrays['offsets']
+        self.postings_array = arrays['postings']
+        # Zero-copy Arrow view of the mapped titles, for vectorized phrase matching
+        self.titles = pa.LargeStringArray.from_buffers(self.manifest['rows'], pa.py_buffer(arrays['title_offsets']),
+                                                       pa.py_buffer(arrays['titles']))
+        self.asin = arrays['asin']
+        self._columns = None
+
+    @classmethod
+    def open(cls, source_path=FURTHER_CLEANED_PATH, rebuild=True):
+        """
+        Index of source_path, (re)built from the table first if missing or stale
+        """
+        index_dir = index_dir_for(source_path)
+        manifest = read_index_manifest(source_path, index_dir)
+        if manifest is None and rebuild:
+            manifest = build_title_index(load_table(source_path, columns=['asin', 'title']),
+                                         source_path, index_dir)
+        return cls(source_path, index_dir, manifest)
+
+    def postings(self, token):
+        """
+        Sorted rows whose title contains token
+        """
+        i = np.searchsorted(self.vocabulary, token)
+        if i == len(self.vocabulary) or self.vocabulary[i] != token:
+            return np.empty(0, dtype=np.int32)
+        return self.postings_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def prefix_postings(self, prefix):
+        """
+        Sorted rows whose title contains a token starting with prefix
+        """
+        # Tokens with the prefix form one range of the sorted vocabulary
+        lo = np.searchsorted(self.vocabulary, prefix, side='left')
+        hi = np.searchsorted(self.vocabulary, prefix + '\U0010ffff', side='left')
+        if lo == hi:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(self.postings_array[self.offsets[lo]:self.offsets[hi]])
+
+    def title_list(self, rows):
+        """
+        Titles of rows
+        """
+        return self.titles.take(pa.array(rows, type=pa.int64())).to_pylist()
+
+    def keyword_rows(self, words, prefixes):
+        """
+        Sorted rows whose title contains every word and a token with every prefix
+
+        None (all rows) if there are neither.
+        """
+        row_lists = [self.postings(token) for token in set(words)]
+        row_lists += [self.prefix_postings(prefix) for prefix in set(prefixes)]
+        return intersect(row_lists) if row_lists else None
+
+    def phrase_rows(self, rows, phrases):
+        """
+        The rows whose title contains every phrase as consecutive words
+        """
+        titles = self.titles.take(pa.array(rows, type=pa.int64()))
+        keep = np.ones(len(rows), dtype=bool)
+        for phrase in phrases:
+            matched = pc.match_substring_regex(titles, phrase_pattern(phrase), ignore_case=True)
+            keep &= matched.to_numpy(zero_copy_only=False)
+        return rows[keep]
+
+    def columns(self):
+        """
+        Memory-mapped filter and sort columns of the table
+        """
+        if self._columns is None:
+            self._columns = load_columns(self.source_path, RESULT_COLUMNS)
+            if len(self._columns) != self.manifest['rows']:
+                raise ValueError(f'Column cache of {self.source_path} has {len(self._columns)} rows, '
+                                 f'the title index {self.manifest["rows"]}')
+        return self._columns
+
+    def filter_rows(self, rows, main_category=None, category_name=None, price_range=None, product_tier=None,
+                    min_price=None, max_price=None):
+        """
+        The rows (all rows if None) that pass the category, price range, tier and price filters
+        """
+        columns = self.columns()
+        mask = None
+        for col, values in [('main_category', main_category), ('categoryName', category_name),
+                            ('price_range', price_range), ('product_tier', product_tier)]:
+            if values is None:
+                continue
+            # Compare the category codes rather than the labels
+            values = [values] if isinstance(values, str) else list(values)
+            codes = columns[col].cat.codes.to_numpy()
+            wanted = columns[col].cat.categories.get_indexer(values)
+            passed = np.isin(codes if rows is None else codes[rows], wanted[wanted >= 0])
+            mask = passed if mask is None else mask & passed
+        if min_price is not None or max_price is not None:
+            prices = columns['price'].to_numpy()
+            prices = prices if rows is None else prices[rows]
+            passed = np.ones(len(prices), dtype=bool)
+            if min_price is not None:
+                passed &= prices >= min_price
+            if max_price is not None:
+                passed &= prices < max_price
+            mask = passed if mask is None else mask & passed
+        if mask is None:
+            return rows
+        return np.flatnonzero(mask) if rows is None else rows[mask]
+
+    def match(self, query='', **filters):
+        """
+        Sorted rows whose title matches query and that pass the filters (see filter_rows)
+        """
+        words, prefixes, phrases = parse_query(query)
+        rows = self.keyword_rows(words + [token for phrase in phrases for token in phrase], prefixes)
+        rows = self.filter_rows(rows, **filters)
+        if rows is None:
+            return np.arange(self.manifest['rows'])
+        # The posting lists only tell which words occur; check the word order of
+        # phrases last, on the rows that passed the filters
+        if phrases and len(rows):
+            rows = self.phrase_rows(rows, phrases)
+        return np.asarray(rows)
+
+    def search(self, query='', limit=DEFAULT_LIMIT, **filters):
+        """
+        Products whose title matches query and that pass the filters
+
+        Category, price range and tier filters take one value or a list of
+        values. Returns (total number of matches, DataFrame of the best-selling
+        `limit` matches, or all of them if limit is None).
+        """
+        rows = self.match(query, **filters)
+        columns = self.columns()
+        sales = columns['boughtInLastMonth'].to_numpy(dtype='float64')[rows]
+        order = np.argsort(-sales, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        top = rows[order]
+        result = columns.iloc[top].reset_index(drop=True)
+        result.insert(0, 'row', top)
+        result.insert(1, 'asin', np.asarray(self.asin[top]))
+        result.insert(2, 'title', self.title_list(top))
+        return len(rows), result
+
+
+# ==================== Command line ====================
+
+def add_arguments(parser):
+    """
+    Search options, shared with analytics_cli.py
+    """
+    parser.add_argument('query', nargs='?', default=None,
+                        help='keywords; "quoted phrase" for consecutive words, prefix* for prefixes')
+    parser.add_argument('--category', nargs='+', help='main categories')
+    parser.add_argument('--category-name', nargs='+', help='original category names')
+    parser.add_argument('--price-range', nargs='+', help='price ranges (e.g. 20-50)')
+    parser.add_argument('--tier', nargs='+', help='product tiers (Premium, Quality, Standard, Basic, Unknown)')
+    parser.add_argument('--min-price', type=float, help='lowest price (inclusive)')
+    parser.add_argument('--max-price', type=float, help='highest price (exclusive)')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help='products to list')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the index before searching')
+    parser.add_argument('--source', default=FURTHER_CLEANED_PATH, help='indexed table')
+    return parser
+
+
+def filters_from_args(args):
+    """
+    Keyword arguments of TitleIndex.search() from the parsed command line
+    """
+    return {'main_category': args.category, 'category_name': args.category_name,
+            'price_range': args.price_range, 'product_tier': args.tier,
+            'min_price': args.min_price, 'max_price': args.max_price}
+
+
+def run(query=None, source_path=FURTHER_CLEANED_PATH, rebuild=False, limit=DEFAULT_LIMIT, **filters):
+    """
+    Build or open the title index of source_path and print the products matching query
+
+    filters are the keyword arguments of TitleIndex.search(). Returns the
+    result DataFrame, or None if only the index was built.
+    """
+    print('=' * 50)
+    print('Title search')
+    print('=' * 50)
+
+    try:
+        start = time.perf_counter()
+        if rebuild or read_index_manifest(source_path) is None:
+            print(f'Building title index of {source_path}...')
+            manifest = build_title_index(load_table(source_path, columns=['asin', 'title']), source_path)
+            print(f'Indexed {manifest["rows"]} titles: {manifest["tokens"]} distinct tokens, '
+                  f'{manifest["postings"]} postings ({time.perf_counter() - start:.2f}s)')
+        index = TitleIndex(source_path)
+    except Exception as e:
+        print(f'Error building title index: {e}')
+        return None
+
+    if query is None and not any(value is not None for value in filters.values()):
+        print(f'Index: {index.index_dir}')
+        return None
+
+    # Map the filter columns before timing, as an interactive session would have them open
+    index.columns()
+    start = time.perf_counter()
+    total, result = index.search(query or '', limit=limit, **filters)
+    elapsed = time.perf_counter() - start
+
+    print(f'\nQuery: {query or "(all titles)"}')
+    for name, value in filters.items():
+        if value is not None:
+            print(f'  {name}: {value}')
+    print(f'{total} matching products ({elapsed * 1000:.1f} ms)')
+    if len(result):
+        print('-' * 30)
+        with pd.option_context('display.max_colwidth', 70, 'display.width', 200):
+            print(result[['asin', 'title', 'price', 'stars', 'boughtInLastMonth', 'main_category',
+                          'product_tier']].to_string(index=False))
+    return result
+
+
+def main():
+    """
+    Main function: search product titles
+    """
+    parser = argparse.ArgumentParser(description='Keyword search over product titles')
+    args = add_arguments(parser).parse_args()
+    run(args.query, source_path=args.source, rebuild=args.rebuild, limit=args.limit, **filters_from_args(args))
+
+
+if __name__ == '__main__':
+    main()
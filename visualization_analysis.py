@@ -3,201 +3,342 @@
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
+from columnar_store import FURTHER_CLEANED_PATH
+from column_cache import load_columns
+from instrumentation import stage
+from features import TIER_ORDER
+from chart_rendering import CHART_CACHE_PATH, render_charts, print_timing_report
+from chart_stats import histogram, box_stats, plot_histogram, plot_boxes
+from aggregation_cube import get_cube, rollup, key_counts
+
+# Output directory of the charts
+OUTPUT_DIR = 'output/visualization'
 
-# Set font for Chinese characters (if needed)
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# Create output directory
-if not os.path.exists('output/visualization'):
-    os.makedirs('output/visualization')
-
-print('=' * 50)
-print('Starting Data Visualization Analysis')
-print('=' * 50)
-
-# ==================== 1. Load cleaned data ====================
-print('\n1. Loading cleaned data')
-print('-' * 30)
-
-try:
-    df = pd.read_csv('output/amz_uk_further_cleaned.csv')
-    print(f'Data successfully loaded, shape: {df.shape}')
-except Exception as e:
-    print(f'Error reading file: {e}')
-    exit(1)
-
-# ==================== A. Main category product count ====================
-print('\nA. Product count by main category')
-print('-' * 30)
-
-main_category_counts = df['main_category'].value_counts().head(15)
-
-plt.figure(figsize=(15, 8))
-sns.barplot(x=main_category_counts.values, y=main_category_counts.index, palette='viridis')
-
-for i, v in enumerate(main_category_counts.values):
-    plt.text(v, i, f' {v:,}', va='center')
-
-plt.title('Top 15 Main Category Product Counts', fontsize=14)
-plt.xlabel('Product Count', fontsize=12)
-plt.ylabel('Main Category', fontsize=12)
-plt.tight_layout()
-plt.savefig('output/visualization/main_category_distribution.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('Main category product count chart generated')
-
-# ==================== B. Product price distribution ====================
-print('\nB. Product price distribution')
-print('-' * 30)
-
-fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
-
-sns.histplot(data=df, x='price', bins=50, ax=ax1)
-ax1.set_title('Product Price Histogram', fontsize=14)
-ax1.set_xlabel('Price (£)', fontsize=12)
-ax1.set_ylabel('Product Count', fontsize=12)
-
-sns.boxplot(data=df, x='price', ax=ax2)
-ax2.set_title('Product Price Boxplot', fontsize=14)
-ax2.set_xlabel('Price (£)', fontsize=12)
-
-plt.tight_layout()
-plt.savefig('output/visualization/price_distribution.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('Price statistics:')
-print(df['price'].describe())
-print('Product price distribution charts generated')
-
-# ==================== C. Star rating distribution ====================
-print('\nC. Star rating distribution')
-print('-' * 30)
-
-plt.figure(figsize=(12, 6))
-stars_counts = df['stars'].value_counts().sort_index()
-sns.barplot(x=stars_counts.index, y=stars_counts.values, color='skyblue')
-
-for i, v in enumerate(stars_counts.values):
-    plt.text(i, v, f'{v:,}', ha='center', va='bottom')
-
-plt.title('Star Rating Distribution', fontsize=14)
-plt.xlabel('Star Rating', fontsize=12)
-plt.ylabel('Product Count', fontsize=12)
-plt.savefig('output/visualization/stars_distribution.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('Star rating statistics:')
-print(df['stars'].describe())
-print('Star rating distribution chart generated')
-
-# ==================== D. Review count distribution ====================
-print('\nD. Review count distribution')
-print('-' * 30)
-
-plt.figure(figsize=(12, 6))
-df_reviews = df[df['reviews'] <= 2000]
-sns.histplot(data=df_reviews, x='reviews', bins=50)
-plt.title('Review Count Distribution (≤ 2000)', fontsize=14)
-plt.xlabel('Review Count', fontsize=12)
-plt.ylabel('Product Count', fontsize=12)
-plt.savefig('output/visualization/reviews_distribution.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('Review count statistics:')
-print(df['reviews'].describe())
-print(f'Products with >2000 reviews: {len(df[df["reviews"] > 2000])}')
-print('Review count distribution chart generated')
-
-# ==================== E. BestSeller vs Non-BestSeller comparison ====================
-print('\nE. BestSeller vs Non-BestSeller Comparison')
-print('-' * 30)
-
-fig, axes = plt.subplots(1, 3, figsize=(18, 6))
-
-sns.boxplot(data=df, x='isBestSeller', y='stars', ax=axes[0])
-axes[0].set_title('Star Rating Comparison', fontsize=12)
-axes[0].set_xlabel('Best Seller', fontsize=10)
-axes[0].set_ylabel('Star Rating', fontsize=10)
-axes[0].set_xticklabels(['Non-BestSeller', 'BestSeller'])
-
-sns.boxplot(data=df, x='isBestSeller', y='price', ax=axes[1])
-axes[1].set_title('Price Comparison', fontsize=12)
-axes[1].set_xlabel('Best Seller', fontsize=10)
-axes[1].set_ylabel('Price (£)', fontsize=10)
-axes[1].set_xticklabels(['Non-BestSeller', 'BestSeller'])
-
-sns.boxplot(data=df, x='isBestSeller', y='boughtInLastMonth', ax=axes[2])
-axes[2].set_title('Monthly Sales Comparison', fontsize=12)
-axes[2].set_xlabel('Best Seller', fontsize=10)
-axes[2].set_ylabel('Monthly Sales', fontsize=10)
-axes[2].set_xticklabels(['Non-BestSeller', 'BestSeller'])
-
-plt.tight_layout()
-plt.savefig('output/visualization/bestseller_comparison.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('\nBestSeller vs Non-BestSeller statistics:')
-print('\n1. Star Rating:')
-print(df.groupby('isBestSeller')['stars'].describe())
-print('\n2. Price:')
-print(df.groupby('isBestSeller')['price'].describe())
-print('\n3. Monthly Sales:')
-print(df.groupby('isBestSeller')['boughtInLastMonth'].describe())
-print('BestSeller comparison chart generated')
-
-# ==================== F. Sales by product tier ====================
-print('\nF. Sales by Product Tier')
-print('-' * 30)
-
-fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 6))
-
-tier_order = ['Premium', 'Quality', 'Standard', 'Basic', 'Unknown']
-tier_sales = df.groupby('product_tier')['boughtInLastMonth'].mean().reindex(tier_order)
-sns.barplot(x=tier_sales.index, y=tier_sales.values, ax=ax1)
-ax1.set_title('Average Monthly Sales by Product Tier', fontsize=14)
-ax1.set_xlabel('Product Tier', fontsize=12)
-ax1.set_ylabel('Average Monthly Sales', fontsize=12)
-for i, v in enumerate(tier_sales.values):
-    ax1.text(i, v, f'{v:.1f}', ha='center', va='bottom')
-
-tier_counts = df['product_tier'].value_counts().reindex(tier_order)
-sns.barplot(x=tier_counts.index, y=tier_counts.values, ax=ax2)
-ax2.set_title('Product Count by Tier', fontsize=14)
-ax2.set_xlabel('Product Tier', fontsize=12)
-ax2.set_ylabel('Product Count', fontsize=12)
-for i, v in enumerate(tier_counts.values):
-    ax2.text(i, v, f'{v:,}', ha='center', va='bottom')
-
-plt.tight_layout()
-plt.savefig('output/visualization/product_tier_sales.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('\nProduct tier sales statistics:')
-print(df.groupby('product_tier')['boughtInLastMonth'].agg(['mean', 'median', 'count']).reindex(tier_order))
-print('Product tier sales chart generated')
-
-# ==================== G. Monthly sales by main category ====================
-print('\nG. Monthly Sales Ranking by Main Category')
-print('-' * 30)
-
-category_sales = df.groupby('main_category')['boughtInLastMonth'].sum().sort_values(ascending=False).head(10)
-plt.figure(figsize=(15, 8))
-sns.barplot(x=category_sales.values, y=category_sales.index, palette='viridis')
-for i, v in enumerate(category_sales.values):
-    plt.text(v, i, f' {v:,}', va='center')
-
-plt.title('Top 10 Main Categories by Monthly Sales', fontsize=14)
-plt.xlabel('Total Monthly Sales', fontsize=12)
-plt.ylabel('Main Category', fontsize=12)
-plt.tight_layout()
-plt.savefig('output/visualization/category_sales_ranking.png', dpi=300, bbox_inches='tight')
-plt.close()
-
-print('\nTop 10 main category monthly sales stats:')
-print(category_sales)
-print('Main category monthly sales ranking chart generated')
+# Columns used by the charts below
+# (counts, sums and means come from the aggregation cube)
+COLUMNS = ['price', 'stars', 'reviews', 'isBestSeller', 'boughtInLastMonth', 'product_tier']
+
+
+# ==================== Chart renderers (run in worker processes) ====================
+
+# matplotlib and seaborn are imported by the renderers, so importing this module stays cheap
+
+def render_main_category_distribution(main_category_counts, output_path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(15, 8))
+    sns.barplot(x=main_category_counts.values, y=main_category_counts.index, palette='viridis')
+
+    for i, v in enumerate(main_category_counts.values):
+        plt.text(v, i, f' {v:,}', va='center')
+
+    plt.title('Top 15 Main Category Product Counts', fontsize=14)
+    plt.xlabel('Product Count', fontsize=12)
+    plt.ylabel('Main Category', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_price_distribution(price_stats, output_path):
+    import matplotlib.pyplot as plt
+    price_hist, price_box = price_stats
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
+
+    plot_histogram(price_hist, ax=ax1)
+    ax1.set_title('Product Price Histogram', fontsize=14)
+    ax1.set_xlabel('Price (£)', fontsize=12)
+    ax1.set_ylabel('Product Count', fontsize=12)
+
+    plot_boxes(price_box, ax=ax2, orient='y')
+    ax2.set_title('Product Price Boxplot', fontsize=14)
+    ax2.set_xlabel('Price (£)', fontsize=12)
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_stars_distribution(stars_counts, output_path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(12, 6))
+    sns.barplot(x=stars_counts.index, y=stars_counts.values, color='skyblue')
+
+    for i, v in enumerate(stars_counts.values):
+        plt.text(i, v, f'{v:,}', ha='center', va='bottom')
+
+    plt.title('Star Rating Distribution', fontsize=14)
+    plt.xlabel('Star Rating', fontsize=12)
+    plt.ylabel('Product Count', fontsize=12)
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_reviews_distribution(reviews_hist, output_path):
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 6))
+    plot_histogram(reviews_hist)
+    plt.title('Review Count Distribution (≤ 2000)', fontsize=14)
+    plt.xlabel('Review Count', fontsize=12)
+    plt.ylabel('Product Count', fontsize=12)
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_bestseller_comparison(bestseller_boxes, output_path):
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(1, 3, figsize=(18, 6))
+
+    plot_boxes(bestseller_boxes['stars'], ax=axes[0])
+    axes[0].set_title('Star Rating Comparison', fontsize=12)
+    axes[0].set_xlabel('Best Seller', fontsize=10)
+    axes[0].set_ylabel('Star Rating', fontsize=10)
+    axes[0].set_xticklabels(['Non-BestSeller', 'BestSeller'])
+
+    plot_boxes(bestseller_boxes['price'], ax=axes[1])
+    axes[1].set_title('Price Comparison', fontsize=12)
+    axes[1].set_xlabel('Best Seller', fontsize=10)
+    axes[1].set_ylabel('Price (£)', fontsize=10)
+    axes[1].set_xticklabels(['Non-BestSeller', 'BestSeller'])
+
+    plot_boxes(bestseller_boxes['boughtInLastMonth'], ax=axes[2])
+    axes[2].set_title('Monthly Sales Comparison', fontsize=12)
+    axes[2].set_xlabel('Best Seller', fontsize=10)
+    axes[2].set_ylabel('Monthly Sales', fontsize=10)
+    axes[2].set_xticklabels(['Non-BestSeller', 'BestSeller'])
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_product_tier_sales(tier_data, output_path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    tier_sales, tier_counts = tier_data
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 6))
+
+    sns.barplot(x=tier_sales.index, y=tier_sales.values, ax=ax1)
+    ax1.set_title('Average Monthly Sales by Product Tier', fontsize=14)
+    ax1.set_xlabel('Product Tier', fontsize=12)
+    ax1.set_ylabel('Average Monthly Sales', fontsize=12)
+    for i, v in enumerate(tier_sales.values):
+        ax1.text(i, v, f'{v:.1f}', ha='center', va='bottom')
+
+    sns.barplot(x=tier_counts.index, y=tier_counts.values, ax=ax2)
+    ax2.set_title('Product Count by Tier', fontsize=14)
+    ax2.set_xlabel('Product Tier', fontsize=12)
+    ax2.set_ylabel('Product Count', fontsize=12)
+    for i, v in enumerate(tier_counts.values):
+        ax2.text(i, v, f'{v:,}', ha='center', va='bottom')
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+def render_category_sales_ranking(category_sales, output_path):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=(15, 8))
+    sns.barplot(x=category_sales.values, y=category_sales.index, palette='viridis')
+    for i, v in enumerate(category_sales.values):
+        plt.text(v, i, f' {v:,}', va='center')
+
+    plt.title('Top 10 Main Categories by Monthly Sales', fontsize=14)
+    plt.xlabel('Total Monthly Sales', fontsize=12)
+    plt.ylabel('Main Category', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+
+
+# ==================== Chart data and statistics (main process) ====================
+
+def describe_by_bestseller(cube, measure, boxes):
+    """
+    describe()-style statistics per BestSeller flag
+
+    Count, mean, std, min and max roll up from the cube; the quartiles come
+    from the boxplot summaries.
+    """
+    stats = rollup(cube, 'isBestSeller', measure)
+    for column, key in [('25%', 'q1'), ('50%', 'med'), ('75%', 'q3')]:
+        stats[column] = pd.Series({box['label']: box[key] for box in boxes}).reindex(stats.index)
+    return stats[['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']]
+
+
+def prepare_charts(df, cube):
+    """
+    Print the statistics of sections A-G and build the chart tasks
+    """
+    tasks = []
+
+    # ==================== A. Main category product count ====================
+    print('\nA. Product count by main category')
+    print('-' * 30)
+
+    main_category_counts = key_counts(cube, 'main_category').sort_values(ascending=False, kind='stable').head(15)
+    main_category_counts.index = main_category_counts.index.astype(str)
+    tasks.append({'name': 'A. main_category_distribution', 'render': render_main_category_distribution,
+                  'data': main_category_counts,
+                  'output': f'{OUTPUT_DIR}/main_category_distribution.png'})
+
+    # ==================== B. Product price distribution ====================
+    print('\nB. Product price distribution')
+    print('-' * 30)
+
+    print('Price statistics:')
+    print(df['price'].describe())
+    tasks.append({'name': 'B. price_distribution', 'render': render_price_distribution,
+                  'data': (histogram(df['price'], bins=50), box_stats(df['price'])),
+                  'output': f'{OUTPUT_DIR}/price_distribution.png'})
+
+    # ==================== C. Star rating distribution ====================
+    print('\nC. Star rating distribution')
+    print('-' * 30)
+
+    stars_counts = key_counts(cube, 'stars')
+    # float32 ratings as one-decimal float64 labels (seaborn mismatches float32 category levels)
+    stars_counts.index = stars_counts.index.astype('float64').round(1)
+    print('Star rating statistics:')
+    print(df['stars'].describe())
+    tasks.append({'name': 'C. stars_distribution', 'render': render_stars_distribution,
+                  'data': stars_counts,
+                  'output': f'{OUTPUT_DIR}/stars_distribution.png'})
+
+    # ==================== D. Review count distribution ====================
+    print('\nD. Review count distribution')
+    print('-' * 30)
+
+    print('Review count statistics:')
+    print(df['reviews'].describe())
+    print(f'Products with >2000 reviews: {len(df[df["reviews"] > 2000])}')
+    tasks.append({'name': 'D. reviews_distribution', 'render': render_reviews_distribution,
+                  'data': histogram(df.loc[df['reviews'] <= 2000, 'reviews'], bins=50),
+                  'output': f'{OUTPUT_DIR}/reviews_distribution.png'})
+
+    # ==================== E. BestSeller vs Non-BestSeller comparison ====================
+    print('\nE. BestSeller vs Non-BestSeller Comparison')
+    print('-' * 30)
+
+    bestseller_boxes = {col: box_stats(df[col], df['isBestSeller'])
+                        for col in ['stars', 'price', 'boughtInLastMonth']}
+    print('\nBestSeller vs Non-BestSeller statistics:')
+    print('\n1. Star Rating:')
+    print(describe_by_bestseller(cube, 'stars', bestseller_boxes['stars']))
+    print('\n2. Price:')
+    print(describe_by_bestseller(cube, 'price', bestseller_boxes['price']))
+    print('\n3. Monthly Sales:')
+    print(describe_by_bestseller(cube, 'boughtInLastMonth', bestseller_boxes['boughtInLastMonth']))
+    tasks.append({'name': 'E. bestseller_comparison', 'render': render_bestseller_comparison,
+                  'data': bestseller_boxes,
+                  'output': f'{OUTPUT_DIR}/bestseller_comparison.png'})
+
+    # ==================== F. Sales by product tier ====================
+    print('\nF. Sales by Product Tier')
+    print('-' * 30)
+
+    tier_order = TIER_ORDER
+    tier_stats = rollup(cube, 'product_tier', 'boughtInLastMonth')
+    tier_sales = tier_stats['mean'].reindex(tier_order)
+    tier_counts = key_counts(cube, 'product_tier').reindex(tier_order)
+    tier_sales.index = tier_sales.index.astype(str)
+    tier_counts.index = tier_counts.index.astype(str)
+
+    print('\nProduct tier sales statistics:')
+    # Medians are not additive, so they still come from the rows
+    tier_stats['median'] = df.groupby('product_tier', observed=True)['boughtInLastMonth'].median()
+    print(tier_stats[['mean', 'median', 'count']].reindex(tier_order))
+    tasks.append({'name': 'F. product_tier_sales', 'render': render_product_tier_sales,
+                  'data': (tier_sales, tier_counts),
+                  'output': f'{OUTPUT_DIR}/product_tier_sales.png'})
+
+    # ==================== G. Monthly sales by main category ====================
+    print('\nG. Monthly Sales Ranking by Main Category')
+    print('-' * 30)
+
+    category_sales = rollup(cube, 'main_category', 'boughtInLastMonth')['sum'].astype('int64')
+    category_sales = category_sales.sort_values(ascending=False).head(10)
+    category_sales.index = category_sales.index.astype(str)
+
+    print('\nTop 10 main category monthly sales stats:')
+    print(category_sales)
+    tasks.append({'name': 'G. category_sales_ranking', 'render': render_category_sales_ranking,
+                  'data': category_sales,
+                  'output': f'{OUTPUT_DIR}/category_sales_ranking.png'})
+
+    return tasks
+
+
+def add_arguments(parser):
+    """
+    Options of the visualization analysis (shared with analytics_cli.py)
+    """
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='chart rendering processes')
+    parser.add_argument('--no-cache', action='store_true', help='re-render charts even if unchanged')
+    return parser
+
+
+def run(df=None, cube=None, workers=None, use_cache=True):
+    """
+    Render the overview charts of the further cleaned data
+
+    df and cube are the further cleaned data and its aggregation cube if
+    already in memory; otherwise they are read from disk.
+    """
+    # Create output directory
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    print('=' * 50)
+    print('Starting Data Visualization Analysis')
+    print('=' * 50)
+
+    # ==================== 1. Load cleaned data ====================
+    print('\n1. Loading cleaned data')
+    print('-' * 30)
+
+    with stage('load') as load_stage:
+        try:
+            df = load_columns(FURTHER_CLEANED_PATH, COLUMNS) if df is None else df[COLUMNS]
+            load_stage.rows = len(df)
+            print(f'Data successfully loaded, shape: {df.shape}')
+        except Exception as e:
+            print(f'Error reading file: {e}')
+            exit(1)
+
+        try:
+            if cube is None:
+                cube = get_cube()
+        except Exception as e:
+            print(f'Error loading aggregation cube: {e}')
+            exit(1)
+
+    with stage('chart_data', rows=len(df)):
+        tasks = prepare_charts(df, cube)
+
+    # ==================== 2. Render charts ====================
+    print('\n2. Rendering charts')
+    print('-' * 30)
+
+    cache_path = CHART_CACHE_PATH if use_cache else None
+    with stage('render_charts'):
+        results, wall_seconds = render_charts(tasks, workers=workers, cache_path=cache_path)
+    print_timing_report(results, wall_seconds)
+    for result in results:
+        if result['error'] is None:
+            print(f'{result["name"]} chart generated: {result["output"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data visualization analysis')
+    args = add_arguments(parser).parse_args()
+    run(workers=args.workers, use_cache=not args.no_cache)
+
+
+if __name__ == '__main__':
+    main()